@@ -1,33 +1,63 @@
-import requests
 import os
+import sys
+
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import http_pool, metrics
+from common.prompt_cache import anthropic_cache_breakpoints
 
 # Configuração da API
 API_KEY = "<YOUR_API_KEY>"
 API_URL = "https://api.anthropic.com/v1/messages"
 
 # Configure sua chave API como uma variável de ambiente por segurança
-os.environ["ANTHROPIC_API_KEY"] = API_KEY
+# (uma chave já definida no ambiente tem prioridade)
+os.environ.setdefault("ANTHROPIC_API_KEY", API_KEY)
+
+# Prompt de sistema fixo: fica no início de toda requisição e é guardado no cache de prompt
+SYSTEM_PROMPT = "Você é um assistente prestativo. Responda sempre em português do Brasil de forma clara e natural."
 
 # Função para enviar uma mensagem para o Claude 3.5
-def enviar_mensagem_claude(mensagem):
+# `historico` são os turnos anteriores ([{"role", "content"}, ...]); com cache_prompt,
+# o system e a conversa até a mensagem nova são marcados para o cache de prompt.
+# Por padrão, só quando há histórico: numa chamada avulsa a gravação no cache
+# custa mais que a entrada normal e nunca seria lida
+def enviar_mensagem_claude(mensagem, model="claude-3.5-sonnet", max_tokens=1000,
+                           system=SYSTEM_PROMPT, historico=None, cache_prompt=None):
     headers = {
         "Content-Type": "application/json",
         "X-API-Key": os.environ["ANTHROPIC_API_KEY"],
         "anthropic-version": "2023-06-01"
     }
 
+    mensagens = list(historico or []) + [{"role": "user", "content": mensagem}]
+    if cache_prompt is None:
+        cache_prompt = bool(historico)
+    if cache_prompt:
+        system, mensagens = anthropic_cache_breakpoints(system, mensagens)
+
     data = {
-        "model": "claude-3.5-sonnet",
-        "messages": [{"role": "user", "content": mensagem}],
-        "max_tokens": 1000
+        "model": model,
+        "messages": mensagens,
+        "max_tokens": max_tokens
     }
+    if system:
+        data["system"] = system
 
-    response = requests.post(API_URL, json=data, headers=headers)
+    with metrics.track("anthropic", model) as call:
+        response = http_pool.post(API_URL, json=data, headers=headers)
+        if call is not None:
+            call.record_response(response, response.request.body)
+            if response.status_code != 200:
+                call.error = f"HTTP {response.status_code}"
 
-    if response.status_code == 200:
-        return response.json()["content"][0]["text"]
-    else:
-        return f"Erro: {response.status_code} - {response.text}"
+        if response.status_code == 200:
+            resposta_json = response.json()
+            if call is not None:
+                call.set_usage(resposta_json.get("usage"))
+            return resposta_json["content"][0]["text"]
+        else:
+            return f"Erro: {response.status_code} - {response.text}"
 
 # Exemplo de uso
 if __name__ == "__main__":
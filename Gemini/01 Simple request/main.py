@@ -4,10 +4,16 @@ import json
 from dotenv import load_dotenv
 import sys
 
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import http_pool
+
 # Carrega as variáveis de ambiente do arquivo .env
 env_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(env_path)
 
+BASE_URL = "https://generativelanguage.googleapis.com/v1"
+
 def chamar_gemini(prompt):
     """Envia uma requisição para a API do Google Gemini e retorna a resposta."""
     
@@ -15,7 +21,7 @@ def chamar_gemini(prompt):
     if not api_key:
         return "Erro: GEMINI_API_KEY não encontrada no arquivo .env"
 
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-pro:generateContent?key={api_key}"
+    url = f"{BASE_URL}/models/gemini-pro:generateContent?key={api_key}"
     
     headers = {
         "Content-Type": "application/json"
@@ -30,7 +36,7 @@ def chamar_gemini(prompt):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = http_pool.post(url, headers=headers, json=data)
         
         try:
             resposta_json = response.json()
@@ -6,6 +6,14 @@ from enum import Enum
 from typing import Optional, List
 import sys
 
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import http_pool, metrics
+from common.context_window import DEFAULT_OUTPUT_RESERVE, count_tokens
+from common.rate_limit import get_limiter
+from common.response_cache import get_shared_cache, make_key
+from common.single_flight import get_single_flight
+
 class GeminiModel(Enum):
     GEMINI_PRO = "gemini-pro"
     GEMINI_PRO_VISION = "gemini-pro-vision"
@@ -18,7 +26,9 @@ class GeminiConfig:
         top_k: Optional[int] = None,
         top_p: Optional[float] = None,
         max_output_tokens: Optional[int] = None,
-        stop_sequences: Optional[List[str]] = None
+        stop_sequences: Optional[List[str]] = None,
+        cache_responses: bool = False,
+        coalesce_requests: bool = False
     ):
         self.model = model
         self.temperature = min(max(temperature, 0.0), 1.0)  # Limita entre 0 e 1
@@ -26,10 +36,14 @@ class GeminiConfig:
         self.top_p = top_p
         self.max_output_tokens = max_output_tokens
         self.stop_sequences = stop_sequences or []
+        self.cache_responses = cache_responses
+        # Chamadas simultâneas com o mesmo payload compartilham uma única requisição
+        self.coalesce_requests = coalesce_requests
 
 class GeminiAPI:
     def __init__(self, api_key: str):
         self.api_key = api_key
+        self.base_url = "https://generativelanguage.googleapis.com/v1"
         self.config = GeminiConfig()
     
     def update_config(self, **kwargs):
@@ -71,7 +85,7 @@ class GeminiAPI:
         if not self.api_key:
             return "Erro: GEMINI_API_KEY não encontrada"
 
-        url = f"https://generativelanguage.googleapis.com/v1/models/{self.config.model.value}:generateContent?key={self.api_key}"
+        url = f"{self.base_url}/models/{self.config.model.value}:generateContent?key={self.api_key}"
         
         headers = {
             "Content-Type": "application/json"
@@ -79,14 +93,41 @@ class GeminiAPI:
 
         data = self.build_request_data(prompt)
 
+        # Cache opcional de respostas, chaveado por modelo + payload
+        cache_key = None
+        if self.config.cache_responses:
+            cache_key = make_key({"model": self.config.model.value, **data})
+            cached = get_shared_cache().get(cache_key)
+            if cached is not None:
+                return cached
+
+        def enviar() -> dict:
+            # Limite de taxa por modelo, com retentativas em 429/5xx (Retry-After)
+            limiter = get_limiter("gemini", self.config.model.value)
+            tokens = count_tokens(prompt) + (self.config.max_output_tokens or DEFAULT_OUTPUT_RESERVE)
+            with metrics.track("gemini", self.config.model.value) as call:
+                response = limiter.call(lambda: http_pool.post(url, headers=headers, json=data), tokens)
+                if call is not None:
+                    call.record_response(response, response.request.body)
+                response.raise_for_status()
+
+                resposta_json = response.json()
+                if call is not None:
+                    call.set_usage(resposta_json.get("usageMetadata"))
+            return resposta_json
+
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            resposta_json = response.json()
+            if self.config.coalesce_requests:
+                # A URL inclui a chave de API: só chamadas da mesma conta são agrupadas
+                resposta_json = get_single_flight().do(make_key({"url": url, **data}), enviar)
+            else:
+                resposta_json = enviar()
             
             if "candidates" in resposta_json:
-                return resposta_json["candidates"][0]["content"]["parts"][0]["text"]
+                texto = resposta_json["candidates"][0]["content"]["parts"][0]["text"]
+                if cache_key is not None:
+                    get_shared_cache().set(cache_key, texto)
+                return texto
             else:
                 return "Erro: Resposta inesperada do Gemini"
                 
@@ -96,6 +137,8 @@ class GeminiAPI:
                     return "Erro 401: Não autorizado. Verifique sua chave de API."
                 elif e.response.status_code == 404:
                     return "Erro 404: API não encontrada."
+                elif e.response.status_code == 429:
+                    return "Erro 429: Limite de requisições excedido. Tente novamente mais tarde."
             return f"Erro na requisição à API Gemini: {str(e)}"
         except json.JSONDecodeError:
             return "Erro: Resposta inválida do servidor"
@@ -125,6 +168,7 @@ def main():
             print(f"Top P: {api.config.top_p}")
             print(f"Max Output Tokens: {api.config.max_output_tokens}")
             print(f"Stop Sequences: {api.config.stop_sequences}")
+            print(f"Cache de respostas: {api.config.cache_responses}")
             
             # Menu de configuração
             print("\nO que você deseja configurar?")
@@ -134,9 +178,10 @@ def main():
             print("4. Top P")
             print("5. Max Output Tokens")
             print("6. Stop Sequences")
-            print("7. Voltar ao chat")
+            print("7. Cache de respostas")
+            print("8. Voltar ao chat")
             
-            opcao = input("\nEscolha uma opção (1-7): ")
+            opcao = input("\nEscolha uma opção (1-8): ")
             
             if opcao == "1":
                 print("\nModelos disponíveis:")
@@ -167,6 +212,11 @@ def main():
             elif opcao == "6":
                 sequences = input("Digite as sequências de parada separadas por vírgula (ou enter para limpar): ")
                 api.update_config(stop_sequences=sequences.split(",") if sequences.strip() else [])
+
+            elif opcao == "7":
+                cache = input("Usar cache de respostas (true/false): ").lower()
+                if cache in ['true', 'false']:
+                    api.update_config(cache_responses=cache == 'true')
             
             continue
 
@@ -1,30 +1,38 @@
 import os
-import requests
+import sys
+import asyncio
+import functools
+import httpx
 import json
 import base64
+import importlib.util
 from dotenv import load_dotenv
 from enum import Enum
-from typing import Optional, List, Union, BinaryIO
+from typing import Optional, List, Union, BinaryIO, AsyncIterator, Callable, Iterable, Iterator
 from pathlib import Path
 import mimetypes
-import markdown
-import pygments
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name, guess_lexer
-from bs4 import BeautifulSoup
-import tempfile
-from PIL import Image
-import io
-
-# Importação condicional do PyMuPDF
-try:
-    import fitz  # PyMuPDF
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
+
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import doc_pipeline, gemini_files, http_pool, metrics, streaming_body
+from common.context_window import DEFAULT_OUTPUT_RESERVE, context_limit, count_tokens
+from common.rate_limit import get_limiter
+from common.response_cache import get_shared_cache, make_key
+from common.single_flight import get_single_flight
+from common.sse import aiter_sse_data
+from common.media_cache import MediaCache, get_shared_media_cache, hash_file, hash_text
+
+# Os backends de mídia (PyMuPDF, PIL, markdown, pygments, bs4) só são importados
+# no primeiro uso: um chat só de texto não paga o tempo nem a memória deles.
+# Aqui só verificamos se o PyMuPDF está instalado, sem importá-lo.
+PDF_SUPPORT = importlib.util.find_spec("fitz") is not None
+if not PDF_SUPPORT:
     print("Aviso: Suporte a PDF não está disponível. Para habilitar, instale PyMuPDF.")
 
+# Tamanho máximo de cada trecho de um documento longo (tokens)
+DOCUMENT_CHUNK_TOKENS = 8000
+DOCUMENT_OVERLAP_TOKENS = 200
+
 class GeminiModel(Enum):
     GEMINI_PRO = "gemini-pro"
     GEMINI_PRO_VISION = "gemini-pro-vision"
@@ -36,6 +44,7 @@ class ContentType(Enum):
     HTML = "html"
     MARKDOWN = "markdown"
     CODE = "code"
+    MEDIA = "media"  # Áudio e vídeo, enviados sem conversão
 
 class GeminiConfig:
     def __init__(
@@ -45,7 +54,11 @@ class GeminiConfig:
         top_k: Optional[int] = None,
         top_p: Optional[float] = None,
         max_output_tokens: Optional[int] = None,
-        stop_sequences: Optional[List[str]] = None
+        stop_sequences: Optional[List[str]] = None,
+        cache_responses: bool = False,
+        cache_media: bool = False,
+        stream: bool = False,
+        coalesce_requests: bool = False
     ):
         self.model = model
         self.temperature = min(max(temperature, 0.0), 1.0)
@@ -53,46 +66,137 @@ class GeminiConfig:
         self.top_p = top_p
         self.max_output_tokens = max_output_tokens
         self.stop_sequences = stop_sequences or []
+        self.cache_responses = cache_responses
+        # Mídia já processada em cache no disco, endereçada pelo conteúdo
+        self.cache_media = cache_media
+        self.stream = stream
+        # Chamadas simultâneas com o mesmo payload compartilham uma única requisição (e um único streaming)
+        self.coalesce_requests = coalesce_requests
+
+class _handler_method:
+    """Método de MediaHandler que também pode ser chamado na classe.
+
+    MediaHandler.process_image(path) continua funcionando como antes do cache:
+    a chamada vai para MediaHandler.default(), uma instância sem cache.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            obj = owner.default()
+        return self.func.__get__(obj, owner)
+
 
 class MediaHandler:
+    # Parâmetros do processamento de imagem (fazem parte da chave do cache)
+    IMAGE_MAX_SIZE = 2048
+    IMAGE_QUALITY = 85
+    IMAGE_RESAMPLE = 1  # Image.Resampling.LANCZOS, sem importar o PIL
+
+    _default: Optional["MediaHandler"] = None
+
+    def __init__(self, cache: Optional[MediaCache] = None):
+        self.cache = cache
+
+    @classmethod
+    def default(cls) -> "MediaHandler":
+        """Instância sem cache usada pelas chamadas na classe."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
     @staticmethod
-    def process_image(image_path: Union[str, BinaryIO]) -> dict:
+    def preload() -> None:
+        """Importa todos os backends de mídia de uma vez (para processos de longa duração)."""
+        import markdown  # noqa: F401
+        from bs4 import BeautifulSoup  # noqa: F401
+        from pygments.formatters import HtmlFormatter  # noqa: F401
+        from pygments.lexers import guess_lexer  # noqa: F401
+        from common import image_pipeline  # noqa: F401
+        if PDF_SUPPORT:
+            import fitz  # noqa: F401
+            from common import pdf_pages  # noqa: F401
+
+    def _cached(self, content_hash: str, operation: str, params: dict, compute):
+        """Retorna o resultado em cache para o conteúdo ou o calcula e armazena."""
+        if self.cache is None:
+            return compute()
+        key = MediaCache.make_key(content_hash, operation, params)
+        return self.cache.get_or_compute(key, compute)
+
+    @_handler_method
+    def process_image(self, image_path: Union[str, BinaryIO]) -> dict:
         """Processa imagem para envio à API."""
+        if isinstance(image_path, str) and self.cache is not None:
+            params = {"max_size": self.IMAGE_MAX_SIZE, "quality": self.IMAGE_QUALITY, "resample": int(self.IMAGE_RESAMPLE)}
+            return self._cached(hash_file(image_path), "image", params, lambda: self._process_image(image_path))
+        return self._process_image(image_path)
+
+    @classmethod
+    def _process_image(cls, image_path: Union[str, BinaryIO]) -> dict:
         try:
             if isinstance(image_path, str):
-                with Image.open(image_path) as img:
-                    # Converter para RGB se necessário
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    # Redimensionar se a imagem for muito grande
-                    max_size = 2048
-                    if max(img.size) > max_size:
-                        ratio = max_size / max(img.size)
-                        new_size = tuple(int(dim * ratio) for dim in img.size)
-                        img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    
-                    # Converter para bytes
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG', quality=85)
-                    img_bytes = img_byte_arr.getvalue()
+                from common import image_pipeline
+
+                # Decodificação em modo draft, buffer reaproveitado e base64 direto do buffer
+                data = image_pipeline.encode_image_base64(
+                    image_path,
+                    max_size=cls.IMAGE_MAX_SIZE,
+                    quality=cls.IMAGE_QUALITY,
+                    resample=cls.IMAGE_RESAMPLE
+                )
             else:
-                img_bytes = image_path.read()
+                data = base64.b64encode(image_path.read()).decode('utf-8')
 
             return {
                 "mime_type": "image/jpeg",
-                "data": base64.b64encode(img_bytes).decode('utf-8')
+                "data": data
             }
         except Exception as e:
             raise ValueError(f"Erro ao processar imagem: {str(e)}")
 
-    @staticmethod
-    def process_pdf(pdf_path: str) -> str:
-        """Extrai texto de um arquivo PDF."""
+    def image_inline_data(self, image_path: str) -> Union[dict, streaming_body.InlineBytes]:
+        """Valor de inline_data para a imagem: o base64 é gerado em blocos durante o envio.
+
+        Com cache, vale o resultado de process_image (o base64 já está no disco).
+        """
+        if self.cache is not None:
+            return self.process_image(image_path)
+        from common import image_pipeline
+
+        try:
+            data = image_pipeline.encode_image_jpeg(
+                image_path,
+                max_size=self.IMAGE_MAX_SIZE,
+                quality=self.IMAGE_QUALITY,
+                resample=self.IMAGE_RESAMPLE
+            )
+        except Exception as e:
+            raise ValueError(f"Erro ao processar imagem: {str(e)}")
+        return streaming_body.InlineBytes(data, "image/jpeg")
+
+    @_handler_method
+    def process_pdf(self, pdf_path: str, parallel: bool = False, workers: Optional[int] = None) -> str:
+        """Extrai texto de um arquivo PDF (em paralelo entre processos, se solicitado)."""
         if not PDF_SUPPORT:
             raise ValueError("Suporte a PDF não está disponível. Instale PyMuPDF para habilitar.")
-        
-        text_content = []
+        if self.cache is not None:
+            return self._cached(hash_file(pdf_path), "pdf", {}, lambda: self._process_pdf(pdf_path, parallel, workers))
+        return self._process_pdf(pdf_path, parallel, workers)
+
+    @staticmethod
+    def _process_pdf(pdf_path: str, parallel: bool = False, workers: Optional[int] = None) -> str:
+        import fitz  # PyMuPDF
+        from common import pdf_pages
+
         try:
+            if parallel:
+                return pdf_pages.extract_text_parallel(pdf_path, workers)
+
+            text_content = []
             with fitz.open(pdf_path) as doc:
                 for page in doc:
                     text_content.append(page.get_text())
@@ -101,16 +205,43 @@ class MediaHandler:
             raise ValueError(f"Erro ao processar PDF: {str(e)}")
 
     @staticmethod
-    def process_markdown(markdown_text: str) -> str:
+    def iter_pdf(pdf_path: str, pages_per_chunk: int = 10) -> Iterator[str]:
+        """Gera o texto do PDF em blocos de páginas, sem carregar o documento inteiro."""
+        if not PDF_SUPPORT:
+            raise ValueError("Suporte a PDF não está disponível. Instale PyMuPDF para habilitar.")
+        from common import pdf_pages
+
+        try:
+            yield from pdf_pages.iter_page_chunks(pdf_path, pages_per_chunk)
+        except Exception as e:
+            raise ValueError(f"Erro ao processar PDF: {str(e)}")
+
+    @_handler_method
+    def process_markdown(self, markdown_text: str) -> str:
         """Converte markdown para HTML."""
+        return self._cached(hash_text(markdown_text), "markdown", {}, lambda: self._process_markdown(markdown_text))
+
+    @staticmethod
+    def _process_markdown(markdown_text: str) -> str:
+        import markdown
+
         try:
             return markdown.markdown(markdown_text)
         except Exception as e:
             raise ValueError(f"Erro ao processar Markdown: {str(e)}")
 
-    @staticmethod
-    def process_code(code: str, language: Optional[str] = None) -> str:
+    @_handler_method
+    def process_code(self, code: str, language: Optional[str] = None) -> str:
         """Aplica syntax highlighting ao código."""
+        params = {"language": language}
+        return self._cached(hash_text(code), "code", params, lambda: self._process_code(code, language))
+
+    @staticmethod
+    def _process_code(code: str, language: Optional[str] = None) -> str:
+        from pygments import highlight
+        from pygments.formatters import HtmlFormatter
+        from pygments.lexers import get_lexer_by_name, guess_lexer
+
         try:
             if language:
                 lexer = get_lexer_by_name(language)
@@ -121,9 +252,15 @@ class MediaHandler:
         except Exception as e:
             raise ValueError(f"Erro ao processar código: {str(e)}")
 
-    @staticmethod
-    def process_html(html_content: str) -> str:
+    @_handler_method
+    def process_html(self, html_content: str) -> str:
         """Processa e limpa HTML."""
+        return self._cached(hash_text(html_content), "html", {}, lambda: self._process_html(html_content))
+
+    @staticmethod
+    def _process_html(html_content: str) -> str:
+        from bs4 import BeautifulSoup
+
         try:
             soup = BeautifulSoup(html_content, 'html.parser')
             return soup.prettify()
@@ -131,16 +268,28 @@ class MediaHandler:
             raise ValueError(f"Erro ao processar HTML: {str(e)}")
 
 class GeminiAPI:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, media_cache: Optional[MediaCache] = None):
         self.api_key = api_key
+        self.base_url = "https://generativelanguage.googleapis.com/v1"
         self.config = GeminiConfig()
-        self.media_handler = MediaHandler()
+        # Última resposta completa da API (inclui usageMetadata)
+        self.last_response: Optional[dict] = None
+        # Cache de mídia em disco só quando ligado (config.cache_media ou um MediaCache explícito)
+        self._media_cache = media_cache
+        self.config.cache_media = media_cache is not None
+        self.media_handler = MediaHandler(cache=media_cache)
+        # Raiz da File API (upload de mídia grande demais para ir inline)
+        self.files_base_url = gemini_files.DEFAULT_BASE_URL
 
     def update_config(self, **kwargs):
         """Atualiza as configurações do modelo."""
         for key, value in kwargs.items():
             if hasattr(self.config, key):
                 setattr(self.config, key, value)
+        if self.config.cache_media:
+            self.media_handler.cache = self._media_cache or get_shared_media_cache()
+        else:
+            self.media_handler.cache = None
 
     def build_request_data(self, content: Union[str, dict, list], content_type: ContentType = ContentType.TEXT) -> dict:
         """Constrói o payload da requisição com base no tipo de conteúdo."""
@@ -175,36 +324,60 @@ class GeminiAPI:
                 })
             else:
                 raise ValueError("Conteúdo de imagem inválido")
+        elif content_type == ContentType.MEDIA:
+            self.config.model = GeminiModel.GEMINI_PRO_VISION
+            if isinstance(content, dict) and "part" in content:
+                data["contents"][0]["parts"].append({
+                    "text": content.get("prompt", "Descreva este arquivo"),
+                })
+                # inline_data com InlineMedia (codificado no envio) ou file_data da File API
+                data["contents"][0]["parts"].append(content["part"])
+            else:
+                raise ValueError("Conteúdo de mídia inválido")
         else:
             data["contents"][0]["parts"].append({"text": str(content)})
 
         return data
 
-    async def process_file(self, file_path: str, content_type: Optional[ContentType] = None) -> Union[str, dict]:
-        """Processa diferentes tipos de arquivo."""
+    def _estimate_tokens(self, data: dict) -> int:
+        """Estimativa de tokens (texto enviado + saída máxima) para o limite de tokens/minuto."""
+        texto = sum(count_tokens(part.get("text", "")) for item in data["contents"] for part in item["parts"])
+        return texto + (self.config.max_output_tokens or DEFAULT_OUTPUT_RESERVE)
+
+    @staticmethod
+    def detect_content_type(file_path: str) -> Optional[ContentType]:
+        """Tipo de conteúdo pela extensão do arquivo."""
+        mime_type, _ = mimetypes.guess_type(file_path)
+        if not mime_type:
+            return None
+        if mime_type.startswith('image/'):
+            return ContentType.IMAGE
+        elif mime_type.startswith(('audio/', 'video/')):
+            return ContentType.MEDIA
+        elif mime_type == 'application/pdf':
+            return ContentType.PDF
+        elif mime_type in ['text/html', 'application/html']:
+            return ContentType.HTML
+        elif mime_type == 'text/markdown':
+            return ContentType.MARKDOWN
+        return ContentType.TEXT
+
+    def _process_file_sync(self, file_path: str, content_type: Optional[ContentType] = None) -> Union[str, dict]:
+        """Processa diferentes tipos de arquivo (operação bloqueante)."""
         if not content_type:
-            mime_type, _ = mimetypes.guess_type(file_path)
-            if mime_type:
-                if mime_type.startswith('image/'):
-                    content_type = ContentType.IMAGE
-                elif mime_type == 'application/pdf':
-                    content_type = ContentType.PDF
-                elif mime_type in ['text/html', 'application/html']:
-                    content_type = ContentType.HTML
-                elif mime_type == 'text/markdown':
-                    content_type = ContentType.MARKDOWN
-                else:
-                    content_type = ContentType.TEXT
+            content_type = self.detect_content_type(file_path)
 
         try:
+            if content_type == ContentType.MEDIA:
+                raise ValueError("Áudio e vídeo são enviados por process_file ou media_part")
             if content_type == ContentType.IMAGE:
-                image_data = self.media_handler.process_image(file_path)
+                image_data = self.media_handler.image_inline_data(file_path)
                 return {
                     "type": "image",
                     "image_data": image_data
                 }
             elif content_type == ContentType.PDF:
-                return self.media_handler.process_pdf(file_path)
+                return self.media_handler.process_pdf(file_path, parallel=True)
             elif content_type == ContentType.MARKDOWN:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     return self.media_handler.process_markdown(f.read())
@@ -221,12 +394,108 @@ class GeminiAPI:
         except Exception as e:
             raise ValueError(f"Erro ao processar arquivo: {str(e)}")
 
+    async def media_part(self, file_path: str, mime_type: Optional[str] = None) -> dict:
+        """Parte da requisição para um arquivo de mídia, sem carregá-lo na memória.
+
+        Até o limite da requisição o arquivo vai em inline_data, codificado em
+        base64 durante o envio; acima dele, é enviado antes pela File API.
+        """
+        media = streaming_body.InlineMedia(file_path, mime_type)
+        if media.encoded_size <= gemini_files.INLINE_LIMIT:
+            return {"inline_data": media}
+        arquivo = await gemini_files.upload_file(
+            file_path, self.api_key, media.mime_type, base_url=self.files_base_url
+        )
+        return gemini_files.file_part(arquivo)
+
+    async def process_file(self, file_path: str, content_type: Optional[ContentType] = None) -> Union[str, dict]:
+        """Processa diferentes tipos de arquivo sem bloquear o event loop."""
+        if (content_type or self.detect_content_type(file_path)) == ContentType.MEDIA:
+            return {"type": "media", "part": await self.media_part(file_path)}
+        # Leitura de disco, PIL e PyMuPDF rodam no executor padrão
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self._process_file_sync, file_path, content_type)
+        )
+
+    def iter_file_text(self, file_path: str, content_type: Optional[ContentType] = None) -> Iterator[str]:
+        """Gera o texto do arquivo em pedaços, sem carregar PDFs e textos inteiros na memória."""
+        if content_type is None:
+            mime_type, _ = mimetypes.guess_type(file_path)
+            if mime_type == 'application/pdf':
+                content_type = ContentType.PDF
+            elif mime_type and mime_type.startswith('image/'):
+                content_type = ContentType.IMAGE
+            elif mime_type and mime_type.startswith(('audio/', 'video/')):
+                content_type = ContentType.MEDIA
+        if content_type in (ContentType.IMAGE, ContentType.MEDIA):
+            raise ValueError("Imagens, áudio e vídeo não podem ser divididos em trechos de texto")
+        if content_type == ContentType.PDF:
+            yield from self.media_handler.iter_pdf(file_path)
+        elif content_type in (ContentType.MARKDOWN, ContentType.HTML, ContentType.CODE):
+            # O processamento destes tipos precisa do arquivo inteiro
+            yield self._process_file_sync(file_path, content_type)
+        else:
+            yield from doc_pipeline.iter_text_file(file_path)
+
+    def document_budget(self, instrucao: str = "") -> int:
+        """Tokens disponíveis para o texto do documento em uma requisição."""
+        reserve = self.config.max_output_tokens or DEFAULT_OUTPUT_RESERVE
+        return context_limit(self.config.model.value) - reserve - count_tokens(instrucao) - 64
+
+    async def processar_texto(
+        self,
+        partes: Iterable[str],
+        instrucao: str,
+        max_in_flight: int = 4,
+        chunk_tokens: Optional[int] = None,
+        overlap: int = DOCUMENT_OVERLAP_TOKENS,
+        on_progress: Optional[Callable[[doc_pipeline.Progress], None]] = None
+    ) -> str:
+        """Aplica a instrução a um texto de qualquer tamanho (map-reduce sobre trechos)."""
+        chunk_tokens = min(chunk_tokens or DOCUMENT_CHUNK_TOKENS, self.document_budget(instrucao))
+
+        async def resumir_trecho(indice: int, trecho: str) -> str:
+            resposta = await self.chamar_gemini(f"{instrucao}\n\nTrecho {indice + 1} do documento:\n\n{trecho}")
+            if resposta.startswith("Erro"):
+                raise ValueError(resposta)
+            return resposta
+
+        async def combinar(respostas: List[str]) -> str:
+            partes_numeradas = "\n\n".join(f"[Parte {n}]\n{resposta}" for n, resposta in enumerate(respostas, 1))
+            resposta = await self.chamar_gemini(
+                f"{instrucao}\n\nAs respostas abaixo foram obtidas de trechos consecutivos de um mesmo "
+                f"documento. Combine-as em uma única resposta, sem repetições:\n\n{partes_numeradas}"
+            )
+            if resposta.startswith("Erro"):
+                raise ValueError(resposta)
+            return resposta
+
+        return await doc_pipeline.map_reduce(
+            doc_pipeline.iter_chunks(partes, chunk_tokens, overlap),
+            resumir_trecho,
+            combinar,
+            max_in_flight=max_in_flight,
+            reduce_tokens=chunk_tokens,
+            on_progress=on_progress
+        )
+
+    async def processar_documento(
+        self,
+        file_path: str,
+        instrucao: str,
+        content_type: Optional[ContentType] = None,
+        **kwargs
+    ) -> str:
+        """Como processar_texto, lendo o arquivo em pedaços (PDF página a página)."""
+        return await self.processar_texto(self.iter_file_text(file_path, content_type), instrucao, **kwargs)
+
     async def chamar_gemini(self, content: Union[str, dict, list], content_type: ContentType = ContentType.TEXT) -> str:
         """Envia uma requisição para a API do Google Gemini e retorna a resposta."""
         if not self.api_key:
             return "Erro: GEMINI_API_KEY não encontrada"
 
-        url = f"https://generativelanguage.googleapis.com/v1/models/{self.config.model.value}:generateContent?key={self.api_key}"
+        url = f"{self.base_url}/models/{self.config.model.value}:generateContent?key={self.api_key}"
         
         headers = {
             "Content-Type": "application/json"
@@ -234,26 +503,168 @@ class GeminiAPI:
 
         try:
             data = self.build_request_data(content, content_type)
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            resposta_json = response.json()
-            
+
+            # Cache opcional de respostas, chaveado por modelo + payload
+            cache_key = None
+            if self.config.cache_responses:
+                cache_key = make_key({"model": self.config.model.value, **data})
+                # A camada SQLite é consultada no executor, fora do loop de eventos
+                cached = await get_shared_cache().aget(cache_key)
+                if cached is not None:
+                    return cached
+
+            async def enviar() -> dict:
+                # Limite de taxa por modelo, com retentativas em 429/5xx (Retry-After)
+                limiter = get_limiter("gemini", self.config.model.value)
+                tokens = self._estimate_tokens(data) if limiter.tokens is not None else 0
+                client = http_pool.get_async_client()
+                # Mídia inline sai do disco em streaming, sem montar o JSON na memória
+                payload = streaming_body.encode_json(data, asynchronous=True)
+                request_headers = streaming_body.content_length_headers(headers, payload)
+                with metrics.track("gemini", self.config.model.value) as call:
+                    extensions = call.httpx_extensions() if call is not None else None
+                    response = await limiter.acall(
+                        lambda: client.post(url, headers=request_headers, content=payload, extensions=extensions), tokens
+                    )
+                    if call is not None:
+                        call.record_response(response, payload)
+                    response.raise_for_status()
+
+                    resposta_json = response.json()
+                    if call is not None:
+                        call.set_usage(resposta_json.get("usageMetadata"))
+                return resposta_json
+
+            if self.config.coalesce_requests:
+                # A URL inclui a chave de API: só chamadas da mesma conta são agrupadas
+                resposta_json = await get_single_flight().ado(make_key({"url": url, **data}), enviar)
+            else:
+                resposta_json = await enviar()
+
+            # Resposta completa (metadados de uso, motivo de término, avaliações de segurança)
+            self.last_response = resposta_json
+
             if "candidates" in resposta_json:
-                return resposta_json["candidates"][0]["content"]["parts"][0]["text"]
+                texto = resposta_json["candidates"][0]["content"]["parts"][0]["text"]
+                if cache_key is not None:
+                    await get_shared_cache().aset(cache_key, texto)
+                return texto
             else:
                 return "Erro: Resposta inesperada do Gemini"
                 
-        except requests.exceptions.RequestException as e:
-            if hasattr(e, 'response'):
-                if e.response.status_code == 401:
-                    return "Erro 401: Não autorizado. Verifique sua chave de API."
-                elif e.response.status_code == 404:
-                    return "Erro 404: API não encontrada."
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                return "Erro 401: Não autorizado. Verifique sua chave de API."
+            elif e.response.status_code == 404:
+                return "Erro 404: API não encontrada."
+            elif e.response.status_code == 429:
+                return "Erro 429: Limite de requisições excedido. Tente novamente mais tarde."
+            return f"Erro na requisição à API Gemini: {str(e)}"
+        except httpx.HTTPError as e:
             return f"Erro na requisição à API Gemini: {str(e)}"
         except json.JSONDecodeError:
             return "Erro: Resposta inválida do servidor"
 
+    async def stream_gemini(self, content: Union[str, dict, list], content_type: ContentType = ContentType.TEXT) -> AsyncIterator[str]:
+        """Envia a requisição via streamGenerateContent e gera os trechos de texto conforme chegam."""
+        if not self.api_key:
+            yield "Erro: GEMINI_API_KEY não encontrada"
+            return
+
+        url = f"{self.base_url}/models/{self.config.model.value}:streamGenerateContent?alt=sse&key={self.api_key}"
+
+        headers = {
+            "Content-Type": "application/json"
+        }
+
+        data = self.build_request_data(content, content_type)
+
+        cache_key = None
+        if self.config.cache_responses:
+            cache_key = make_key({"model": self.config.model.value, **data})
+            cached = await get_shared_cache().aget(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        async def eventos() -> AsyncIterator[dict]:
+            """Chunks JSON do streaming do provedor (com limite de taxa e métricas)."""
+            limiter = get_limiter("gemini", self.config.model.value)
+            tokens = self._estimate_tokens(data) if limiter.tokens is not None else 0
+            payload = streaming_body.encode_json(data, asynchronous=True)
+            request_headers = streaming_body.content_length_headers(headers, payload)
+            call = metrics.start_call("gemini", self.config.model.value)
+            extensions = call.httpx_extensions(streaming=True) if call is not None else None
+            try:
+                client = http_pool.get_async_client()
+                async with limiter.aslot(tokens), client.stream(
+                    "POST", url, headers=request_headers, content=payload, extensions=extensions
+                ) as response:
+                    limiter.record_response(response.status_code, response.headers)
+                    if call is not None:
+                        call.status = response.status_code
+                        call.bytes_out += len(payload)
+                    response.raise_for_status()
+
+                    async for event in aiter_sse_data(response.aiter_lines()):
+                        chunk = json.loads(event)
+                        if call is not None:
+                            call.bytes_in += len(event)
+                            # O uso de tokens vem acumulado; vale o do último chunk
+                            call.set_usage(chunk.get("usageMetadata"))
+                            if chunk.get("candidates"):
+                                call.mark_first_token()
+                        yield chunk
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                metrics.finish_call(call, type(e).__name__)
+                raise
+            metrics.finish_call(call)
+
+        # Com coalescência, um único streaming é repassado a todos que pediram o mesmo payload
+        if self.config.coalesce_requests:
+            chunks = get_single_flight().astream(make_key({"url": url, **data}), eventos)
+        else:
+            chunks = eventos()
+
+        texto = []
+        try:
+            async for chunk in chunks:
+                for candidate in chunk.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            texto.append(part["text"])
+                            yield part["text"]
+
+            if cache_key is not None and texto:
+                await get_shared_cache().aset(cache_key, "".join(texto))
+
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                yield "Erro 401: Não autorizado. Verifique sua chave de API."
+            elif e.response.status_code == 404:
+                yield "Erro 404: API não encontrada."
+            else:
+                yield f"Erro na requisição à API Gemini: {str(e)}"
+        except httpx.HTTPError as e:
+            yield f"Erro na requisição à API Gemini: {str(e)}"
+        except json.JSONDecodeError:
+            yield "Erro: Resposta inválida do servidor"
+
+    async def responder(self, content: Union[str, dict, list], content_type: ContentType = ContentType.TEXT) -> str:
+        """Exibe a resposta do Gemini, em streaming se estiver habilitado, e a retorna."""
+        if not self.config.stream:
+            response = await self.chamar_gemini(content, content_type)
+            print(f"\nGemini: {response}")
+            return response
+
+        print("\nGemini: ", end="", flush=True)
+        partes = []
+        async for delta in self.stream_gemini(content, content_type):
+            print(delta, end="", flush=True)
+            partes.append(delta)
+        print()
+        return "".join(partes)
+
 async def main():
     # Carrega as variáveis de ambiente
     env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -270,92 +681,123 @@ Comandos disponíveis:
 - 'sair': Encerrar o chat
     """)
     
-    while True:
-        comando = input("\nVocê (texto/comando): ").lower()
-        
-        if comando == 'sair':
-            print("Encerrando chat...")
-            break
-            
-        elif comando == 'config':
-            print("\nConfigurações atuais:")
-            print(f"Modelo: {api.config.model.value}")
-            print(f"Temperatura: {api.config.temperature}")
-            print(f"Top K: {api.config.top_k}")
-            print(f"Top P: {api.config.top_p}")
-            print(f"Max Output Tokens: {api.config.max_output_tokens}")
-            print(f"Stop Sequences: {api.config.stop_sequences}")
-            
-            print("\nO que você deseja configurar?")
-            print("1. Modelo (gemini-pro, gemini-pro-vision)")
-            print("2. Temperatura (0.0 a 1.0)")
-            print("3. Top K")
-            print("4. Top P")
-            print("5. Max Output Tokens")
-            print("6. Stop Sequences")
-            print("7. Voltar ao chat")
-            
-            opcao = input("\nEscolha uma opção (1-7): ")
-            
-            if opcao == "1":
-                print("\nModelos disponíveis:")
-                for model in GeminiModel:
-                    print(f"- {model.value}")
-                modelo = input("Digite o nome do modelo: ")
-                try:
-                    api.update_config(model=GeminiModel(modelo))
-                except ValueError:
-                    print("Modelo inválido!")
-            elif opcao == "2":
-                temp = float(input("Digite a temperatura (0.0 a 1.0): "))
-                api.update_config(temperature=temp)
-            elif opcao == "3":
-                top_k = int(input("Digite o valor de Top K (ou 0 para desativar): "))
-                api.update_config(top_k=top_k if top_k > 0 else None)
-            elif opcao == "4":
-                top_p = float(input("Digite o valor de Top P (ou 0 para desativar): "))
-                api.update_config(top_p=top_p if top_p > 0 else None)
-            elif opcao == "5":
-                max_tokens = int(input("Digite o número máximo de tokens (ou 0 para desativar): "))
-                api.update_config(max_output_tokens=max_tokens if max_tokens > 0 else None)
-            elif opcao == "6":
-                sequences = input("Digite as sequências de parada separadas por vírgula (ou enter para limpar): ")
-                api.update_config(stop_sequences=sequences.split(",") if sequences.strip() else [])
-            
-            continue
+    try:
+        while True:
+            comando = input("\nVocê (texto/comando): ").lower()
             
-        elif comando == 'arquivo':
-            file_path = input("Digite o caminho do arquivo: ")
-            if not os.path.exists(file_path):
-                print("Arquivo não encontrado!")
+            if comando == 'sair':
+                print("Encerrando chat...")
+                break
+                
+            elif comando == 'config':
+                print("\nConfigurações atuais:")
+                print(f"Modelo: {api.config.model.value}")
+                print(f"Temperatura: {api.config.temperature}")
+                print(f"Top K: {api.config.top_k}")
+                print(f"Top P: {api.config.top_p}")
+                print(f"Max Output Tokens: {api.config.max_output_tokens}")
+                print(f"Stop Sequences: {api.config.stop_sequences}")
+                print(f"Cache de respostas: {api.config.cache_responses}")
+                print(f"Cache de mídia: {api.config.cache_media}")
+                print(f"Streaming: {api.config.stream}")
+                
+                print("\nO que você deseja configurar?")
+                print("1. Modelo (gemini-pro, gemini-pro-vision)")
+                print("2. Temperatura (0.0 a 1.0)")
+                print("3. Top K")
+                print("4. Top P")
+                print("5. Max Output Tokens")
+                print("6. Stop Sequences")
+                print("7. Cache de respostas")
+                print("8. Cache de mídia")
+                print("9. Streaming")
+                print("10. Voltar ao chat")
+                
+                opcao = input("\nEscolha uma opção (1-10): ")
+                
+                if opcao == "1":
+                    print("\nModelos disponíveis:")
+                    for model in GeminiModel:
+                        print(f"- {model.value}")
+                    modelo = input("Digite o nome do modelo: ")
+                    try:
+                        api.update_config(model=GeminiModel(modelo))
+                    except ValueError:
+                        print("Modelo inválido!")
+                elif opcao == "2":
+                    temp = float(input("Digite a temperatura (0.0 a 1.0): "))
+                    api.update_config(temperature=temp)
+                elif opcao == "3":
+                    top_k = int(input("Digite o valor de Top K (ou 0 para desativar): "))
+                    api.update_config(top_k=top_k if top_k > 0 else None)
+                elif opcao == "4":
+                    top_p = float(input("Digite o valor de Top P (ou 0 para desativar): "))
+                    api.update_config(top_p=top_p if top_p > 0 else None)
+                elif opcao == "5":
+                    max_tokens = int(input("Digite o número máximo de tokens (ou 0 para desativar): "))
+                    api.update_config(max_output_tokens=max_tokens if max_tokens > 0 else None)
+                elif opcao == "6":
+                    sequences = input("Digite as sequências de parada separadas por vírgula (ou enter para limpar): ")
+                    api.update_config(stop_sequences=sequences.split(",") if sequences.strip() else [])
+                elif opcao == "7":
+                    cache = input("Usar cache de respostas (true/false): ").lower()
+                    if cache in ['true', 'false']:
+                        api.update_config(cache_responses=cache == 'true')
+                elif opcao == "8":
+                    cache = input("Usar cache de mídia em disco (true/false): ").lower()
+                    if cache in ['true', 'false']:
+                        api.update_config(cache_media=cache == 'true')
+                elif opcao == "9":
+                    stream = input("Usar streaming (true/false): ").lower()
+                    if stream in ['true', 'false']:
+                        api.update_config(stream=stream == 'true')
+                
                 continue
                 
-            print("\nTipos de conteúdo disponíveis:")
-            for content_type in ContentType:
-                print(f"- {content_type.value}")
-            
-            content_type_str = input("Digite o tipo de conteúdo (ou enter para autodetectar): ").lower()
-            content_type = ContentType(content_type_str) if content_type_str else None
-            
-            try:
-                processed_content = await api.process_file(file_path, content_type)
+            elif comando == 'arquivo':
+                file_path = input("Digite o caminho do arquivo: ")
+                if not os.path.exists(file_path):
+                    print("Arquivo não encontrado!")
+                    continue
+                    
+                print("\nTipos de conteúdo disponíveis:")
+                for content_type in ContentType:
+                    print(f"- {content_type.value}")
                 
-                if isinstance(processed_content, dict) and processed_content.get("type") == "image":
-                    prompt = input("Digite uma descrição ou pergunta sobre a imagem: ")
-                    processed_content["prompt"] = prompt
-                    response = await api.chamar_gemini(processed_content, ContentType.IMAGE)
-                else:
-                    response = await api.chamar_gemini(processed_content, content_type or ContentType.TEXT)
+                content_type_str = input("Digite o tipo de conteúdo (ou enter para autodetectar): ").lower()
+                content_type = ContentType(content_type_str) if content_type_str else None
                 
-                print(f"\nGemini: {response}")
+                try:
+                    processed_content = await api.process_file(file_path, content_type)
+                    
+                    if isinstance(processed_content, dict) and processed_content.get("type") == "image":
+                        prompt = input("Digite uma descrição ou pergunta sobre a imagem: ")
+                        processed_content["prompt"] = prompt
+                        await api.responder(processed_content, ContentType.IMAGE)
+                    elif isinstance(processed_content, dict) and processed_content.get("type") == "media":
+                        prompt = input("Digite uma descrição ou pergunta sobre o arquivo: ")
+                        processed_content["prompt"] = prompt
+                        await api.responder(processed_content, ContentType.MEDIA)
+                    elif count_tokens(processed_content) > api.document_budget():
+                        # Maior que a janela de contexto: processa em trechos (map-reduce)
+                        instrucao = input("Documento longo. O que deseja fazer com ele? ")
+                        resposta = await api.processar_texto(
+                            [processed_content],
+                            instrucao,
+                            on_progress=lambda progresso: print(f"\r{progresso}", end="", flush=True)
+                        )
+                        print(f"\n\nGemini: {resposta}")
+                    else:
+                        await api.responder(processed_content, content_type or ContentType.TEXT)
+                    
+                except Exception as e:
+                    print(f"Erro ao processar arquivo: {str(e)}")
                 
-            except Exception as e:
-                print(f"Erro ao processar arquivo: {str(e)}")
-            
-        else:
-            response = await api.chamar_gemini(comando)
-            print(f"\nGemini: {response}")
+            else:
+                await api.responder(comando)
+    finally:
+        # O cliente httpx pertence ao loop de asyncio.run: fecha antes de o loop terminar
+        await http_pool.aclose_async_client()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
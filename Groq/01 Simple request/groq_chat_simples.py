@@ -1,28 +1,51 @@
 import os
+import sys
 from dotenv import load_dotenv
 from groq import Groq
 
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import metrics
+
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
 
-# Acessar a chave da API através da variável de ambiente
-client = Groq(
-    api_key=os.getenv("GROQ_API_KEY"),
-)
-
-# Pedir input do usuário
-user_input = input("Insira sua pergunta ou texto para completar: ")
-
-# Realizar uma requisição de chat completion com o input do usuário
-chat_completion = client.chat.completions.create(
-    messages=[
-        {
-            "role": "user",
-            "content": user_input,
-        }
-    ],
-    model="llama3-8b-8192",
-)
-
-# Exibir a resposta
-print(chat_completion.choices[0].message.content)
+_client = None
+
+
+def get_client() -> Groq:
+    """Cria o cliente Groq na primeira chamada e o reaproveita nas seguintes."""
+    global _client
+    if _client is None:
+        # Acessar a chave da API através da variável de ambiente
+        _client = Groq(
+            api_key=os.getenv("GROQ_API_KEY"),
+        )
+    return _client
+
+
+def enviar_mensagem_groq(mensagem, model="llama3-8b-8192", **config):
+    """Realiza uma requisição de chat completion e retorna o texto da resposta."""
+    with metrics.track("groq", model) as call:
+        chat_completion = get_client().chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": mensagem,
+                }
+            ],
+            model=model,
+            **config
+        )
+        if call is not None:
+            call.mark_first_token()
+            call.set_usage(chat_completion.usage)
+    return chat_completion.choices[0].message.content
+
+
+if __name__ == "__main__":
+    # Pedir input do usuário
+    user_input = input("Insira sua pergunta ou texto para completar: ")
+
+    # Exibir a resposta
+    print(enviar_mensagem_groq(user_input))
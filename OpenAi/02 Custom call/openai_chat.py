@@ -2,8 +2,17 @@ import os
 from dotenv import load_dotenv
 from openai import OpenAI
 from typing import List, Dict, Optional, Union
-from datetime import datetime
 import json
+import sys
+
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import metrics
+from common.context_window import ContextWindow
+from common.history import History
+from common.request_builder import IncrementalRequestBuilder
+from common.response_cache import get_shared_cache, make_key
+from common.session_store import SessionStore
 
 class OpenAIChat:
     def __init__(self):
@@ -29,7 +38,15 @@ class OpenAIChat:
             raise
             
         # Histórico de conversas
-        self.conversation_history: List[Dict[str, str]] = []
+        self.conversation_history = History()
+        # Janela de contexto enviada à API (limitada pelo orçamento de tokens do modelo)
+        self.context_window = ContextWindow()
+        # Cache da lista de mensagens enviada, atualizado só com as mensagens novas
+        self.request_builder = IncrementalRequestBuilder()
+        # Uso de tokens da última resposta (prompt_tokens, completion_tokens, total_tokens)
+        self.last_usage: Optional[Dict[str, int]] = None
+        # Sessão persistente (log append-only em disco), ativada por 'save' ou 'load'
+        self.session = None
         
         # Modelos disponíveis
         self.available_models = [
@@ -51,6 +68,9 @@ class OpenAIChat:
             'presence_penalty': 0,
             'frequency_penalty': 0,
             'stream': True,
+            'summarize_history': False,
+            'cache_responses': False,
+            'semantic_cache': False,
             'language': 'pt-br'
         }
 
@@ -60,14 +80,38 @@ class OpenAIChat:
             'en': "You are a helpful assistant. Always respond in English in a clear and natural way."
         }
 
+    def summarize_history(self, previous_summary: Optional[str], dropped: List[Dict[str, str]]) -> str:
+        """Resume os turnos que saíram da janela de contexto."""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+        if previous_summary:
+            transcript = f"Resumo anterior: {previous_summary}\n{transcript}"
+
+        response = self.client.chat.completions.create(
+            model=self.current_config['model'],
+            messages=[
+                {"role": "system", "content": "Resuma a conversa a seguir em poucas frases, preservando fatos, nomes e decisões."},
+                {"role": "user", "content": transcript}
+            ],
+            temperature=0
+        )
+        return response.choices[0].message.content
+
     def create_chat_params(self, messages: List[Dict[str, str]]) -> Dict:
         """Cria os parâmetros para a chamada da API."""
-        system_message = {
-            "role": "system",
-            "content": self.system_messages[self.current_config['language']]
-        }
-        
-        full_messages = [system_message] + messages
+        base_system = self.system_messages[self.current_config['language']]
+
+        # Mantém apenas os turnos recentes que cabem no contexto do modelo
+        self.context_window.summarizer = self.summarize_history if self.current_config['summarize_history'] else None
+        start = self.context_window.advance(
+            messages,
+            self.current_config['model'],
+            base_system,
+            self.current_config['max_tokens']
+        )
+
+        full_messages = self.request_builder.sync(
+            messages, start, self.context_window.system_content(base_system)
+        )
 
         params = {
             "model": self.current_config['model'],
@@ -88,62 +132,148 @@ class OpenAIChat:
         """Envia uma mensagem para a API e retorna a resposta."""
         try:
             # Adiciona a mensagem do usuário ao histórico
-            self.conversation_history.append({"role": "user", "content": message})
-            
-            # Cria a stream de chat
-            stream = self.client.chat.completions.create(
-                **self.create_chat_params(self.conversation_history)
-            )
-            
-            response_content = ""
+            self._add_message({"role": "user", "content": message})
             
-            # Processa a resposta
-            if self.current_config['stream']:
-                print("\nAssistente: " if self.current_config['language'] == 'pt-br' else "\nAssistant: ", end="")
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        content = chunk.choices[0].delta.content
-                        print(content, end="", flush=True)
-                        response_content += content
-                print()
-            else:
-                response_content = stream.choices[0].message.content
+            params = self.create_chat_params(self.conversation_history)
+
+            # Cache opcional: o modo de streaming não altera o conteúdo da resposta
+            cache_key = None
+            cached = None
+            if self.current_config['cache_responses']:
+                cache_key = make_key({k: v for k, v in params.items() if k != 'stream'})
+                cached = get_shared_cache().get(cache_key)
+
+            # Cache semântico: perguntas parecidas feitas no mesmo contexto reaproveitam a resposta
+            semantic_namespace = None
+            if cached is None and self.current_config['semantic_cache']:
+                # Importado só quando ligado: o cache semântico carrega o numpy
+                from common.semantic_cache import get_shared_semantic_cache, request_namespace
+                semantic_namespace = request_namespace(params)
+                cached = get_shared_semantic_cache().get(message, semantic_namespace)
+
+            if cached is not None:
+                if self.current_config['stream']:
+                    print("\nAssistente: " if self.current_config['language'] == 'pt-br' else "\nAssistant: ", end="")
+                    print(cached['content'])
+                self._add_message({"role": "assistant", "content": cached['content']})
+                return dict(cached)
+
+            # No streaming, o uso de tokens chega num último chunk sem choices
+            if params['stream']:
+                params['stream_options'] = {"include_usage": True}
+
+            usage = None
+            with metrics.track('openai', params['model']) as call:
+                # Cria a stream de chat
+                stream = self.client.chat.completions.create(**params)
+
+                response_content = ""
+
+                # Processa a resposta
+                if self.current_config['stream']:
+                    print("\nAssistente: " if self.current_config['language'] == 'pt-br' else "\nAssistant: ", end="")
+                    for chunk in stream:
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            content = chunk.choices[0].delta.content
+                            if call is not None:
+                                call.mark_first_token()
+                            print(content, end="", flush=True)
+                            response_content += content
+                    print()
+                else:
+                    response_content = stream.choices[0].message.content
+                    usage = stream.usage
+
+                if call is not None:
+                    call.mark_first_token()
+                    call.set_usage(usage)
+
+            self.last_usage = usage.model_dump() if usage is not None else None
                 
             # Adiciona a resposta ao histórico
-            self.conversation_history.append({
+            self._add_message({
                 "role": "assistant",
                 "content": response_content
             })
 
-            return {
+            result = {
                 'content': response_content,
-                'citations': []
+                'citations': [],
+                'usage': self.last_usage
             }
+            if cache_key is not None:
+                get_shared_cache().set(cache_key, result)
+            if semantic_namespace is not None:
+                get_shared_semantic_cache().set(message, result, semantic_namespace)
+            return result
 
         except Exception as e:
             error_msg = "Erro na requisição" if self.current_config['language'] == 'pt-br' else "Request error"
             print(f"{error_msg}: {str(e)}")
             return {'error': str(e)}
 
+    def _add_message(self, message: Dict[str, str]) -> None:
+        """Acrescenta a mensagem ao histórico e, com uma sessão ativa, ao log em disco."""
+        if self.session is not None:
+            # Com sessão, conversation_history é a própria lista de mensagens da sessão
+            self.session.append(message)
+        else:
+            self.conversation_history.append(message)
+
+    def start_session(self, session_id: Optional[str] = None) -> str:
+        """Ativa a sessão persistente; com o ID de uma sessão salva, retoma a conversa."""
+        if self.session is not None:
+            self.session.close()
+        store = SessionStore()
+        resume = session_id is not None and store.exists(session_id)
+        self.session = store.open(session_id)
+        if resume:
+            self.current_config.update(self.session.meta.get('config', {}))
+        else:
+            self.session.set_meta(provider='openai', config=self.current_config)
+            self.session.extend(self.conversation_history)
+        self.conversation_history = self.session.messages
+        self.context_window.reset()
+        self.request_builder.reset()
+        return self.session.id
+
+    def list_sessions(self) -> List[str]:
+        return SessionStore().list_sessions()
+
     def save_conversation(self, filename: Optional[str] = None) -> None:
-        """Salva a conversa em um arquivo JSON."""
+        """Salva a conversa.
+
+        Sem nome de arquivo, ativa a sessão persistente: a partir daí cada
+        mensagem é acrescentada ao log da sessão assim que entra no histórico.
+        Com um nome, exporta o histórico atual em JSON.
+        """
         try:
-            if not filename:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f'conversation_{timestamp}.json'
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
+            if filename:
+                with open(filename, 'w', encoding='utf-8') as f:
+                    json.dump(self.conversation_history.to_list(), f, ensure_ascii=False, indent=2)
+                location = filename
+            else:
+                if self.session is None:
+                    self.start_session()
+                location = f"{self.session.path} (ID: {self.session.id})"
             
             save_msg = "Conversa salva em" if self.current_config['language'] == 'pt-br' else "Conversation saved to"
-            print(f"{save_msg} {filename}")
+            print(f"{save_msg} {location}")
         except Exception as e:
             error_msg = "Erro ao salvar conversa" if self.current_config['language'] == 'pt-br' else "Error saving conversation"
             print(f"{error_msg}: {str(e)}")
 
     def clear_conversation(self) -> None:
         """Limpa o histórico da conversa."""
-        self.conversation_history = []
+        if self.session is not None:
+            self.session.clear()
+            self.conversation_history = self.session.messages
+        else:
+            self.conversation_history = History()
+        self.context_window.reset()
+        self.request_builder.reset()
         clear_msg = "Histórico de conversa limpo" if self.current_config['language'] == 'pt-br' else "Conversation history cleared"
         print(clear_msg)
 
@@ -205,6 +335,26 @@ class OpenAIChat:
             if stream.lower() in ['true', 'false']:
                 self.current_config['stream'] = stream.lower() == 'true'
 
+            # Resumo dos turnos antigos que saem da janela de contexto
+            summary_prompt = "Resumir histórico antigo (true/false)" if is_ptbr else "Summarize old history (true/false)"
+            summarize = input(f"{summary_prompt} (atual: {self.current_config['summarize_history']}): ")
+            if summarize.lower() in ['true', 'false']:
+                self.current_config['summarize_history'] = summarize.lower() == 'true'
+
+            # Cache de respostas (útil com temperature 0)
+            cache_prompt = "Usar cache de respostas (true/false)" if is_ptbr else "Use response cache (true/false)"
+            cache = input(f"{cache_prompt} (atual: {self.current_config['cache_responses']}): ")
+            if cache.lower() in ['true', 'false']:
+                self.current_config['cache_responses'] = cache.lower() == 'true'
+
+            # Cache semântico (perguntas reformuladas no mesmo contexto)
+            semantic_prompt = "Usar cache semântico (true/false)" if is_ptbr else "Use semantic cache (true/false)"
+            semantic = input(f"{semantic_prompt} (atual: {self.current_config['semantic_cache']}): ")
+            if semantic.lower() in ['true', 'false']:
+                self.current_config['semantic_cache'] = semantic.lower() == 'true'
+
+            if self.session is not None:
+                self.session.set_meta(config=self.current_config)
             print("\n" + ("Configurações atualizadas!" if is_ptbr else "Settings updated!"))
             self.show_current_config()
         except Exception as e:
@@ -223,7 +373,9 @@ def run_chat():
         print("Comandos disponíveis:" if is_ptbr else "Available commands:")
         print("'config' - " + ("Configurar parâmetros do chat" if is_ptbr else "Configure chat parameters"))
         print("'settings' - " + ("Mostrar configurações atuais" if is_ptbr else "Show current settings"))
-        print("'save' - " + ("Salvar conversa" if is_ptbr else "Save conversation"))
+        print("'save' - " + ("Salvar conversa (cada turno passa a ser gravado)" if is_ptbr else "Save conversation (every turn is recorded from then on)"))
+        print("'sessions' - " + ("Listar conversas salvas" if is_ptbr else "List saved conversations"))
+        print("'load <id>' - " + ("Retomar uma conversa salva" if is_ptbr else "Resume a saved conversation"))
         print("'clear' - " + ("Limpar histórico" if is_ptbr else "Clear history"))
         print("'exit' - " + ("Sair" if is_ptbr else "Exit"))
         print("=" * 30)
@@ -241,6 +393,19 @@ def run_chat():
                 elif user_input.lower() == 'save':
                     chat.save_conversation()
                     continue
+                elif user_input.lower() == 'sessions':
+                    for session_id in chat.list_sessions():
+                        print(f"- {session_id}")
+                    continue
+                elif user_input.lower().startswith('load '):
+                    session_id = user_input[5:].strip()
+                    if session_id not in chat.list_sessions():
+                        print("Conversa não encontrada" if is_ptbr else "Conversation not found")
+                        continue
+                    chat.start_session(session_id)
+                    loaded_msg = "Conversa retomada" if is_ptbr else "Conversation resumed"
+                    print(f"{loaded_msg}: {session_id} ({len(chat.conversation_history)} " + ("mensagens)" if is_ptbr else "messages)"))
+                    continue
                 elif user_input.lower() == 'clear':
                     chat.clear_conversation()
                     continue
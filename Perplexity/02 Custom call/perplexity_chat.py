@@ -1,9 +1,22 @@
 import os
+import sys
 from dotenv import load_dotenv
 import requests
 import json
-from typing import List, Dict, Optional, Union
-from datetime import datetime
+from typing import List, Dict, Optional, Union, Iterator
+
+# Permite importar os módulos compartilhados da pasta common/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common import http_pool, metrics
+from common.context_window import DEFAULT_OUTPUT_RESERVE, ContextWindow
+from common.hedging import HedgeError, get_shared_hedger
+from common.history import History
+from common.rate_limit import get_limiter
+from common.request_builder import IncrementalRequestBuilder
+from common.response_cache import get_shared_cache, make_key
+from common.session_store import SessionStore
+from common.single_flight import get_single_flight
+from common.sse import iter_sse_data
 
 class PerplexityChat:
     def __init__(self):
@@ -13,7 +26,15 @@ class PerplexityChat:
             raise ValueError("PERPLEXITY_API_KEY não encontrada no arquivo .env")
             
         self.url = 'https://api.perplexity.ai/chat/completions'
-        self.conversation_history: List[Dict[str, str]] = []
+        self.conversation_history = History()
+        # Janela de contexto enviada à API (limitada pelo orçamento de tokens do modelo)
+        self.context_window = ContextWindow()
+        # Cache da lista de mensagens enviada, atualizado só com as mensagens novas
+        self.request_builder = IncrementalRequestBuilder()
+        # Sessão persistente (log append-only em disco), ativada por 'save' ou 'load'
+        self.session = None
+        # Resultado da última resposta em streaming (conteúdo e citações, ou erro)
+        self.last_response: Dict = {}
         
         self.available_models = [
             'llama-3.1-sonar-small-128k-chat',
@@ -35,6 +56,12 @@ class PerplexityChat:
             'return_citations': True,
             'return_related_questions': False,
             'search_recency_filter': None,
+            'summarize_history': False,
+            'cache_responses': False,
+            'semantic_cache': False,
+            'coalesce_requests': False,  # Mensagens idênticas simultâneas compartilham uma requisição
+            'hedge_model': None,  # Segundo modelo, disparado se o primeiro passar do seu p95
+            'stream': False,
             'language': 'pt-br'  # Adicionado configuração de idioma
         }
 
@@ -50,14 +77,40 @@ class PerplexityChat:
             'Content-Type': 'application/json'
         }
 
+    def summarize_history(self, previous_summary: Optional[str], dropped: List[Dict[str, str]]) -> str:
+        """Resume os turnos que saíram da janela de contexto."""
+        transcript = "\n".join(f"{m['role']}: {m.get('content', '')}" for m in dropped)
+        if previous_summary:
+            transcript = f"Resumo anterior: {previous_summary}\n{transcript}"
+
+        body = {
+            "model": self.current_config['model'],
+            "messages": [
+                {"role": "system", "content": "Resuma a conversa a seguir em poucas frases, preservando fatos, nomes e decisões."},
+                {"role": "user", "content": transcript}
+            ],
+            "temperature": 0
+        }
+        response = http_pool.post(self.url, headers=self.create_headers(), data=json.dumps(body))
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+
     def create_request_body(self, messages: List[Dict[str, str]]) -> Dict:
+        base_system = self.system_messages[self.current_config['language']]
+
+        # Mantém apenas os turnos recentes que cabem no contexto do modelo
+        self.context_window.summarizer = self.summarize_history if self.current_config['summarize_history'] else None
+        start = self.context_window.advance(
+            messages,
+            self.current_config['model'],
+            base_system,
+            self.current_config['max_tokens']
+        )
+
         # Adiciona a mensagem do sistema no início da conversa
-        system_message = {
-            "role": "system",
-            "content": self.system_messages[self.current_config['language']]
-        }
-        
-        full_messages = [system_message] + messages
+        full_messages = self.request_builder.sync(
+            messages, start, self.context_window.system_content(base_system)
+        )
 
         body = {
             "model": self.current_config['model'],
@@ -79,21 +132,74 @@ class PerplexityChat:
 
         return body
 
+    def estimate_tokens(self) -> int:
+        """Tokens da janela atual + saída máxima, para o limite de tokens/minuto."""
+        return self.context_window.window_tokens + (self.current_config['max_tokens'] or DEFAULT_OUTPUT_RESERVE)
+
     def send_message(self, message: str) -> Dict:
-        self.conversation_history.append({"role": "user", "content": message})
+        self._add_message({"role": "user", "content": message})
         
         try:
-            response = requests.post(
-                self.url,
-                headers=self.create_headers(),
-                data=json.dumps(self.create_request_body(self.conversation_history))
-            )
-            
-            response.raise_for_status()
-            result = response.json()
+            body = self.create_request_body(self.conversation_history)
+
+            # Cache opcional de respostas, chaveado pelo corpo da requisição
+            cache_key = None
+            cached = None
+            if self.current_config['cache_responses']:
+                cache_key = make_key(body)
+                cached = get_shared_cache().get(cache_key)
+
+            # Cache semântico: perguntas parecidas feitas no mesmo contexto reaproveitam a resposta
+            semantic_namespace = None
+            if cached is None and self.current_config['semantic_cache']:
+                # Importado só quando ligado: o cache semântico carrega o numpy
+                from common.semantic_cache import get_shared_semantic_cache, request_namespace
+                semantic_namespace = request_namespace(body)
+                cached = get_shared_semantic_cache().get(message, semantic_namespace)
+
+            if cached is not None:
+                self._add_message(cached['message'])
+                return {'content': cached['content'], 'citations': cached['citations']}
+
+            payload = self.request_builder.build_body(body)
+            tokens = self.estimate_tokens()
+
+            def enviar(model: str, data: bytes) -> Dict:
+                # Limite de taxa por modelo, com retentativas em 429/5xx (Retry-After)
+                limiter = get_limiter('perplexity', model)
+                with metrics.track('perplexity', model) as call:
+                    response = limiter.call(
+                        lambda: http_pool.post(self.url, headers=self.create_headers(), data=data),
+                        tokens=tokens
+                    )
+                    if call is not None:
+                        call.record_response(response, data)
+
+                    response.raise_for_status()
+                    result = response.json()
+                    if call is not None:
+                        call.set_usage(result.get('usage'))
+                return result
+
+            model = self.current_config['model']
+            hedge_model = self.current_config['hedge_model']
+            if hedge_model and hedge_model != model:
+                # Modo hedge: só a resposta vencedora entra no histórico
+                hedge_payload = self.request_builder.build_body(dict(body, model=hedge_model))
+                try:
+                    _, result = get_shared_hedger().run([
+                        (f"perplexity:{model}", lambda: enviar(model, payload)),
+                        (f"perplexity:{hedge_model}", lambda: enviar(hedge_model, hedge_payload))
+                    ])
+                except HedgeError as e:
+                    raise e.__cause__ or e
+            elif self.current_config['coalesce_requests']:
+                result = get_single_flight().do(self._flight_key(payload), lambda: enviar(model, payload))
+            else:
+                result = enviar(model, payload)
             
             assistant_message = result['choices'][0]['message']
-            self.conversation_history.append(assistant_message)
+            self._add_message(assistant_message)
 
             # Adapt the citations to include index and URL
             citations = []
@@ -102,6 +208,16 @@ class PerplexityChat:
                 # Adjust this according to the actual structure of 'citation'
                 citations.append({"index": idx, "url": citation})
 
+            cache_entry = {
+                'message': assistant_message,
+                'content': assistant_message.get('content', ''),
+                'citations': citations
+            }
+            if cache_key is not None:
+                get_shared_cache().set(cache_key, cache_entry)
+            if semantic_namespace is not None:
+                get_shared_semantic_cache().set(message, cache_entry, semantic_namespace)
+
             return {
                 'content': assistant_message.get('content', ''),
                 'citations': citations
@@ -115,19 +231,167 @@ class PerplexityChat:
                 print(f"{response_msg}: {e.response.text}")
             return {'error': str(e)}
 
+    def stream_message(self, message: str) -> Iterator[str]:
+        """Envia a mensagem com stream=True e gera os trechos de texto conforme chegam.
+
+        Ao final, a resposta completa entra no histórico e o resultado (conteúdo
+        e citações, ou erro) fica em self.last_response.
+        """
+        self._add_message({"role": "user", "content": message})
+        self.last_response = {}
+
+        content_parts = []
+        raw_citations = []
+        try:
+            body = self.create_request_body(self.conversation_history)
+
+            semantic_namespace = None
+            if self.current_config['semantic_cache']:
+                from common.semantic_cache import get_shared_semantic_cache, request_namespace
+                semantic_namespace = request_namespace(body)
+                cached = get_shared_semantic_cache().get(message, semantic_namespace)
+                if cached is not None:
+                    self._add_message(cached['message'])
+                    self.last_response = {'content': cached['content'], 'citations': cached['citations']}
+                    yield cached['content']
+                    return
+
+            body["stream"] = True
+            payload = self.request_builder.build_body(body)
+            if self.current_config['coalesce_requests']:
+                # Um único streaming do provedor é repassado a todos que enviaram o mesmo corpo
+                chunks = get_single_flight().stream(
+                    self._flight_key(payload), lambda: self._stream_chunks(payload, self.estimate_tokens())
+                )
+            else:
+                chunks = self._stream_chunks(payload, self.estimate_tokens())
+
+            for chunk in chunks:
+                # As citações chegam acumuladas em cada chunk; vale a mais recente
+                raw_citations = chunk.get('citations') or raw_citations
+                for choice in chunk.get('choices', [])[:1]:
+                    delta = choice.get('delta', {}).get('content')
+                    if delta:
+                        content_parts.append(delta)
+                        yield delta
+
+        # ValueError: evento SSE com JSON inválido, ou resposta inesperada do resumo
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            error_msg = "Erro na requisição" if self.current_config['language'] == 'pt-br' else "Request error"
+            print(f"{error_msg}: {str(e)}")
+            self.last_response = {'error': str(e)}
+            # Sem resposta, a pergunta não fica no histórico (o próximo turno não teria dois 'user' seguidos)
+            self._discard_last_message()
+            return
+
+        assistant_message = {"role": "assistant", "content": "".join(content_parts)}
+        if raw_citations:
+            assistant_message['citations'] = raw_citations
+        self._add_message(assistant_message)
+
+        self.last_response = {
+            'content': assistant_message['content'],
+            'citations': [{"index": idx, "url": citation} for idx, citation in enumerate(raw_citations, start=1)]
+        }
+        if semantic_namespace is not None:
+            get_shared_semantic_cache().set(message, dict(self.last_response, message=assistant_message), semantic_namespace)
+
+    def _stream_chunks(self, payload: bytes, tokens: int) -> Iterator[Dict]:
+        """Faz a requisição com stream=True e gera os chunks JSON (com limite de taxa e métricas)."""
+        limiter = get_limiter('perplexity', self.current_config['model'])
+        call = metrics.start_call('perplexity', self.current_config['model'])
+        try:
+            # A vaga de concorrência fica ocupada até o fim do streaming
+            with limiter.slot(tokens):
+                with metrics.activate(call):
+                    response = http_pool.post(self.url, headers=self.create_headers(), data=payload, stream=True)
+                limiter.record_response(response.status_code, response.headers)
+                if call is not None:
+                    call.status = response.status_code
+                    call.bytes_out += len(payload)
+                with response:
+                    response.raise_for_status()
+                    for event in iter_sse_data(response.iter_lines(decode_unicode=True)):
+                        chunk = json.loads(event)
+                        if call is not None:
+                            call.bytes_in += len(event)
+                            call.set_usage(chunk.get('usage'))
+                            if chunk.get('choices'):
+                                call.mark_first_token()
+                        yield chunk
+        except (requests.exceptions.RequestException, ValueError) as e:
+            metrics.finish_call(call, type(e).__name__)
+            raise
+        metrics.finish_call(call)
+
+    def _flight_key(self, payload: bytes) -> str:
+        """Chave da coalescência: URL, chave de API e corpo exato da requisição."""
+        return make_key({"url": self.url, "api_key": self.api_key, "body": payload.decode("utf-8")})
+
+    def _add_message(self, message: Dict[str, str]) -> None:
+        """Acrescenta a mensagem ao histórico e, com uma sessão ativa, ao log em disco."""
+        if self.session is not None:
+            # Com sessão, conversation_history é a própria lista de mensagens da sessão
+            self.session.append(message)
+        else:
+            self.conversation_history.append(message)
+
+    def _discard_last_message(self) -> None:
+        """Retira a última mensagem do histórico (e do log da sessão) e dos caches da janela."""
+        if self.session is not None:
+            self.session.pop()
+        else:
+            del self.conversation_history[-1]
+        self.context_window.rewind(len(self.conversation_history))
+        self.request_builder.rewind(len(self.conversation_history))
+
+    def start_session(self, session_id: Optional[str] = None) -> str:
+        """Ativa a sessão persistente; com o ID de uma sessão salva, retoma a conversa."""
+        if self.session is not None:
+            self.session.close()
+        store = SessionStore()
+        resume = session_id is not None and store.exists(session_id)
+        self.session = store.open(session_id)
+        if resume:
+            self.current_config.update(self.session.meta.get('config', {}))
+        else:
+            self.session.set_meta(provider='perplexity', config=self.current_config)
+            self.session.extend(self.conversation_history)
+        self.conversation_history = self.session.messages
+        self.context_window.reset()
+        self.request_builder.reset()
+        return self.session.id
+
+    def list_sessions(self) -> List[str]:
+        return SessionStore().list_sessions()
+
     def save_conversation(self, filename: Optional[str] = None) -> None:
-        if not filename:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'conversation_{timestamp}.json'
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
+        """Salva a conversa.
+
+        Sem nome de arquivo, ativa a sessão persistente: a partir daí cada
+        mensagem é acrescentada ao log da sessão assim que entra no histórico.
+        Com um nome, exporta o histórico atual em JSON.
+        """
+        if filename:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(self.conversation_history.to_list(), f, ensure_ascii=False, indent=2)
+            location = filename
+        else:
+            if self.session is None:
+                self.start_session()
+            location = f"{self.session.path} (ID: {self.session.id})"
         
         save_msg = "Conversa salva em" if self.current_config['language'] == 'pt-br' else "Conversation saved to"
-        print(f"{save_msg} {filename}")
+        print(f"{save_msg} {location}")
 
     def clear_conversation(self) -> None:
-        self.conversation_history = []
+        if self.session is not None:
+            self.session.clear()
+            self.conversation_history = self.session.messages
+        else:
+            self.conversation_history = History()
+        self.context_window.reset()
+        self.request_builder.reset()
         clear_msg = "Histórico de conversa limpo" if self.current_config['language'] == 'pt-br' else "Conversation history cleared"
         print(clear_msg)
 
@@ -202,6 +466,46 @@ class PerplexityChat:
         if citations.lower() in ['true', 'false']:
             self.current_config['return_citations'] = citations.lower() == 'true'
 
+        # Resumo dos turnos antigos que saem da janela de contexto
+        summary_prompt = "Resumir histórico antigo (true/false)" if is_ptbr else "Summarize old history (true/false)"
+        summarize = input(f"{summary_prompt} (atual: {self.current_config['summarize_history']}): ")
+        if summarize.lower() in ['true', 'false']:
+            self.current_config['summarize_history'] = summarize.lower() == 'true'
+
+        # Cache de respostas (útil com temperature 0)
+        cache_prompt = "Usar cache de respostas (true/false)" if is_ptbr else "Use response cache (true/false)"
+        cache = input(f"{cache_prompt} (atual: {self.current_config['cache_responses']}): ")
+        if cache.lower() in ['true', 'false']:
+            self.current_config['cache_responses'] = cache.lower() == 'true'
+
+        # Cache semântico (perguntas reformuladas no mesmo contexto)
+        semantic_prompt = "Usar cache semântico (true/false)" if is_ptbr else "Use semantic cache (true/false)"
+        semantic = input(f"{semantic_prompt} (atual: {self.current_config['semantic_cache']}): ")
+        if semantic.lower() in ['true', 'false']:
+            self.current_config['semantic_cache'] = semantic.lower() == 'true'
+
+        # Coalescência de mensagens idênticas enviadas ao mesmo tempo
+        coalesce_prompt = "Agrupar requisições idênticas simultâneas (true/false)" if is_ptbr else "Coalesce identical concurrent requests (true/false)"
+        coalesce = input(f"{coalesce_prompt} (atual: {self.current_config['coalesce_requests']}): ")
+        if coalesce.lower() in ['true', 'false']:
+            self.current_config['coalesce_requests'] = coalesce.lower() == 'true'
+
+        # Hedge: segundo modelo disparado quando o primeiro demora
+        hedge_prompt = "Modelo de hedge (número ou 'none')" if is_ptbr else "Hedge model (number or 'none')"
+        hedge = input(f"{hedge_prompt} (atual: {self.current_config['hedge_model']}): ")
+        if hedge.isdigit() and 1 <= int(hedge) <= len(self.available_models):
+            self.current_config['hedge_model'] = self.available_models[int(hedge)-1]
+        elif hedge.lower() == 'none':
+            self.current_config['hedge_model'] = None
+
+        # Streaming
+        stream_prompt = "Usar streaming (true/false)" if is_ptbr else "Use streaming (true/false)"
+        stream = input(f"{stream_prompt} (atual: {self.current_config['stream']}): ")
+        if stream.lower() in ['true', 'false']:
+            self.current_config['stream'] = stream.lower() == 'true'
+
+        if self.session is not None:
+            self.session.set_meta(config=self.current_config)
         print("\n" + ("Configurações atualizadas!" if is_ptbr else "Settings updated!"))
         self.show_current_config()
 
@@ -214,7 +518,9 @@ def main():
         print("Comandos disponíveis:" if is_ptbr else "Available commands:")
         print("'config' - " + ("Configurar parâmetros do chat" if is_ptbr else "Configure chat parameters"))
         print("'settings' - " + ("Mostrar configurações atuais" if is_ptbr else "Show current settings"))
-        print("'save' - " + ("Salvar conversa" if is_ptbr else "Save conversation"))
+        print("'save' - " + ("Salvar conversa (cada turno passa a ser gravado)" if is_ptbr else "Save conversation (every turn is recorded from then on)"))
+        print("'sessions' - " + ("Listar conversas salvas" if is_ptbr else "List saved conversations"))
+        print("'load <id>' - " + ("Retomar uma conversa salva" if is_ptbr else "Resume a saved conversation"))
         print("'clear' - " + ("Limpar histórico" if is_ptbr else "Clear history"))
         print("'exit' - " + ("Sair" if is_ptbr else "Exit"))
         print("=" * 30)
@@ -229,6 +535,19 @@ def main():
             elif user_input.lower() == 'save':
                 chat.save_conversation()
                 continue
+            elif user_input.lower() == 'sessions':
+                for session_id in chat.list_sessions():
+                    print(f"- {session_id}")
+                continue
+            elif user_input.lower().startswith('load '):
+                session_id = user_input[5:].strip()
+                if session_id not in chat.list_sessions():
+                    print("Conversa não encontrada" if is_ptbr else "Conversation not found")
+                    continue
+                chat.start_session(session_id)
+                loaded_msg = "Conversa retomada" if is_ptbr else "Conversation resumed"
+                print(f"{loaded_msg}: {session_id} ({len(chat.conversation_history)} " + ("mensagens)" if is_ptbr else "messages)"))
+                continue
             elif user_input.lower() == 'clear':
                 chat.clear_conversation()
                 continue
@@ -241,15 +560,23 @@ def main():
             elif not user_input:
                 continue
 
-            response = chat.send_message(user_input)
+            assistant_msg = "Assistente" if is_ptbr else "Assistant"
+            if chat.current_config['stream']:
+                print(f"\n{assistant_msg}: ", end="", flush=True)
+                for delta in chat.stream_message(user_input):
+                    print(delta, end="", flush=True)
+                print()
+                response = chat.last_response
+            else:
+                response = chat.send_message(user_input)
 
             if 'error' in response:
                 error_msg = "Erro" if is_ptbr else "Error"
                 print(f"\n{error_msg}: {response['error']}")
                 continue
 
-            assistant_msg = "Assistente" if is_ptbr else "Assistant"
-            print(f"\n{assistant_msg}:", response['content'])
+            if not chat.current_config['stream']:
+                print(f"\n{assistant_msg}:", response['content'])
             
             if response.get('citations'):
                 citations_msg = "Citações" if is_ptbr else "Citations"
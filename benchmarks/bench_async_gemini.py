@@ -0,0 +1,38 @@
+"""Mostra que N chamadas concorrentes a chamar_gemini levam o tempo de uma só."""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+LATENCY = 0.5
+CONCURRENCY = 20
+
+
+async def run(api) -> None:
+    inicio = time.perf_counter()
+    await api.chamar_gemini("aquecimento")
+    uma = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    respostas = await asyncio.gather(*(api.chamar_gemini(f"pergunta {i}") for i in range(CONCURRENCY)))
+    todas = time.perf_counter() - inicio
+
+    assert all(resposta == "ok" for resposta in respostas), respostas[0]
+    print(f"1 chamada:                 {uma:.3f} s")
+    print(f"{CONCURRENCY} chamadas concorrentes:  {todas:.3f} s ({todas / uma:.2f}x uma chamada)")
+
+
+def main():
+    gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+    with MockServer(latency=LATENCY) as server:
+        api = gemini.GeminiAPI("chave-de-teste")
+        api.base_url = f"{server.url}/v1"
+        asyncio.run(run(api))
+
+
+if __name__ == "__main__":
+    main()
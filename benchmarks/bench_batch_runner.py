@@ -0,0 +1,98 @@
+"""batch_runner no servidor mock: vazão, linhas em branco no meio da entrada e retomada.
+
+Confere também que falhas transitórias (5xx) são repetidas na retomada e as
+definitivas não.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.batch_runner import BatchRunner
+from common.providers import AsyncEngine
+from benchmarks.mock_server import MockServer
+
+N_REQUESTS = 600
+BLANK_EVERY = 100  # Uma linha em branco a cada N registros (já travou a janela)
+TIMEOUT = 60
+
+
+def gerar_entrada(path: str, base_url: str) -> int:
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(N_REQUESTS):
+            if i % BLANK_EVERY == 50:
+                f.write("\n")
+            item = {"id": f"q{i}", "provider": "openai", "model": "gpt-4o-mini", "base_url": base_url,
+                    "prompt": f"pergunta {i}"}
+            f.write(json.dumps(item) + "\n")
+        f.write("\n\n")
+    return N_REQUESTS
+
+
+async def executar(entrada: str, saida: str, concurrency: int, window: int) -> dict:
+    runner = BatchRunner(entrada, saida, concurrency=concurrency, window=window)
+    # Sem o timeout, uma marca d'água parada trava o run() para sempre
+    return await asyncio.wait_for(runner.run(), TIMEOUT)
+
+
+def verificar_transitorios(server: MockServer, pasta: str) -> None:
+    entrada = os.path.join(pasta, "transitorios.jsonl")
+    saida = os.path.join(pasta, "transitorios-saida.jsonl")
+    with open(entrada, "w", encoding="utf-8") as f:
+        for i in range(30):
+            item = {"id": f"t{i}", "provider": "openai", "model": "gpt-4o-mini", "base_url": f"{server.url}/v1",
+                    "prompt": f"pergunta {i}"}
+            f.write(json.dumps(item) + "\n")
+        f.write(json.dumps({"id": "invalido", "provider": "inexistente", "prompt": "x"}) + "\n")
+
+    def executar_sem_repeticao() -> dict:
+        runner = BatchRunner(entrada, saida, concurrency=8)
+        # Sem repetições no engine: cada 5xx chega ao runner
+        runner.engine = AsyncEngine(max_concurrency=8, max_retries=0, rate_limit=False)
+        return asyncio.run(asyncio.wait_for(runner.run(), TIMEOUT))
+
+    server.httpd.error_rate = 1.0
+    try:
+        stats = executar_sem_repeticao()
+    finally:
+        server.httpd.error_rate = 0.0
+    assert stats["error"] == 31 and stats["retryable"] == 30, stats
+
+    # Retomada: só as falhas transitórias são reenviadas
+    stats = executar_sem_repeticao()
+    assert stats["ok"] == 30 and stats["skipped"] == 1, stats
+    stats = executar_sem_repeticao()
+    assert stats["skipped"] == 31, stats
+    print("Falhas transitórias repetidas na retomada; erros definitivos não")
+
+
+def main():
+    os.environ["OPENAI_API_KEY"] = "chave-de-teste"
+    with MockServer(latency=0.005) as server, tempfile.TemporaryDirectory() as pasta:
+        entrada = os.path.join(pasta, "entrada.jsonl")
+        total = gerar_entrada(entrada, f"{server.url}/v1")
+
+        for concurrency, window in ((1, 4), (32, None)):
+            saida = os.path.join(pasta, f"saida-{concurrency}.jsonl")
+            inicio = time.perf_counter()
+            stats = asyncio.run(executar(entrada, saida, concurrency, window))
+            duracao = time.perf_counter() - inicio
+            with open(saida, encoding="utf-8") as f:
+                ids = {json.loads(linha)["id"] for linha in f}
+            assert stats["ok"] == total and len(ids) == total, (stats, len(ids))
+
+            # Retomada: tudo já concluído, nada é reenviado
+            enviados = server.httpd.requests
+            stats = asyncio.run(executar(entrada, saida, concurrency, window))
+            assert stats["skipped"] == total and server.httpd.requests == enviados, stats
+            print(f"concurrency={concurrency:<3} window={window or concurrency * 4:<4} "
+                  f"{total} requisições em {duracao:.2f} s ({total / duracao:.0f}/s), retomada sem reenvios")
+
+        verificar_transitorios(server, pasta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Milhares de sessões no chat_server com orçamento de memória pequeno: RSS, descartes e recarga do disco.
+
+Confere também que requisições simultâneas a uma sessão descartada a recarregam
+uma única vez, que apagar uma sessão fora da memória não reproduz o log e que
+turnos interrompidos (falha do provedor, cliente desconectado) deixam o
+histórico consistente.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import http_pool
+from common.chat_server import ChatServer, SessionManager, create_app
+from common.providers import ProviderError
+from common.session_store import SessionStore
+from benchmarks.bench_suite import rss_mb
+from benchmarks.mock_server import MockServer
+
+SESSIONS = 5000
+IDLE_WEBSOCKETS = 1000
+CONCURRENCY = 64
+MEMORY_BUDGET = 2 * 1024 * 1024
+LATENCY = 0.02
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def executar(mock_url: str, pasta: str) -> None:
+    app = create_app(pasta, memory_budget=MEMORY_BUDGET, base_urls={"openai": f"{mock_url}/v1"})
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    rss_inicial = rss_mb()
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as http:
+        async def post(path: str, body: dict) -> dict:
+            async with http.post(f"{url}{path}", json=body) as resp:
+                assert resp.status in (200, 201), await resp.text()
+                return await resp.json()
+
+        semaforo = asyncio.Semaphore(CONCURRENCY)
+        latencias = []
+
+        async def sessao(i: int) -> str:
+            async with semaforo:
+                sid = (await post("/sessions", {"provider": "openai", "config": {"temperature": 0.5}}))["id"]
+                inicio = time.perf_counter()
+                resposta = await post(f"/sessions/{sid}/messages", {"content": f"Pergunta {i} " * 20})
+                latencias.append(time.perf_counter() - inicio)
+                assert resposta["content"] == "ok"
+                return sid
+
+        inicio = time.perf_counter()
+        ids = await asyncio.gather(*(sessao(i) for i in range(SESSIONS)))
+        duracao = time.perf_counter() - inicio
+        async with http.get(f"{url}/stats") as resp:
+            stats = await resp.json()
+        print(f"{SESSIONS} sessões com um turno cada em {duracao:.1f} s "
+              f"(turno p50 {percentil(latencias, 0.5) * 1000:.1f} ms, p99 {percentil(latencias, 0.99) * 1000:.1f} ms)")
+        print(f"Residentes: {stats['resident']} ({stats['resident_bytes'] / 1024:.0f} KB de {MEMORY_BUDGET // 1024} KB), "
+              f"descartadas: {stats['evicted']}, RSS +{rss_mb() - rss_inicial:.1f} MB")
+
+        # Conexões WebSocket ociosas, uma por sessão antiga (já descartada da memória)
+        antes = rss_mb()
+        ws_http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        sockets = [await ws_http.ws_connect(f"{url}/sessions/{sid}/ws") for sid in ids[:IDLE_WEBSOCKETS]]
+        print(f"{IDLE_WEBSOCKETS} WebSockets ociosos: RSS +{rss_mb() - antes:.1f} MB")
+
+        # Um turno em streaming numa sessão recarregada do disco
+        inicio = time.perf_counter()
+        ws = sockets[0]
+        await ws.send_json({"content": "Continue."})
+        deltas = 0
+        while True:
+            msg = await ws.receive_json()
+            if msg["type"] != "delta":
+                break
+            deltas += 1
+        assert msg["type"] == "done", msg
+        print(f"Turno via WebSocket em sessão recarregada: {(time.perf_counter() - inicio) * 1000:.1f} ms, {deltas} deltas")
+        for ws in sockets:
+            await ws.close()
+        await ws_http.close()
+
+        async with http.get(f"{url}/sessions/{ids[0]}") as resp:
+            historico = (await resp.json())["messages"]
+        assert [m["role"] for m in historico] == ["user", "assistant", "user", "assistant"], historico
+        async with http.get(f"{url}/stats") as resp:
+            stats = await resp.json()
+        print(f"Recarregadas do disco: {stats['loaded']}, histórico preservado; RSS final {rss_mb():.1f} MB")
+
+        # Várias leituras simultâneas de uma sessão descartada: uma única recarga
+        carregadas = stats["loaded"]
+        respostas = await asyncio.gather(*(http.get(f"{url}/sessions/{ids[-IDLE_WEBSOCKETS - 1]}") for _ in range(20)))
+        assert all(resp.status == 200 for resp in respostas)
+        for resp in respostas:
+            resp.release()
+        async with http.get(f"{url}/stats") as resp:
+            stats = await resp.json()
+        assert stats["loaded"] == carregadas + 1, stats
+
+        # Apagar uma sessão fora da memória não a recarrega; a segunda vez é 404
+        for status in (204, 404):
+            async with http.delete(f"{url}/sessions/{ids[-IDLE_WEBSOCKETS - 2]}") as resp:
+                assert resp.status == status, resp.status
+        async with http.get(f"{url}/stats") as resp:
+            assert (await resp.json())["loaded"] == carregadas + 1
+        async with http.get(f"{url}/sessions/{ids[-IDLE_WEBSOCKETS - 2]}") as resp:
+            assert resp.status == 404
+        print("Recarga única com 20 leituras simultâneas; DELETE sem reproduzir o log")
+
+    await runner.cleanup()
+
+
+async def verificar_interrupcoes(mock_url: str, pasta: str) -> None:
+    """Falha do provedor desfaz a pergunta; desconexão no streaming guarda a resposta parcial."""
+    sessions = SessionManager(SessionStore(pasta), base_urls={"openai": f"{mock_url}/v1", "groq": "http://127.0.0.1:1/v1"})
+    server = ChatServer(sessions)
+    try:
+        falha = await sessions.create("groq", {})
+        for _ in range(2):
+            try:
+                await server.turn(falha.id, "Pergunta sem resposta")
+                raise AssertionError("o turno deveria falhar")
+            except ProviderError:
+                pass
+        assert len(falha.log.messages) == 0, falha.log.messages.to_list()
+        assert falha.window.token_counts == [], falha.window.token_counts
+
+        async def desconecta(text: str) -> None:
+            raise ConnectionResetError("cliente desconectado")
+
+        sessao = await sessions.create("openai", {})
+        await server.turn(sessao.id, "Primeira pergunta")
+        try:
+            await server.turn(sessao.id, "Continue.", desconecta)
+            raise AssertionError("o turno deveria propagar a desconexão")
+        except ConnectionResetError:
+            pass
+        mensagens = sessao.log.messages.to_list()
+        assert [m["role"] for m in mensagens] == ["user", "assistant", "user", "assistant"], mensagens
+        assert mensagens[-1]["content"], mensagens
+        # O log em disco reproduz o mesmo histórico
+        sessions.close()
+        recarregada = SessionStore(pasta).open(sessao.id)
+        assert recarregada.messages.to_list() == mensagens
+        assert len(SessionStore(pasta).open(falha.id).messages) == 0
+        recarregada.close()
+    finally:
+        sessions.close()
+        await http_pool.aclose_async_client()
+    print("Falha do provedor desfaz a pergunta; desconexão no streaming guarda a resposta parcial")
+
+
+def main():
+    with MockServer(latency=LATENCY) as server, tempfile.TemporaryDirectory() as pasta:
+        asyncio.run(executar(server.url, pasta))
+    with MockServer(latency=0) as server, tempfile.TemporaryDirectory() as pasta:
+        asyncio.run(verificar_interrupcoes(server.url, pasta))
+
+
+if __name__ == "__main__":
+    main()
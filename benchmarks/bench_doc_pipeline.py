@@ -0,0 +1,85 @@
+"""Map-reduce de um documento ~30x maior que a janela do gemini-pro, com diferentes limites de requisições simultâneas."""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import doc_pipeline
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+LATENCY = 0.1
+DOCUMENT_CHARS = 4 * 1024 * 1024
+
+
+def gerar_documento(path: str) -> None:
+    paragrafo = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. "
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(DOCUMENT_CHARS // len(paragrafo)):
+            f.write(paragrafo)
+            if i % 10 == 9:
+                f.write("\n\n")
+
+
+def verificar_agrupamento() -> None:
+    """Nenhuma chamada de reduce passa do orçamento, nem com parte isolada ou gigante."""
+    orcamento = 1000
+    palavra = "resumo parcial "
+    tamanhos = [600, 600, 300, 2500, 100]  # Tokens aproximados de cada resposta do map
+    maior = 0
+
+    async def mapear(i: int, trecho: str) -> str:
+        return palavra * (tamanhos[i] // doc_pipeline.count_tokens(palavra))
+
+    async def reduzir(partes: list) -> str:
+        nonlocal maior
+        maior = max(maior, sum(doc_pipeline.count_tokens(parte) for parte in partes))
+        return "ok"
+
+    resposta = asyncio.run(doc_pipeline.map_reduce(
+        [str(i) for i in range(len(tamanhos))], mapear, reduzir, reduce_tokens=orcamento
+    ))
+    assert resposta == "ok" and maior <= orcamento, (resposta, maior)
+
+    async def repetir(partes: list) -> str:
+        return partes[0]
+
+    try:
+        asyncio.run(doc_pipeline.map_reduce(["a", "b"], mapear, repetir, reduce_tokens=orcamento))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("reduce_fn que não reduz deveria falhar")
+    print(f"Reduce: maior chamada com {maior} tokens (orçamento {orcamento})")
+
+
+def main():
+    verificar_agrupamento()
+
+    gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+
+    with MockServer(latency=LATENCY) as server, tempfile.TemporaryDirectory() as pasta:
+        path = os.path.join(pasta, "documento.txt")
+        gerar_documento(path)
+
+        inicio = time.perf_counter()
+        trechos = sum(1 for _ in doc_pipeline.iter_chunks(doc_pipeline.iter_text_file(path), gemini.DOCUMENT_CHUNK_TOKENS))
+        chunking = time.perf_counter() - inicio
+        print(f"Documento: {os.path.getsize(path) / 2 ** 20:.1f} MB, {trechos} trechos "
+              f"(chunking: {chunking * 1000:.0f} ms, latência do servidor: {LATENCY * 1000:.0f} ms)")
+
+        api = gemini.GeminiAPI("chave-de-teste")
+        api.base_url = f"{server.url}/v1"
+        for max_in_flight in (1, 4, 16):
+            antes = server.httpd.requests
+            inicio = time.perf_counter()
+            resposta = asyncio.run(api.processar_documento(path, "Resuma o documento.", max_in_flight=max_in_flight))
+            duracao = time.perf_counter() - inicio
+            assert resposta == "ok", resposta
+            print(f"max_in_flight={max_in_flight:<3} {duracao:6.2f} s   {server.httpd.requests - antes} requisições")
+
+
+if __name__ == "__main__":
+    main()
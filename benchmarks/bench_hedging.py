@@ -0,0 +1,228 @@
+"""Latência p50/p99 com e sem hedge, com um provedor primário de cauda lenta.
+
+O primário (PerplexityChat) responde em 20 ms, mas 5% das respostas demoram
+1 s. O secundário (script Groq) responde sempre em 40 ms. Com hedge, o
+secundário só é disparado quando o primário passa do seu p90.
+
+Verifica também que o hedge reduz o p99 pela metade ou mais, que arun() cancela
+o perdedor e que a falha de um candidato dispara o próximo na hora, mesmo com
+outro ainda em andamento. Perdedores precisam registrar uma amostra censurada,
+o hedge por atraso não pode passar do tamanho do executor e o modo hedge do
+PerplexityChat só guarda a resposta vencedora no histórico.
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.hedging import Hedger, get_histogram
+from common.providers import AsyncEngine, create_provider
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+N_CALLS = 300
+
+
+def percentis(amostras):
+    amostras = sorted(amostras)
+    return {
+        "p50": amostras[len(amostras) // 2],
+        "p99": amostras[int(len(amostras) * 0.99) - 1],
+        "max": amostras[-1]
+    }
+
+
+def medir(func, n: int = N_CALLS):
+    amostras = []
+    for i in range(n):
+        inicio = time.perf_counter()
+        func(i)
+        amostras.append(time.perf_counter() - inicio)
+    return percentis(amostras)
+
+
+def mostrar(nome: str, resultado: dict) -> None:
+    print(f"{nome:<28} p50 {resultado['p50'] * 1000:7.1f} ms   p99 {resultado['p99'] * 1000:7.1f} ms   "
+          f"max {resultado['max'] * 1000:7.1f} ms")
+
+
+def bench_sync(primario: MockServer, secundario: MockServer) -> None:
+    os.environ["PERPLEXITY_API_KEY"] = "chave-de-teste"
+    os.environ["GROQ_API_KEY"] = "chave-de-teste"
+    os.environ["GROQ_BASE_URL"] = secundario.url
+    perplexity = load_script("Perplexity/02 Custom call/perplexity_chat.py", "perplexity_chat")
+    groq = load_script("Groq/01 Simple request/groq_chat_simples.py", "groq_chat_simples")
+
+    def perguntar_perplexity(prompt: str) -> dict:
+        # Um cliente por chamada: o histórico não pode ser compartilhado entre candidatos
+        chat = perplexity.PerplexityChat()
+        chat.url = f"{primario.url}/chat/completions"
+        return chat.send_message(prompt)
+
+    hedger = Hedger(percentile=90, min_samples=20, accept=lambda resposta: "error" not in resposta)
+    # Aquece o histograma do primário
+    for _ in range(50):
+        hedger.run([("perplexity", lambda: perguntar_perplexity("aquecimento"))])
+
+    sem_hedge = medir(lambda i: perguntar_perplexity(f"pergunta {i}"))
+    com_hedge = medir(lambda i: hedger.run([
+        ("perplexity", lambda: perguntar_perplexity(f"pergunta {i}")),
+        ("groq", lambda: {"content": groq.enviar_mensagem_groq(f"pergunta {i}")})
+    ]))
+
+    print("Clientes síncronos (PerplexityChat -> Groq):")
+    mostrar("  sem hedge", sem_hedge)
+    mostrar("  com hedge", com_hedge)
+    print(f"  atraso do hedge: {hedger.delay_for('perplexity') * 1000:.1f} ms, estatísticas: {hedger.stats}")
+    hedger.close()
+    assert com_hedge["p99"] < sem_hedge["p99"] / 2, (sem_hedge, com_hedge)
+
+
+async def bench_async(primario: MockServer, secundario: MockServer) -> None:
+    engine = AsyncEngine(max_retries=0)
+    rapido = create_provider("openai", api_key="chave-de-teste", base_url=secundario.url, model="gpt-4o-mini")
+    lento = create_provider("openai", api_key="chave-de-teste", base_url=primario.url, model="gpt-4o")
+    mensagens = [{"role": "user", "content": "pergunta"}]
+    hedger = Hedger(percentile=90, min_samples=20)
+    cancelados = 0
+
+    async def observar(coro):
+        nonlocal cancelados
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            cancelados += 1
+            raise
+
+    for _ in range(50):
+        await hedger.arun([("openai:gpt-4o", lambda: engine.complete(lento, mensagens))])
+
+    async def medir_async(func):
+        amostras = []
+        for _ in range(N_CALLS):
+            inicio = time.perf_counter()
+            await func()
+            amostras.append(time.perf_counter() - inicio)
+        return percentis(amostras)
+
+    sem_hedge = await medir_async(lambda: engine.complete(lento, mensagens))
+    com_hedge = await medir_async(lambda: hedger.arun([
+        ("openai:gpt-4o", lambda: observar(engine.complete(lento, mensagens))),
+        ("openai:gpt-4o-mini", lambda: observar(engine.complete(rapido, mensagens)))
+    ]))
+    await asyncio.sleep(0.05)
+
+    print("AsyncEngine (gpt-4o -> gpt-4o-mini, perdedor cancelado):")
+    mostrar("  sem hedge", sem_hedge)
+    mostrar("  com hedge", com_hedge)
+    print(f"  estatísticas: {hedger.stats}, perdedores cancelados: {cancelados}")
+    assert com_hedge["p99"] < sem_hedge["p99"] / 2, (sem_hedge, com_hedge)
+    # Quando o secundário vence, o primário lento (1 s) ainda está em andamento e precisa ser cancelado
+    assert hedger.stats["hedge_wins"] > 0 and cancelados >= hedger.stats["hedge_wins"], (hedger.stats, cancelados)
+
+
+def verificar_failover() -> None:
+    """A lento (hedge após ~10 ms), B falha com A em andamento, C precisa ser disparado na hora."""
+    for _ in range(20):
+        get_histogram("failover:a").record(0.01)
+    hedger = Hedger(percentile=90, min_samples=20, default_delay=5.0)
+
+    def falhar():
+        time.sleep(0.02)
+        raise ConnectionError("B fora do ar")
+
+    inicio = time.perf_counter()
+    nome, resposta = hedger.run([
+        ("failover:a", lambda: time.sleep(0.5) or "a"),
+        ("failover:b", falhar),
+        ("failover:c", lambda: "c")
+    ])
+    duracao_sync = time.perf_counter() - inicio
+    assert (nome, resposta) == ("failover:c", "c") and duracao_sync < 0.2, (nome, duracao_sync)
+    hedger.close()
+
+    async def dormir(segundos: float, valor: str) -> str:
+        await asyncio.sleep(segundos)
+        return valor
+
+    async def afalhar():
+        await asyncio.sleep(0.02)
+        raise ConnectionError("B fora do ar")
+
+    inicio = time.perf_counter()
+    nome, resposta = asyncio.run(hedger.arun([
+        ("failover:a", lambda: dormir(0.5, "a")),
+        ("failover:b", afalhar),
+        ("failover:c", lambda: dormir(0, "c"))
+    ]))
+    duracao_async = time.perf_counter() - inicio
+    assert (nome, resposta) == ("failover:c", "c") and duracao_async < 0.2, (nome, duracao_async)
+    print(f"Failover com outro candidato em andamento: {duracao_sync * 1000:.0f} ms (run), "
+          f"{duracao_async * 1000:.0f} ms (arun)")
+
+
+def verificar_censura() -> None:
+    """O perdedor registra o tempo até ser descartado/cancelado, uma única vez."""
+    for _ in range(20):
+        get_histogram("censura:a").record(0.01)
+    hedger = Hedger(percentile=90, min_samples=20)
+    nome, _ = hedger.run([("censura:a", lambda: time.sleep(0.3) or "a"), ("censura:b", lambda: "b")])
+    assert nome == "censura:b"
+    time.sleep(0.4)
+    # 20 amostras de aquecimento + a censurada (perto do atraso do hedge, não dos 300 ms)
+    censura = get_histogram("censura:a")
+    assert censura.count == 21 and censura.total - 20 * 0.01 < 0.1, censura.snapshot()
+
+    async def dormir(segundos: float, valor: str) -> str:
+        await asyncio.sleep(segundos)
+        return valor
+
+    nome, _ = asyncio.run(hedger.arun([("censura:a", lambda: dormir(0.3, "a")), ("censura:c", lambda: dormir(0, "c"))]))
+    assert nome == "censura:c" and get_histogram("censura:a").count == 22, get_histogram("censura:a").snapshot()
+    hedger.close()
+
+    # Com o executor cheio de perdedores, o hedge por atraso espera uma thread livre
+    cheio = Hedger(max_workers=1, default_delay=0.01)
+    nome, _ = cheio.run([("cheio:a", lambda: time.sleep(0.1) or "a"), ("cheio:b", lambda: "b")])
+    assert nome == "cheio:a" and cheio.stats["hedges_skipped"] == 1, cheio.stats
+    cheio.close()
+    print(f"Amostras censuradas dos perdedores: {get_histogram('censura:a').count - 20}, "
+          f"hedges adiados com o executor cheio: {cheio.stats['hedges_skipped']}")
+
+
+def verificar_modo_hedge(primario: MockServer) -> None:
+    """PerplexityChat com hedge_model: o segundo modelo só entra quando o primeiro demora."""
+    perplexity = load_script("Perplexity/02 Custom call/perplexity_chat.py", "perplexity_chat")
+    chat = perplexity.PerplexityChat()
+    chat.url = f"{primario.url}/chat/completions"
+    chat.current_config['hedge_model'] = 'llama-3.1-sonar-large-128k-online'
+    amostras = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(100):
+            inicio = time.perf_counter()
+            resposta = chat.send_message(f"pergunta {i}")
+            amostras.append(time.perf_counter() - inicio)
+            assert "error" not in resposta, resposta
+    # Só a resposta vencedora entra no histórico
+    assert len(chat.conversation_history) == 200, len(chat.conversation_history)
+    print(f"PerplexityChat com hedge_model: p99 {percentis(amostras)['p99'] * 1000:.1f} ms em 100 mensagens")
+
+
+def main():
+    with MockServer(latency=0.02, slow_ratio=0.05, slow_latency=1.0) as primario, \
+            MockServer(latency=0.04) as secundario:
+        bench_sync(primario, secundario)
+        print()
+        asyncio.run(bench_async(primario, secundario))
+    print()
+    verificar_failover()
+    verificar_censura()
+    with MockServer(latency=0.02, slow_ratio=0.05, slow_latency=0.3) as primario:
+        verificar_modo_hedge(primario)
+
+
+if __name__ == "__main__":
+    main()
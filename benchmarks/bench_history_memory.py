@@ -0,0 +1,134 @@
+"""Memória por turno de um histórico estilo Perplexity: lista de dicts vs History (com e sem compressão).
+
+Mede também a manutenção da janela de contexto a cada turno, que no History só
+monta dicts para as mensagens novas (o papel vem de History.role).
+"""
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.context_window import ContextWindow
+from common.history import History, Message
+
+TURNS = 10000
+WINDOW = 100  # Mensagens que continuam na janela de contexto
+VOCABULARIO = (
+    "a o de que e do da em um para é com não uma os no se na por mais as dos como mas foi ao ele "
+    "modelo resposta contexto dados pesquisa fonte resultado análise exemplo sistema usuário tempo "
+    "memória processo valor cidade governo empresa estudo relatório mercado tecnologia energia"
+).split()
+
+
+def gerar_linhas(n: int):
+    """Mensagens serializadas como chegam do log da sessão ou da API (uma linha JSON por mensagem)."""
+    rng = random.Random(0)
+    linhas = []
+    for i in range(n):
+        if i % 2 == 0:
+            mensagem = {"role": "user", "content": " ".join(rng.choices(VOCABULARIO, k=20)) + "?"}
+        else:
+            mensagem = {
+                "role": "assistant",
+                "content": " ".join(rng.choices(VOCABULARIO, k=rng.randint(120, 400))) + ".",
+                "citations": [f"https://exemplo{rng.randint(1, 50)}.com/artigo/{rng.randint(1, 10 ** 6)}" for _ in range(5)]
+            }
+        linhas.append(json.dumps(mensagem, ensure_ascii=False))
+    return linhas
+
+
+def medir(construir):
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    historico = construir()
+    duracao = time.perf_counter() - inicio
+    gc.collect()
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return historico, memoria, duracao
+
+
+def medir_janela(linhas, historico) -> tuple:
+    """Tempo de ContextWindow.advance por turno, dicts de mensagem montados no total e a janela."""
+    janela = ContextWindow()
+    montados = 0
+    to_dict = Message.to_dict
+
+    def contar(record):
+        nonlocal montados
+        montados += 1
+        return to_dict(record)
+
+    Message.to_dict = contar
+    try:
+        duracao = 0.0
+        for linha in linhas:
+            mensagem = json.loads(linha)
+            historico.append(mensagem)
+            if mensagem["role"] == "user":
+                # Como nos clientes: a janela é atualizada antes de cada requisição
+                inicio = time.perf_counter()
+                janela.advance(historico, "gpt-4")
+                duracao += time.perf_counter() - inicio
+    finally:
+        Message.to_dict = to_dict
+    return duracao / (len(linhas) // 2), montados, janela
+
+
+def main():
+    linhas = gerar_linhas(TURNS)
+
+    def lista():
+        return [json.loads(linha) for linha in linhas]
+
+    def compacto():
+        historico = History()
+        for linha in linhas:
+            historico.append(json.loads(linha))
+        return historico
+
+    def comprimido():
+        historico = compacto()
+        historico.compress_before(len(historico) - WINDOW)
+        return historico
+
+    original, antes, t_lista = medir(lista)
+    referencia = json.dumps(original, ensure_ascii=False)
+    del original
+
+    print(f"{TURNS} mensagens ({len(referencia) / 2 ** 20:.1f} MB em JSON), janela de {WINDOW} mensagens")
+    print(f"{'Representação':<34} {'bytes/turno':>12} {'total MB':>9} {'montagem':>10}")
+    print(f"{'Lista de dicts (antes)':<34} {antes / TURNS:>12.0f} {antes / 2 ** 20:>9.1f} {t_lista * 1000:>8.0f} ms")
+    for nome, construir in (("History", compacto), ("History + turnos frios comprimidos", comprimido)):
+        historico, memoria, duracao = medir(construir)
+        # O formato enviado às APIs não muda
+        assert json.dumps(historico.to_list(), ensure_ascii=False) == referencia
+        print(f"{nome:<34} {memoria / TURNS:>12.0f} {memoria / 2 ** 20:>9.1f} {duracao * 1000:>8.0f} ms")
+        del historico
+
+    t_lista, _, _ = medir_janela(linhas, [])
+    t_history, montados, janela = medir_janela(linhas, History(compress_min_chars=None))
+    # Cada mensagem vira dict uma única vez (ao ser contada); o papel vem de History.role
+    assert montados == len(janela.token_counts), (montados, len(janela.token_counts))
+    t_comprimido, montados, janela = medir_janela(linhas, History())
+    assert montados == len(janela.token_counts), (montados, len(janela.token_counts))
+    print(f"Janela de contexto (gpt-4, {janela.trims} cortes), por turno: lista {t_lista * 1e6:.0f} µs, "
+          f"History {t_history * 1e6:.0f} µs, History comprimindo os turnos que saem {t_comprimido * 1e6:.0f} µs")
+
+    historico = comprimido()
+    inicio = time.perf_counter()
+    janela = historico[-WINDOW:]
+    print(f"Fatia da janela ({len(janela)} mensagens): {(time.perf_counter() - inicio) * 1e6:.0f} µs; "
+          f"exportação completa: ", end="")
+    inicio = time.perf_counter()
+    historico.to_list()
+    print(f"{(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Compara requests.post avulso com o pool compartilhado contra o servidor mock."""
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import http_pool
+from benchmarks.mock_server import MockServer
+
+N_REQUESTS = 200
+
+
+def run(post, url: str) -> float:
+    inicio = time.perf_counter()
+    for _ in range(N_REQUESTS):
+        response = post(url, json={"contents": [{"parts": [{"text": "oi"}]}]})
+        response.raise_for_status()
+    return time.perf_counter() - inicio
+
+
+def main():
+    with MockServer() as server:
+        url = f"{server.url}/v1/models/gemini-pro:generateContent"
+
+        sem_pool = run(requests.post, url)
+        http_pool.reset_pool_stats()
+        com_pool = run(http_pool.post, url)
+        stats = http_pool.get_pool_stats(server.url)
+
+    print(f"requests.post avulso: {sem_pool * 1000 / N_REQUESTS:.2f} ms/req")
+    print(f"pool compartilhado:   {com_pool * 1000 / N_REQUESTS:.2f} ms/req")
+    print(f"pool hits/misses:     {stats['hits']}/{stats['misses']} em {stats['requests']} requisições")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Latência por imagem e pico de RSS: caminho original de process_image vs pipeline otimizado.
+
+"streaming" é o caminho de GeminiAPI: só o JPEG fica na memória e o corpo da
+requisição (com o base64 gerado em blocos) é percorrido como num envio.
+
+A imagem é gerada e cada caminho roda em um subprocesso separado: no Linux o
+pico de RSS sobrevive ao exec, então o processo pai precisa continuar pequeno.
+"""
+import base64
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import image_pipeline, streaming_body
+
+SIZE = (6000, 4000)  # Foto de câmera de 24 MP
+ITERATIONS = 5
+
+
+def original(image_path: str) -> str:
+    """Cópia do MediaHandler.process_image anterior ao pipeline otimizado."""
+    with Image.open(image_path) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        max_size = 2048
+        if max(img.size) > max_size:
+            ratio = max_size / max(img.size)
+            new_size = tuple(int(dim * ratio) for dim in img.size)
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='JPEG', quality=85)
+        img_bytes = img_byte_arr.getvalue()
+    return base64.b64encode(img_bytes).decode('utf-8')
+
+
+def otimizado(image_path: str) -> str:
+    return image_pipeline.encode_image_base64(image_path)
+
+
+def streaming(image_path: str) -> int:
+    media = streaming_body.InlineBytes(image_pipeline.encode_image_jpeg(image_path), "image/jpeg")
+    body = streaming_body.encode_json({"contents": [{"parts": [{"inline_data": media}]}]})
+    return sum(len(chunk) for chunk in body)
+
+
+def gerar_imagem(path: str) -> None:
+    canais = [Image.effect_noise(SIZE, sigma) for sigma in (40, 60, 80)]
+    Image.merge('RGB', canais).save(path, format='JPEG', quality=92)
+
+
+def executar(modo: str, image_path: str) -> None:
+    func = {"original": original, "otimizado": otimizado, "streaming": streaming}[modo]
+    inicio = time.perf_counter()
+    for _ in range(ITERATIONS):
+        func(image_path)
+    latencia = (time.perf_counter() - inicio) / ITERATIONS
+    pico_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB -> MB (Linux)
+    print(f"{modo:<10} {latencia * 1000:10.1f} ms/imagem {pico_rss:10.1f} MB pico RSS")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "foto.jpg")
+        subprocess.run([sys.executable, __file__, "gerar", path], check=True)
+        print(f"Imagem {SIZE[0]}x{SIZE[1]} ({os.path.getsize(path) / 1e6:.1f} MB), {ITERATIONS} iterações")
+        for modo in ("original", "otimizado", "streaming"):
+            subprocess.run([sys.executable, __file__, modo, path], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "gerar":
+        gerar_imagem(sys.argv[2])
+    elif len(sys.argv) == 3:
+        executar(sys.argv[1], sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,136 @@
+"""Tempo de importação e RSS dos scripts, medidos com `python -X importtime` em processos novos.
+
+Cada script é importado N vezes num interpretador limpo; o relatório mostra a
+mediana do tempo cumulativo do módulo, o pico de RSS e as dependências diretas
+mais caras. Os limites ficam em import_thresholds.json, ao lado deste arquivo,
+junto com os módulos que um script não pode importar no carregamento (ex.: os
+backends de mídia do gemini_custom_call02, carregados só no primeiro uso).
+
+    python benchmarks/bench_import_time.py                      # compara com os limites
+    python benchmarks/bench_import_time.py --write-thresholds   # regrava os limites
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "import_thresholds.json")
+
+SCRIPTS = {
+    "gemini_custom_call02": "Gemini/02 Custom request",
+    "gemini_custom_call01": "Gemini/02 Custom request",
+    "openai_chat": "OpenAi/02 Custom call",
+    "perplexity_chat": "Perplexity/02 Custom call"
+}
+
+# Executado no processo filho: importa o módulo e informa o que foi carregado
+CHILD_CODE = (
+    "import resource, sys, json; import {module}; "
+    "print(json.dumps({{'modules': sorted(sys.modules), "
+    "'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))"
+)
+
+
+def parse_importtime(stderr: str, module: str):
+    """Retorna (tempo cumulativo do módulo em µs, [(µs, dependência direta)])."""
+    diretas = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Cabeçalho
+        if name.strip() == module and not name[1:].startswith(" "):
+            return int(cumulative), diretas
+        if not name[1:].startswith(" "):
+            diretas = []  # Outro módulo de primeiro nível: recomeça
+        elif name[1:3] == "  " and not name[3:].startswith(" "):
+            diretas.append((int(cumulative), name.strip()))
+    raise RuntimeError(f"{module} não aparece na saída de -X importtime")
+
+
+def medir(module: str, pasta: str, runs: int) -> dict:
+    tempos, rss, diretas, modulos = [], [], [], []
+    for _ in range(runs):
+        resultado = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD_CODE.format(module=module)],
+            cwd=os.path.join(ROOT, pasta), capture_output=True, text=True, check=True
+        )
+        tempo, diretas = parse_importtime(resultado.stderr, module)
+        info = json.loads(resultado.stdout.strip().splitlines()[-1])
+        tempos.append(tempo)
+        rss.append(info["rss_kb"])
+        modulos = info["modules"]
+    return {
+        "import_ms": round(statistics.median(tempos) / 1000, 1),
+        "rss_mb": round(statistics.median(rss) / 1024, 1),
+        "top": sorted(diretas, reverse=True)[:5],
+        "modules": modulos
+    }
+
+
+def verificar(nome: str, medido: dict, limite: dict) -> list:
+    regressoes = []
+    if medido["import_ms"] > limite["max_import_ms"]:
+        regressoes.append(f"{nome}: importação {medido['import_ms']} ms > {limite['max_import_ms']}")
+    if medido["rss_mb"] > limite["max_rss_mb"]:
+        regressoes.append(f"{nome}: RSS {medido['rss_mb']} MB > {limite['max_rss_mb']}")
+    for proibido in limite.get("forbidden_modules", []):
+        if any(m == proibido or m.startswith(proibido + ".") for m in medido["modules"]):
+            regressoes.append(f"{nome}: importa {proibido} no carregamento")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação dos scripts")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--write-thresholds", action="store_true")
+    args = parser.parse_args()
+
+    limites = {}
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds, encoding="utf-8") as f:
+            limites = json.load(f)
+
+    resultados = {}
+    print(f"{'Script':<24} {'importação':>11} {'RSS':>9}   dependências diretas mais caras")
+    for nome, pasta in SCRIPTS.items():
+        medido = resultados[nome] = medir(nome, pasta, args.runs)
+        top = ", ".join(f"{dep} {us / 1000:.0f} ms" for us, dep in medido["top"])
+        print(f"{nome:<24} {medido['import_ms']:8.1f} ms {medido['rss_mb']:6.1f} MB   {top}")
+
+    if args.write_thresholds:
+        # Margem para a variação entre execuções; a lista de módulos proibidos é mantida
+        novos = {
+            nome: {
+                "max_import_ms": round(medido["import_ms"] * 1.5 + 20),
+                "max_rss_mb": round(medido["rss_mb"] * 1.25 + 5),
+                "forbidden_modules": limites.get(nome, {}).get("forbidden_modules", [])
+            }
+            for nome, medido in resultados.items()
+        }
+        with open(args.thresholds, "w", encoding="utf-8") as f:
+            json.dump(novos, f, indent=2)
+            f.write("\n")
+        print(f"Limites gravados em {args.thresholds}")
+        return
+
+    regressoes = [
+        regressao
+        for nome, medido in resultados.items() if nome in limites
+        for regressao in verificar(nome, medido, limites[nome])
+    ]
+    for regressao in regressoes:
+        print(f"REGRESSÃO {regressao}")
+    if regressoes:
+        sys.exit(1)
+    if limites:
+        print(f"Sem regressões em relação a {os.path.basename(args.thresholds)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Custo da camada de métricas: desligada, agregada em memória e com arquivo JSON lines.
+
+Confere também o TTFT dos caminhos em streaming com httpx (AsyncEngine.stream e
+GeminiAPI.stream_gemini) contra um servidor que envia os cabeçalhos e só depois
+de FIRST_TOKEN_DELAY o primeiro token: o TTFT é o do primeiro token, não o dos
+cabeçalhos. Um evento SSE inválido no PerplexityChat.stream_message vira erro
+registrado nas métricas, sem derrubar o chamador e sem deixar a pergunta no
+histórico.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import http_pool, metrics
+from common.providers import AsyncEngine, create_provider
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+N_TRACK = 200000
+N_CALLS = 2000
+FIRST_TOKEN_DELAY = 0.3
+
+
+def custo_track() -> float:
+    inicio = time.perf_counter()
+    for _ in range(N_TRACK):
+        with metrics.track("perplexity", "modelo") as call:
+            if call is not None:
+                call.set_usage({"prompt_tokens": 10, "completion_tokens": 5})
+    return (time.perf_counter() - inicio) / N_TRACK
+
+
+def custo_chamada(chat) -> float:
+    inicio = time.perf_counter()
+    for i in range(N_CALLS):
+        chat.conversation_history.clear()
+        chat.context_window.reset()
+        chat.request_builder.reset()
+        chat.send_message(f"pergunta {i}")
+    return (time.perf_counter() - inicio) / N_CALLS
+
+
+def verificar_ttft() -> None:
+    gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+    with MockServer(first_token_delay=FIRST_TOKEN_DELAY) as server:
+        async def chamadas():
+            engine = AsyncEngine()
+            provider = create_provider("openai", api_key="chave-de-teste", base_url=f"{server.url}/v1")
+            async for _ in engine.stream(provider, [{"role": "user", "content": "pergunta"}]):
+                pass
+            api = gemini.GeminiAPI("chave-de-teste")
+            api.base_url = f"{server.url}/v1"
+            async for _ in api.stream_gemini("pergunta"):
+                pass
+            await http_pool.aclose_async_client()
+
+        aggregate = metrics.enable_metrics()
+        asyncio.run(chamadas())
+        metrics.disable_metrics()
+    for provider in ("openai", "gemini"):
+        (_, histograms), = ((key, value) for key, value in aggregate.histograms.items() if key[0] == provider)
+        ttft = histograms["ttft"].sum
+        assert ttft >= FIRST_TOKEN_DELAY, (provider, ttft)
+        print(f"TTFT em streaming ({provider}): {ttft * 1000:.0f} ms com o primeiro token a "
+              f"{FIRST_TOKEN_DELAY * 1000:.0f} ms dos cabeçalhos")
+
+
+def verificar_streaming_invalido(perplexity, server: MockServer) -> None:
+    chat = perplexity.PerplexityChat()
+    aggregate = metrics.enable_metrics()
+    with MockServer(malformed_stream=True) as quebrado, contextlib.redirect_stdout(io.StringIO()):
+        chat.url = f"{quebrado.url}/chat/completions"
+        list(chat.stream_message("pergunta"))
+    metrics.disable_metrics()
+    erros = sum(value["errors"] for key, value in aggregate.counters.items() if key[0] == "perplexity")
+    assert "error" in chat.last_response and len(chat.conversation_history) == 0, chat.last_response
+    assert erros == 1, aggregate.counters
+
+    # O próximo turno não pode levar a pergunta descartada
+    chat.url = f"{server.url}/chat/completions"
+    list(chat.stream_message("outra pergunta"))
+    enviadas = [(m["role"], m["content"]) for m in json.loads(chat.request_builder.messages_json())[1:]]
+    assert enviadas == [("user", "outra pergunta")], enviadas
+    print(f"Evento SSE inválido: erro registrado ({erros}), pergunta retirada do histórico")
+
+
+def main():
+    os.environ["PERPLEXITY_API_KEY"] = "chave-de-teste"
+    perplexity = load_script("Perplexity/02 Custom call/perplexity_chat.py", "perplexity_chat")
+
+    with MockServer() as server, tempfile.TemporaryDirectory() as pasta:
+        chat = perplexity.PerplexityChat()
+        chat.url = f"{server.url}/chat/completions"
+        custo_chamada(chat)  # Aquecimento (conexão e imports)
+
+        modos = [
+            ("desligada", lambda: None),
+            ("agregada", lambda: metrics.enable_metrics()),
+            ("agregada + JSONL", lambda: metrics.enable_metrics(metrics.JsonlSink(os.path.join(pasta, "m.jsonl"))))
+        ]
+        print(f"{'Métricas':<18} {'track()':>10} {'send_message':>14}")
+        for nome, ligar in modos:
+            metrics.disable_metrics()
+            ligar()
+            print(f"{nome:<18} {custo_track() * 1e6:8.2f} µs {custo_chamada(chat) * 1e6:11.1f} µs")
+        metrics.disable_metrics()
+        verificar_streaming_invalido(perplexity, server)
+    verificar_ttft()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Extração de texto de um PDF grande gerado: serial, paralela e em blocos (streaming)."""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.scripts import load_script
+
+PAGES = 600
+LINES_PER_PAGE = 60
+
+
+def gerar_pdf(path: str) -> None:
+    doc = fitz.open()
+    linha = "Cláusula contratual de exemplo com texto suficiente para preencher a linha. "
+    for page_number in range(PAGES):
+        page = doc.new_page()
+        texto = "\n".join(f"{page_number}.{i} {linha}" for i in range(LINES_PER_PAGE))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), texto, fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def medir(func):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = func()
+    tempo = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, tempo, pico
+
+
+def main():
+    gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+    handler = gemini.MediaHandler()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "contrato.pdf")
+        gerar_pdf(path)
+
+        serial, t_serial, m_serial = medir(lambda: handler.process_pdf(path))
+        paralelo, t_paralelo, m_paralelo = medir(lambda: handler.process_pdf(path, parallel=True))
+        assert serial == paralelo
+
+        def consumir_blocos():
+            total = 0
+            for bloco in handler.iter_pdf(path, pages_per_chunk=20):
+                total += len(bloco)
+            return total
+
+        _, t_blocos, m_blocos = medir(consumir_blocos)
+
+    print(f"PDF com {PAGES} páginas, {len(serial) / 1e6:.1f} M caracteres, {os.cpu_count()} CPUs")
+    print(f"serial:           {t_serial:6.2f} s   pico Python {m_serial / 1e6:7.1f} MB")
+    print(f"paralelo:         {t_paralelo:6.2f} s   pico Python {m_paralelo / 1e6:7.1f} MB")
+    print(f"blocos (stream):  {t_blocos:6.2f} s   pico Python {m_blocos / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
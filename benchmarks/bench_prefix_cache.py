@@ -0,0 +1,58 @@
+"""Quanto do prompt o cache de prefixo do provedor reaproveita numa sessão longa, por fração de corte da janela."""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "chave-de-teste")
+from common.context_window import ContextWindow, message_tokens
+from benchmarks.bench_suite import load_script
+
+TURNS = 400
+MODEL = "gpt-4"  # Contexto de 8192 tokens: a janela começa a deslizar cedo
+# Regras do cache automática da OpenAI: prefixos a partir de 1024 tokens, em blocos de 128
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+VOCABULARIO = "modelo resposta contexto dados pesquisa fonte resultado análise exemplo sistema usuário".split()
+
+
+def tokens_em_cache(anterior, atual) -> int:
+    """Tokens do maior prefixo de mensagens idênticas entre duas requisições seguidas."""
+    prefixo = 0
+    for a, b in zip(anterior, atual):
+        if a != b:
+            break
+        prefixo += message_tokens(b)
+    if prefixo < CACHE_MIN_TOKENS:
+        return 0
+    return prefixo // CACHE_INCREMENT * CACHE_INCREMENT
+
+
+def simular(openai_chat, trim_ratio: float):
+    rng = random.Random(0)
+    chat = openai_chat.OpenAIChat()
+    chat.current_config['model'] = MODEL
+    chat.context_window = ContextWindow(trim_ratio=trim_ratio)
+    enviados = em_cache = 0
+    anterior = []
+    for _ in range(TURNS):
+        chat._add_message({"role": "user", "content": " ".join(rng.choices(VOCABULARIO, k=40))})
+        mensagens = chat.create_chat_params(chat.conversation_history)["messages"]
+        enviados += sum(message_tokens(m) for m in mensagens)
+        em_cache += tokens_em_cache(anterior, mensagens)
+        anterior = list(mensagens)  # O IncrementalRequestBuilder reaproveita a mesma lista
+        chat._add_message({"role": "assistant", "content": " ".join(rng.choices(VOCABULARIO, k=rng.randint(100, 400)))})
+    return enviados, em_cache, chat.context_window.trims
+
+
+def main():
+    openai_chat = load_script("OpenAi/02 Custom call/openai_chat.py", "openai_chat")
+    print(f"{TURNS} turnos com {MODEL}")
+    print(f"{'trim_ratio':>10} {'tokens enviados':>16} {'em cache':>9} {'sem cache':>10} {'cortes':>7}")
+    for ratio in (1.0, 0.9, 0.75, 0.5):
+        enviados, em_cache, cortes = simular(openai_chat, ratio)
+        print(f"{ratio:>10} {enviados:>16} {em_cache / enviados:>9.0%} {enviados - em_cache:>10} {cortes:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Milhares de prompts pelas APIs de lote (OpenAI e Anthropic) no servidor mock: chamadas HTTP, tempo e retomada."""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.provider_batch import ProviderBatchRunner
+from benchmarks.bench_suite import rss_mb
+from benchmarks.mock_server import MockServer
+
+OPENAI_REQUESTS = 30000
+ANTHROPIC_REQUESTS = 20000
+MAX_REQUESTS = 10000  # Por lote, para exercitar a divisão em vários lotes
+BATCH_DELAY = 1.0
+ERROR_RATE = 0.01
+
+
+class Queda(Exception):
+    pass
+
+
+class RunnerInterrompido(ProviderBatchRunner):
+    """Cai ao receber o primeiro lote pronto, depois de todos os envios."""
+
+    def _collect(self, *args):
+        raise Queda()
+
+
+class RunnerQuedaNaSaida(ProviderBatchRunner):
+    """Cai no meio da cópia dos resultados do primeiro lote para a saída."""
+
+    def _merge(self, state, name):
+        path = self._results_path(name)
+        if name != "rejected" and name not in state["merged"]:
+            with open(path, "rb") as results, open(self.output_path, "ab") as out:
+                out.write(results.read(os.path.getsize(path) // 2))
+            raise Queda()
+        super()._merge(state, name)
+
+
+def contar_registros(path: str):
+    with open(path, encoding="utf-8") as f:
+        registros = [json.loads(linha) for linha in f]
+    return len(registros), len({r["id"] for r in registros})
+
+
+def gerar_entrada(path: str, base_url: str) -> int:
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(OPENAI_REQUESTS):
+            item = {"id": f"oa-{i}", "provider": "openai", "model": "gpt-4o-mini", "base_url": base_url,
+                    "config": {"temperature": 0}, "prompt": f"Resuma o documento {i} em uma frase."}
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        for i in range(ANTHROPIC_REQUESTS):
+            item = {"id": f"an-{i}", "provider": "anthropic", "base_url": base_url,
+                    "prompt": f"Classifique o chamado {i} por urgência."}
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        # Linhas inválidas vão direto para a saída, sem ir ao provedor
+        f.write(json.dumps({"id": "oa-0", "provider": "openai", "base_url": base_url, "prompt": "duplicado"}) + "\n")
+        f.write(json.dumps({"id": "px", "provider": "perplexity", "prompt": "sem API de lote"}) + "\n")
+        # Fora do padrão de custom_id da Anthropic: derrubaria o lote inteiro com 400
+        f.write(json.dumps({"id": "an inválido", "provider": "anthropic", "base_url": base_url, "prompt": "x"}) + "\n")
+    return OPENAI_REQUESTS + ANTHROPIC_REQUESTS + 3
+
+
+def main():
+    os.environ.update(OPENAI_API_KEY="chave-de-teste", ANTHROPIC_API_KEY="chave-de-teste")
+    with MockServer(batch_delay=BATCH_DELAY, error_rate=ERROR_RATE) as server, tempfile.TemporaryDirectory() as pasta:
+        entrada = os.path.join(pasta, "entrada.jsonl")
+        saida = os.path.join(pasta, "saida.jsonl")
+        total = gerar_entrada(entrada, f"{server.url}/v1")
+
+        rss_antes = rss_mb()
+        inicio = time.perf_counter()
+        runner = ProviderBatchRunner(entrada, saida, poll_interval=0.2, max_requests=MAX_REQUESTS)
+        stats = runner.run()
+        duracao = time.perf_counter() - inicio
+        rss = rss_mb() - rss_antes
+
+        with open(saida, encoding="utf-8") as f:
+            registros = [json.loads(linha) for linha in f]
+        ids = {r["id"] for r in registros}
+        assert len(registros) == total and len(ids) == total - 1, (len(registros), len(ids))
+        assert any(r["id"] == "an inválido" and "error" in r for r in registros)
+        assert all(r["line"] is not None for r in registros)
+        assert all(r["content"] == "ok" for r in registros if "error" not in r)
+
+        print(f"{total} requisições em {stats['batches']} lotes: {stats['ok']} ok, {stats['error']} com erro "
+              f"(erro injetado em {ERROR_RATE:.0%}, 3 inválidas)")
+        print(f"Chamadas HTTP ao provedor: {server.httpd.requests} (uma por requisição seriam {total - 3}); "
+              f"tempo total {duracao:.1f} s com lotes de {BATCH_DELAY:.0f} s; "
+              f"RSS +{rss:.0f} MB (inclui o servidor mock, que guarda os lotes)")
+
+        # Retomada: interrompido depois do envio, o segundo processo só acompanha e baixa
+        saida = os.path.join(pasta, "saida-retomada.jsonl")
+        try:
+            RunnerInterrompido(entrada, saida, poll_interval=0.2, max_requests=MAX_REQUESTS).run()
+        except Queda:
+            pass
+        enviados = server.httpd.requests
+        stats = ProviderBatchRunner(entrada, saida, poll_interval=0.2).run()
+        retomados, ids_retomados = contar_registros(saida)
+        assert stats["batches"] == 0 and retomados == total and ids_retomados == total - 1, (stats, retomados)
+        print(f"Retomada: {stats['batches']} lotes reenviados, {retomados} registros, "
+              f"{server.httpd.requests - enviados} chamadas só de consulta e download")
+
+        # Queda no meio da cópia para a saída: a retomada descarta a parte copiada, sem duplicar
+        saida = os.path.join(pasta, "saida-queda.jsonl")
+        try:
+            RunnerQuedaNaSaida(entrada, saida, poll_interval=0.2, max_requests=MAX_REQUESTS).run()
+        except Queda:
+            pass
+        ProviderBatchRunner(entrada, saida, poll_interval=0.2).run()
+        registros, ids = contar_registros(saida)
+        assert registros == total and ids == total - 1, (registros, ids)
+        print(f"Queda durante a gravação da saída: {registros} registros depois da retomada, nenhum duplicado")
+
+
+if __name__ == "__main__":
+    main()
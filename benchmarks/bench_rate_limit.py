@@ -0,0 +1,131 @@
+"""Fan-out contra um servidor que aceita só 8 requisições simultâneas (o resto recebe 429).
+
+Sem limitador, cada 429 vira uma resposta de erro. Com o RateLimiter, a
+primeira rajada sai sem limite (não há 429 ainda); a partir do primeiro 429 o
+limite AIMD converge para a capacidade do servidor e as requisições
+rejeitadas são repetidas respeitando o Retry-After. Confere também que erros
+de transporte são repetidos e reduzem o limite e que respostas 4xx não contam
+como sucesso.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import http_pool
+from common.rate_limit import RateLimiter, get_limiter
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+N_REQUESTS = 200
+SERVER_CAPACITY = 8
+LATENCY = 0.05
+
+
+def relatorio(nome: str, ok: int, duracao: float, server: MockServer) -> None:
+    print(f"{nome:<34} {ok:>3}/{N_REQUESTS} ok   {duracao:6.2f} s   "
+          f"{ok / duracao:6.1f} req/s   429 no servidor: {server.httpd.throttled}")
+    server.httpd.throttled = 0
+
+
+async def sem_limitador(url: str) -> int:
+    client = http_pool.get_async_client()
+    respostas = await asyncio.gather(*(
+        client.post(url, json={"contents": [{"parts": [{"text": f"pergunta {i}"}]}]}) for i in range(N_REQUESTS)
+    ))
+    return sum(resposta.status_code == 200 for resposta in respostas)
+
+
+async def gemini_com_limitador(api) -> int:
+    respostas = await asyncio.gather(*(api.chamar_gemini(f"pergunta {i}") for i in range(N_REQUESTS)))
+    return sum(not resposta.startswith("Erro") for resposta in respostas)
+
+
+class RespostaFalsa:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+
+    def close(self) -> None:
+        pass
+
+
+def falhas_e_depois(erros, status: int = 200):
+    """send() que levanta os `erros` em sequência e depois responde com `status`."""
+    pendentes = list(erros)
+
+    def send():
+        if pendentes:
+            raise pendentes.pop(0)
+        return RespostaFalsa(status)
+    return send
+
+
+def verificar_transporte() -> None:
+    limiter = RateLimiter(base_delay=0.01)
+    erros = [requests.exceptions.ConnectionError("recusada"), requests.exceptions.ReadTimeout("timeout")]
+    assert limiter.call(falhas_e_depois(erros)).status_code == 200
+    assert limiter.stats["transport_errors"] == 2 and limiter.stats["retries"] == 2, limiter.stats
+    assert limiter.concurrency.limit < float("inf"), "erro de transporte deveria reduzir o limite"
+
+    limiter = RateLimiter(base_delay=0.01, max_retries=1)
+    send = falhas_e_depois([httpx.ConnectTimeout("timeout")] * 3)
+
+    async def enviar():
+        return send()
+    try:
+        asyncio.run(limiter.acall(enviar))
+        raise AssertionError("deveria desistir após max_retries")
+    except httpx.ConnectTimeout:
+        pass
+    assert limiter.stats["transport_errors"] == 2, limiter.stats
+
+    # 4xx: sem retentativa e sem aumentar o limite
+    limiter = RateLimiter(initial_concurrency=4)
+    for _ in range(20):
+        assert limiter.call(falhas_e_depois([], 400)).status_code == 400
+    assert limiter.concurrency.limit == 4 and limiter.stats["retries"] == 0, limiter.concurrency.limit
+    print("Erros de transporte repetidos com redução do limite; 4xx não contam como sucesso")
+
+
+def main():
+    verificar_transporte()
+    os.environ["PERPLEXITY_API_KEY"] = "chave-de-teste"
+    gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+    perplexity = load_script("Perplexity/02 Custom call/perplexity_chat.py", "perplexity_chat")
+
+    with MockServer(latency=LATENCY, max_inflight=SERVER_CAPACITY, retry_after=0.05) as server:
+        url = f"{server.url}/v1/models/gemini-pro:generateContent?key=chave-de-teste"
+        inicio = time.perf_counter()
+        ok = asyncio.run(sem_limitador(url))
+        relatorio("Gemini sem limitador", ok, time.perf_counter() - inicio, server)
+
+        api = gemini.GeminiAPI("chave-de-teste")
+        api.base_url = f"{server.url}/v1"
+        inicio = time.perf_counter()
+        ok = asyncio.run(gemini_com_limitador(api))
+        relatorio("GeminiAPI.chamar_gemini", ok, time.perf_counter() - inicio, server)
+        limiter = get_limiter("gemini", "gemini-pro")
+        print(f"  limite AIMD final: {limiter.concurrency.limit:.1f}, estatísticas: {limiter.stats}")
+
+        def perguntar(i: int) -> dict:
+            chat = perplexity.PerplexityChat()
+            chat.url = f"{server.url}/chat/completions"
+            return chat.send_message(f"pergunta {i}")
+
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            inicio = time.perf_counter()
+            respostas = list(executor.map(perguntar, range(N_REQUESTS)))
+            ok = sum("error" not in resposta for resposta in respostas)
+            relatorio("PerplexityChat.send_message (32 th)", ok, time.perf_counter() - inicio, server)
+        limiter = get_limiter("perplexity", perplexity.PerplexityChat().current_config['model'])
+        print(f"  limite AIMD final: {limiter.concurrency.limit:.1f}, estatísticas: {limiter.stats}")
+
+
+if __name__ == "__main__":
+    main()
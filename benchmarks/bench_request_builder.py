@@ -0,0 +1,57 @@
+"""Custo por turno da montagem do corpo da requisição conforme o histórico cresce.
+
+Compara a montagem original ([sistema] + histórico e json.dumps de tudo a cada
+turno) com o IncrementalRequestBuilder usado por PerplexityChat.
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.request_builder import IncrementalRequestBuilder
+
+TURNS = 10000
+CHECKPOINTS = (100, 1000, 5000, 10000)
+SYSTEM = "Você é um assistente prestativo. Responda sempre em português do Brasil de forma clara e natural."
+PARAMS = {"model": "llama-3.1-sonar-small-128k-online", "temperature": 0.2, "top_p": 0.9}
+
+
+def original(history):
+    system_message = {"role": "system", "content": SYSTEM}
+    body = dict(PARAMS, messages=[system_message] + history)
+    return json.dumps(body).encode()
+
+
+def incremental(builder, history):
+    body = dict(PARAMS, messages=builder.sync(history, 0, SYSTEM))
+    return builder.build_body(body)
+
+
+def main():
+    history = []
+    builder = IncrementalRequestBuilder()
+    tempos = {"original": {}, "incremental": {}}
+
+    for turn in range(1, TURNS + 1):
+        history.append({"role": "user", "content": f"Pergunta número {turn} sobre a conversa até aqui?"})
+        history.append({"role": "assistant", "content": f"Resposta número {turn}, com algum texto a mais para pesar."})
+
+        if turn in CHECKPOINTS:
+            inicio = time.perf_counter()
+            esperado = original(history)
+            tempos["original"][turn] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        corpo = incremental(builder, history)
+        if turn in CHECKPOINTS:
+            tempos["incremental"][turn] = time.perf_counter() - inicio
+            assert json.loads(corpo) == json.loads(esperado)
+
+    print(f"{'turnos':>8} {'original (ms)':>15} {'incremental (ms)':>18}")
+    for turn in CHECKPOINTS:
+        print(f"{turn:>8} {tempos['original'][turn] * 1000:>15.3f} {tempos['incremental'][turn] * 1000:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Latência de uma chamada com cache (memória e SQLite) contra uma chamada ao servidor mock."""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.response_cache import make_key
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+N_CALLS = 1000
+
+
+def medir(func, n: int = N_CALLS) -> float:
+    inicio = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - inicio) / n
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["AI_CACHE_DIR"] = cache_dir
+        gemini = load_script("Gemini/02 Custom request/gemini_custom_call01.py", "gemini_custom_call01")
+        from common.response_cache import get_shared_cache
+
+        with MockServer(latency=0.2) as server:
+            api = gemini.GeminiAPI("chave-de-teste")
+            api.base_url = f"{server.url}/v1"
+            api.update_config(temperature=0.0, cache_responses=True)
+
+            sem_cache = medir(lambda: api.chamar_gemini("pergunta inédita"), n=1)
+            memoria = medir(lambda: api.chamar_gemini("pergunta inédita"))
+
+            cache = get_shared_cache()
+            cache._memory.clear()  # Força a leitura da camada SQLite
+            inicio = time.perf_counter()
+            api.chamar_gemini("pergunta inédita")
+            disco = time.perf_counter() - inicio
+
+        print(f"sem cache (mock com 200 ms): {sem_cache * 1e3:10.2f} ms")
+        print(f"cache em memória:            {memoria * 1e6:10.2f} µs")
+        print(f"cache SQLite:                {disco * 1e6:10.2f} µs")
+        print(f"estatísticas: {cache.get_stats()}")
+        verificar_async(cache)
+        cache.close()
+
+
+def verificar_async(cache) -> None:
+    """aget: a camada SQLite é consultada fora do thread do loop de eventos."""
+    threads = []
+    consultar = cache._get_disk
+    cache._get_disk = lambda key: threads.append(threading.get_ident()) or consultar(key)
+    cache._memory.clear()
+
+    async def ler() -> int:
+        await cache.aget(make_key("inexistente"))
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(ler())
+    del cache._get_disk
+    assert threads and loop_thread not in threads, (threads, loop_thread)
+    print("aget: camada SQLite consultada fora do loop de eventos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Latência de busca do cache semântico com 1M de entradas (IVF vs busca exaustiva), recall, persistência
+e falsos acertos em pares com negação ou argumentos trocados."""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.semantic_cache import SemanticCache
+from benchmarks.bench_suite import rss_mb
+
+NAMESPACE = "gpt-4o-mini"
+BATCH = 50000
+QUERIES = 500
+VOCABULARIO = [f"termo{i}" for i in range(30000)]
+VAZIAS = "como qual o a de da do para em the how what is".split()
+
+# Perguntas de respostas diferentes que o embedding léxico aproxima (não podem casar)
+FALSOS = [
+    ("Is it safe to take ibuprofen with alcohol?", "Is it safe to take ibuprofen without alcohol?"),
+    ("É seguro tomar ibuprofeno com álcool?", "É seguro tomar ibuprofeno sem álcool?"),
+    ("Should I use async here?", "Should I not use async here?"),
+    ("Can I delete this file?", "Can't I delete this file?"),
+    ("How do I convert a list to a set in Python?", "How do I convert a set to a list in Python?"),
+    ("How to convert a list to a set", "How to convert a set to a list"),
+    ("Como converter uma lista em conjunto?", "Como converter um conjunto em lista?"),
+]
+# Reformulações da mesma pergunta (precisam casar)
+VERDADEIROS = [
+    ("How do I reverse a string in Python?", "how do i reverse a string in python"),
+    ("Qual é a capital da França?", "qual a capital da franca?"),
+    ("How can I sort a dictionary by value in Python?", "Python: how to sort a dictionary by value"),
+]
+
+
+def pergunta(rng: random.Random) -> str:
+    palavras = rng.choices(VOCABULARIO, k=rng.randint(5, 9))
+    for _ in range(3):
+        palavras.insert(rng.randrange(len(palavras) + 1), rng.choice(VAZIAS))
+    return " ".join(palavras) + "?"
+
+
+def reformular(texto: str, rng: random.Random) -> str:
+    """Mesma pergunta com outra caixa, pontuação e palavras vazias."""
+    palavras = [p for p in texto.rstrip("?").split() if p not in VAZIAS]
+    palavras.insert(rng.randrange(len(palavras) + 1), rng.choice(VAZIAS))
+    return " ".join(palavras).capitalize() + " ?!"
+
+
+def percentis(amostras):
+    ms = np.array(amostras) * 1000
+    return f"p50 {np.percentile(ms, 50):6.2f} ms   p99 {np.percentile(ms, 99):6.2f} ms"
+
+
+def medir_buscas(cache: SemanticCache, consultas):
+    latencias, resultados = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados.append(cache.lookup(consulta, NAMESPACE))
+        latencias.append(time.perf_counter() - inicio)
+    return latencias, resultados
+
+
+def verificar_pares() -> None:
+    cache = SemanticCache()
+    for pares, esperado in ((FALSOS, False), (VERDADEIROS, True)):
+        for original, consulta in pares:
+            cache.clear()
+            cache.set(original, "resposta", NAMESPACE)
+            match = cache.lookup(consulta, NAMESPACE)
+            assert (match is not None) == esperado, (original, consulta, match)
+    print(f"Pares de negação/ordem: 0/{len(FALSOS)} falsos acertos; "
+          f"reformulações {len(VERDADEIROS)}/{len(VERDADEIROS)} (limiar {cache.threshold})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--persist-entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    verificar_pares()
+    rng = random.Random(0)
+    cache = SemanticCache(max_entries=args.entries)
+    rss_antes = rss_mb()
+    amostra = []
+    inicio = time.perf_counter()
+    for base in range(0, args.entries, BATCH):
+        itens = [(pergunta(rng), f"resposta {base + i}") for i in range(min(BATCH, args.entries - base))]
+        amostra += rng.sample(itens, max(1, QUERIES * len(itens) // args.entries))
+        cache.set_many(itens, NAMESPACE)
+    carga = time.perf_counter() - inicio
+    print(f"{len(cache)} entradas em {carga:.0f} s ({cache.nlist} listas, nprobe {cache.nprobe}), "
+          f"RSS +{rss_mb() - rss_antes:.0f} MB")
+
+    reformuladas = [reformular(prompt, rng) for prompt, _ in amostra]
+    latencias, resultados = medir_buscas(cache, reformuladas)
+    acertos = sum(r is not None and r["value"] == valor for r, (_, valor) in zip(resultados, amostra))
+    print(f"Reformulações (IVF):       {percentis(latencias)}   acertos {acertos}/{len(amostra)}")
+
+    novas = [pergunta(rng) for _ in range(QUERIES)]
+    latencias, resultados = medir_buscas(cache, novas)
+    falsos = sum(r is not None for r in resultados)
+    print(f"Perguntas novas (IVF):     {percentis(latencias)}   falsos acertos {falsos}/{len(novas)}")
+
+    # Busca exaustiva (todas as listas) como referência de latência e de recall
+    nprobe = cache.nprobe
+    cache.nprobe = cache.nlist
+    latencias, exatos = medir_buscas(cache, reformuladas[:20])
+    cache.nprobe = nprobe
+    _, aproximados = medir_buscas(cache, reformuladas[:20])
+    recall = sum(
+        (e is None and a is None) or (e is not None and a is not None and e["value"] == a["value"])
+        for e, a in zip(exatos, aproximados)
+    )
+    print(f"Busca exaustiva:           {percentis(latencias)}   recall do IVF {recall}/{len(exatos)}")
+    del cache
+
+    with tempfile.TemporaryDirectory() as pasta:
+        path = os.path.join(pasta, "semantic.sqlite3")
+        itens = [(pergunta(rng), {"content": f"resposta {i}", "citations": []}) for i in range(args.persist_entries)]
+        cache = SemanticCache(path, max_entries=args.persist_entries)
+        inicio = time.perf_counter()
+        cache.set_many(itens, NAMESPACE)
+        gravacao = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        cache.close()
+        snapshot = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        cache = SemanticCache(path, max_entries=args.persist_entries)
+        abertura = time.perf_counter() - inicio
+        assert cache.get(itens[7][0], NAMESPACE) == itens[7][1]
+        inicio = time.perf_counter()
+        for prompt, valor in itens[:1000]:
+            cache.set(reformular(prompt, rng) + " agora", valor, NAMESPACE)
+        insercao = (time.perf_counter() - inicio) / 1000
+        eviccoes = cache.get_stats()["evictions"]
+        cache._db.close()
+        cache._db = None  # Sem save(): o snapshot fica desatualizado
+
+        inicio = time.perf_counter()
+        cache = SemanticCache(path, max_entries=args.persist_entries)
+        reconstrucao = time.perf_counter() - inicio
+        print(f"Persistência ({args.persist_entries} entradas): gravação {gravacao:.1f} s, snapshot {snapshot:.1f} s, "
+              f"abertura pelo snapshot {abertura:.2f} s, reconstrução pelo banco {reconstrucao:.1f} s")
+        print(f"set() com LRU cheio: {insercao * 1000:.2f} ms por entrada, evicções {eviccoes}")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
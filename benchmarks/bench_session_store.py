@@ -0,0 +1,60 @@
+"""Custo de salvar uma conversa de 10k turnos: reescrita do JSON inteiro vs log append-only."""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.session_store import SessionStore
+
+TURNS = 10000
+CONTENT = "Uma resposta típica de assistente, com algumas frases de explicação. " * 8
+
+
+def mensagens(n: int):
+    for i in range(n):
+        yield {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i} {CONTENT}"}
+
+
+def main():
+    historico = list(mensagens(TURNS))
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # Antes: cada 'save' regrava o histórico inteiro com indent=2
+        path = os.path.join(pasta, "conversation.json")
+        inicio = time.perf_counter()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(historico, f, ensure_ascii=False, indent=2)
+        reescrita = time.perf_counter() - inicio
+
+        store = SessionStore(pasta)
+        session = store.open()
+        inicio = time.perf_counter()
+        for mensagem in historico:
+            session.append(mensagem)
+        por_turno = (time.perf_counter() - inicio) / TURNS
+        session.close()
+
+        inicio = time.perf_counter()
+        retomada = store.open(session.id)
+        carga = time.perf_counter() - inicio
+        assert retomada.messages == historico
+
+        retomada.clear()
+        retomada.extend(historico[-100:])
+        inicio = time.perf_counter()
+        retomada.compact()
+        compactacao = time.perf_counter() - inicio
+        tamanho = os.path.getsize(retomada.path)
+        retomada.close()
+
+    print(f"Conversa de {TURNS} turnos ({len(json.dumps(historico)) / 2 ** 20:.1f} MB)")
+    print(f"Reescrita do JSON (save antigo):    {reescrita * 1000:8.1f} ms por save")
+    print(f"Log append-only:                     {por_turno * 1e6:8.1f} µs por turno")
+    print(f"Retomar a sessão (replay do log):    {carga * 1000:8.1f} ms")
+    print(f"Compactar após clear (100 restantes): {compactacao * 1000:7.1f} ms, {tamanho / 1024:.0f} KB no disco")
+
+
+if __name__ == "__main__":
+    main()
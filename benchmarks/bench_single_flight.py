@@ -0,0 +1,77 @@
+"""Rajada de requisições idênticas simultâneas, com e sem coalescência (single-flight)."""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.bench_suite import load_script
+from benchmarks.mock_server import MockServer
+
+WORKERS = 64
+LATENCY = 0.2
+CHUNK_DELAY = 0.01
+PROMPT = "O que aconteceu hoje?"
+
+
+def medir(server: MockServer, rodada) -> tuple:
+    antes = server.httpd.requests
+    inicio = time.perf_counter()
+    respostas = rodada()
+    duracao = time.perf_counter() - inicio
+    assert len(set(respostas)) == 1, set(respostas)
+    return server.httpd.requests - antes, duracao
+
+
+def main():
+    with MockServer(latency=LATENCY, chunk_delay=CHUNK_DELAY, reply_text="uma resposta em vários trechos") as server:
+        os.environ.update(PERPLEXITY_API_KEY="chave-de-teste")
+        perplexity = load_script("Perplexity/02 Custom call/perplexity_chat.py", "perplexity_chat")
+        gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+
+        def perplexity_rodada(coalescer: bool, stream: bool):
+            def enviar(_):
+                chat = perplexity.PerplexityChat()
+                chat.url = f"{server.url}/chat/completions"
+                chat.current_config['coalesce_requests'] = coalescer
+                if stream:
+                    return "".join(chat.stream_message(PROMPT))
+                return chat.send_message(PROMPT)['content']
+
+            def rodada():
+                with ThreadPoolExecutor(WORKERS) as executor:
+                    return list(executor.map(enviar, range(WORKERS)))
+            return rodada
+
+        def gemini_rodada(coalescer: bool, stream: bool):
+            api = gemini.GeminiAPI("chave-de-teste")
+            api.base_url = f"{server.url}/v1"
+            api.update_config(coalesce_requests=coalescer)
+
+            async def enviar():
+                if stream:
+                    return "".join([parte async for parte in api.stream_gemini(PROMPT)])
+                return await api.chamar_gemini(PROMPT)
+
+            async def todas():
+                return await asyncio.gather(*(enviar() for _ in range(WORKERS)))
+            return lambda: asyncio.run(todas())
+
+        print(f"{WORKERS} requisições idênticas simultâneas, latência do servidor {LATENCY * 1000:.0f} ms")
+        print(f"{'Cliente':<34} {'sem coalescência':>22} {'com coalescência':>22}")
+        for nome, montar in (
+            ("PerplexityChat.send_message", lambda c: perplexity_rodada(c, False)),
+            ("PerplexityChat.stream_message", lambda c: perplexity_rodada(c, True)),
+            ("GeminiAPI.chamar_gemini", lambda c: gemini_rodada(c, False)),
+            ("GeminiAPI.stream_gemini", lambda c: gemini_rodada(c, True)),
+        ):
+            colunas = []
+            for coalescer in (False, True):
+                chamadas, duracao = medir(server, montar(coalescer))
+                colunas.append(f"{chamadas:>4} chamadas {duracao * 1000:>6.0f} ms")
+            print(f"{nome:<34} {colunas[0]:>22} {colunas[1]:>22}")
+
+
+if __name__ == "__main__":
+    main()
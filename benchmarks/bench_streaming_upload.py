@@ -0,0 +1,107 @@
+"""Pico de RSS ao enviar mídia grande ao Gemini: JSON montado na memória vs corpo em streaming vs File API.
+
+Cada envio roda em um subprocesso; o servidor mock fica no processo pai. O pico
+vem de VmHWM, que é zerado no exec: o ru_maxrss herdaria o pico do pai, que
+cresce com os corpos recebidos pelo mock.
+"""
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.bench_suite import load_script, rss_mb
+from benchmarks.mock_server import MockServer
+
+SIZES_MB = (16, 64, 192)
+MODES = ("original", "streaming", "file_api")
+
+
+def pico_rss_mb() -> float:
+    """Pico de RSS deste processo em MB (VmHWM no Linux; senão, ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def gerar_arquivo(path: str, size_mb: int) -> None:
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1 << 20))
+
+
+async def enviar(modo: str, path: str, url: str) -> str:
+    from common import gemini_files, http_pool
+    from common.streaming_body import InlineMedia
+
+    gemini = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+    api = gemini.GeminiAPI("chave-de-teste")
+    api.base_url = f"{url}/v1"
+    api.files_base_url = url
+    http_pool.get_async_client()
+
+    if modo == "original":
+        # Caminho anterior: base64 dentro do dict, json.dumps e o corpo inteiro em bytes
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode("utf-8")
+        payload = json.dumps({"contents": [{"parts": [
+            {"text": "Transcreva o áudio"}, {"inline_data": {"mime_type": "audio/wav", "data": data}}
+        ]}]}).encode("utf-8")
+        response = await http_pool.get_async_client().post(
+            f"{api.base_url}/models/gemini-pro-vision:generateContent?key=chave-de-teste",
+            headers={"Content-Type": "application/json"}, content=payload
+        )
+        response.raise_for_status()
+        return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+    if modo == "streaming":
+        # Inline acima do limite real da API só para medir como a memória escala
+        part = {"inline_data": InlineMedia(path, "audio/wav")}
+    else:
+        part = gemini_files.file_part(
+            await gemini_files.upload_file(path, api.api_key, "audio/wav", base_url=api.files_base_url)
+        )
+    return await api.chamar_gemini({"prompt": "Transcreva o áudio", "part": part}, gemini.ContentType.MEDIA)
+
+
+def executar(modo: str, path: str, url: str) -> None:
+    loop = asyncio.new_event_loop()
+    inicial = rss_mb()
+    inicio = time.perf_counter()
+    resposta = loop.run_until_complete(enviar(modo, path, url))
+    duracao = time.perf_counter() - inicio
+    assert resposta == "ok", resposta
+    pico = pico_rss_mb()
+    tamanho = os.path.getsize(path) / 2 ** 20
+    print(f"{tamanho:>8.0f} {modo:<10} {duracao:>8.2f} s {pico:>10.0f} MB {max(pico - inicial, 0):>+10.0f} MB")
+
+
+def main():
+    with MockServer() as server, tempfile.TemporaryDirectory() as pasta:
+        print(f"{'MB':>8} {'modo':<10} {'tempo':>10} {'pico RSS':>13} {'acréscimo':>13}")
+        for size_mb in SIZES_MB:
+            path = os.path.join(pasta, f"audio-{size_mb}.wav")
+            gerar_arquivo(path, size_mb)
+            for modo in MODES:
+                subprocess.run([sys.executable, __file__, modo, path, server.url], check=True)
+            os.remove(path)
+        recebidos = [tamanho for _, tamanho in server.httpd.media if isinstance(tamanho, int)]
+        assert len(recebidos) == 2 * len(SIZES_MB), server.httpd.media
+        assert all(f["received"] == f["size"] for f in server.httpd.uploads.values())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        executar(*sys.argv[1:])
+    else:
+        main()
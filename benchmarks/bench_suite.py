@@ -0,0 +1,348 @@
+"""Suíte de throughput: todos os clientes contra o servidor mock, em vários níveis de concorrência.
+
+Cada cenário dispara N requisições com C requisições simultâneas (threads
+para os clientes síncronos, corrotinas para os assíncronos) e reporta
+requisições/s, percentis de latência, taxa de erro e RSS do processo.
+
+Cada cenário roda num processo novo, com o próprio servidor mock (pools,
+threads e memória dos cenários anteriores não contam), `--runs` vezes; a
+comparação usa a mediana das execuções. Os limites são gravados a partir da
+pior execução, com folga: o p99 de 200 amostras depende de 2 ou 3 requisições.
+
+Os limites de regressão ficam em thresholds.json, ao lado deste arquivo:
+
+    python benchmarks/bench_suite.py                      # compara com os limites
+    python benchmarks/bench_suite.py --write-thresholds   # regrava os limites
+    python benchmarks/bench_suite.py --only perplexity --concurrency 1,64 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.providers import AsyncEngine, create_provider
+from common.scripts import load_script
+from benchmarks.mock_server import MockServer
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+
+def rss_mb() -> float:
+    """RSS atual do processo em MB (no Linux via /proc; senão, o pico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentil(amostras: list, p: float) -> float:
+    return amostras[min(len(amostras) - 1, int(len(amostras) * p / 100))]
+
+
+def limpar_historico(chat) -> None:
+    chat.conversation_history.clear()
+    chat.context_window.reset()
+    chat.request_builder.reset()
+
+
+class Cenario:
+    """Um cliente a medir: `criar` devolve a função que faz uma requisição.
+
+    Nos cenários síncronos cada thread chama `criar` uma vez (os clientes
+    guardam histórico e não são compartilhados); nos assíncronos, uma vez
+    por execução. `ok` decide se o resultado é uma resposta válida.
+    """
+
+    def __init__(self, nome: str, criar, ok, assincrono: bool = False):
+        self.nome = nome
+        self.criar = criar
+        self.ok = ok
+        self.assincrono = assincrono
+
+
+def montar_cenarios(server: MockServer) -> list:
+    os.environ.update(
+        OPENAI_API_KEY="chave-de-teste",
+        OPENAI_BASE_URL=f"{server.url}/v1",
+        PERPLEXITY_API_KEY="chave-de-teste",
+        GROQ_API_KEY="chave-de-teste",
+        GROQ_BASE_URL=server.url,
+        GEMINI_API_KEY="chave-de-teste"
+    )
+    openai_chat = load_script("OpenAi/02 Custom call/openai_chat.py", "openai_chat")
+    perplexity = load_script("Perplexity/02 Custom call/perplexity_chat.py", "perplexity_chat")
+    gemini01 = load_script("Gemini/02 Custom request/gemini_custom_call01.py", "gemini_custom_call01")
+    gemini02 = load_script("Gemini/02 Custom request/gemini_custom_call02.py", "gemini_custom_call02")
+    gemini_simples = load_script("Gemini/01 Simple request/main.py", "gemini_main")
+    gemini_simples.BASE_URL = f"{server.url}/v1"
+    anthropic = load_script("Anthropic/01 Simple request/simple_request_anthr.py", "simple_request_anthr")
+    anthropic.API_URL = f"{server.url}/v1/messages"
+    groq = load_script("Groq/01 Simple request/groq_chat_simples.py", "groq_chat_simples")
+
+    def openai_send(stream: bool):
+        def criar():
+            chat = openai_chat.OpenAIChat()
+            chat.current_config['stream'] = stream
+
+            def enviar(prompt):
+                limpar_historico(chat)
+                return chat.send_message(prompt)
+            return enviar
+        return criar
+
+    def perplexity_send():
+        chat = perplexity.PerplexityChat()
+        chat.url = f"{server.url}/chat/completions"
+
+        def enviar(prompt):
+            limpar_historico(chat)
+            return chat.send_message(prompt)
+        return enviar
+
+    def perplexity_stream():
+        chat = perplexity.PerplexityChat()
+        chat.url = f"{server.url}/chat/completions"
+
+        def enviar(prompt):
+            limpar_historico(chat)
+            return "".join(chat.stream_message(prompt))
+        return enviar
+
+    def gemini01_send():
+        api = gemini01.GeminiAPI("chave-de-teste")
+        api.base_url = f"{server.url}/v1"
+        return api.chamar_gemini
+
+    def gemini02_api():
+        api = gemini02.GeminiAPI("chave-de-teste")
+        api.base_url = f"{server.url}/v1"
+        return api
+
+    def gemini02_stream():
+        api = gemini02_api()
+
+        async def enviar(prompt):
+            return "".join([trecho async for trecho in api.stream_gemini(prompt)])
+        return enviar
+
+    def engine_anthropic_stream():
+        engine = AsyncEngine(max_concurrency=256)
+        provider = create_provider("anthropic", api_key="chave-de-teste", base_url=server.url)
+
+        async def enviar(prompt):
+            partes = [evento["delta"] async for evento in engine.stream(provider, [{"role": "user", "content": prompt}])]
+            return "".join(partes)
+        return enviar
+
+    def sem_erro(resposta) -> bool:
+        return "error" not in resposta
+
+    def texto_ok(resposta) -> bool:
+        return bool(resposta) and not resposta.startswith("Erro")
+
+    return [
+        Cenario("openai.send_message", openai_send(False), sem_erro),
+        Cenario("openai.send_message[stream]", openai_send(True), sem_erro),
+        Cenario("perplexity.send_message", perplexity_send, sem_erro),
+        Cenario("perplexity.stream_message", perplexity_stream, texto_ok),
+        Cenario("gemini01.chamar_gemini", gemini01_send, texto_ok),
+        Cenario("gemini02.chamar_gemini", lambda: gemini02_api().chamar_gemini, texto_ok, assincrono=True),
+        Cenario("gemini02.stream_gemini", gemini02_stream, texto_ok, assincrono=True),
+        Cenario("gemini.simples", lambda: gemini_simples.chamar_gemini, texto_ok),
+        Cenario("anthropic.simples", lambda: anthropic.enviar_mensagem_claude, texto_ok),
+        Cenario("anthropic.engine_stream", engine_anthropic_stream, texto_ok, assincrono=True),
+        Cenario("groq.simples", lambda: groq.enviar_mensagem_groq, texto_ok)
+    ]
+
+
+def executar_sync(cenario: Cenario, n: int, concorrencia: int):
+    local = threading.local()
+
+    def uma(i: int):
+        if not hasattr(local, "enviar"):
+            local.enviar = cenario.criar()
+        inicio = time.perf_counter()
+        try:
+            ok = cenario.ok(local.enviar(f"pergunta {i}"))
+        except Exception:
+            ok = False
+        return time.perf_counter() - inicio, ok
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        return list(executor.map(uma, range(n)))
+
+
+async def executar_async(cenario: Cenario, n: int, concorrencia: int):
+    enviar = cenario.criar()
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def uma(i: int):
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                ok = cenario.ok(await enviar(f"pergunta {i}"))
+            except Exception:
+                ok = False
+            return time.perf_counter() - inicio, ok
+
+    return await asyncio.gather(*(uma(i) for i in range(n)))
+
+
+def medir(cenario: Cenario, n: int, concorrencia: int) -> dict:
+    # Os clientes de exemplo imprimem as respostas em streaming
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        # Aquecimento: imports, conexões e clientes criados fora da medição
+        if cenario.assincrono:
+            asyncio.run(executar_async(cenario, min(n, concorrencia), concorrencia))
+        else:
+            executar_sync(cenario, min(n, concorrencia), concorrencia)
+
+        inicio = time.perf_counter()
+        if cenario.assincrono:
+            resultados = asyncio.run(executar_async(cenario, n, concorrencia))
+        else:
+            resultados = executar_sync(cenario, n, concorrencia)
+        duracao = time.perf_counter() - inicio
+
+    latencias = sorted(latencia for latencia, _ in resultados)
+    return {
+        "rps": round(n / duracao, 1),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        "error_rate": round(sum(not ok for _, ok in resultados) / n, 4),
+        "rss_mb": round(rss_mb(), 1)
+    }
+
+
+def rodar_cenario(nome: str, args) -> dict:
+    """Executa o cenário num subprocesso (modo --worker) e retorna {nível: medições}."""
+    comando = [
+        sys.executable, os.path.abspath(__file__), "--worker", nome,
+        "--requests", str(args.requests), "--concurrency", args.concurrency,
+        "--latency", str(args.latency), "--error-rate", str(args.error_rate)
+    ]
+    saida = subprocess.run(comando, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(saida.splitlines()[-1])
+
+
+def worker(args) -> None:
+    niveis = [int(nivel) for nivel in args.concurrency.split(",")]
+    with MockServer(latency=args.latency, error_rate=args.error_rate, reply_text="uma resposta curta do mock") as server:
+        cenario = next(c for c in montar_cenarios(server) if c.nome == args.worker)
+        resultado = {str(nivel): medir(cenario, args.requests, nivel) for nivel in niveis}
+    print(json.dumps(resultado))
+
+
+def mediana(execucoes: list) -> dict:
+    return {campo: round(statistics.median(e[campo] for e in execucoes), 4) for campo in execucoes[0]}
+
+
+def verificar(resultados: dict, limites: dict) -> list:
+    """Compara os resultados com os limites; retorna as regressões encontradas."""
+    regressoes = []
+    for chave, medido in resultados.items():
+        limite = limites.get(chave)
+        if limite is None:
+            continue
+        if medido["rps"] < limite["min_rps"]:
+            regressoes.append(f"{chave}: {medido['rps']} req/s < {limite['min_rps']}")
+        if medido["p99_ms"] > limite["max_p99_ms"]:
+            regressoes.append(f"{chave}: p99 {medido['p99_ms']} ms > {limite['max_p99_ms']}")
+        if medido["error_rate"] > limite["max_error_rate"]:
+            regressoes.append(f"{chave}: taxa de erro {medido['error_rate']} > {limite['max_error_rate']}")
+        if medido["rss_mb"] > limite["max_rss_mb"]:
+            regressoes.append(f"{chave}: RSS {medido['rss_mb']} MB > {limite['max_rss_mb']}")
+    return regressoes
+
+
+def gerar_limites(execucoes: dict) -> dict:
+    # A partir da pior execução e com margens largas: os limites pegam
+    # regressões, não a variação entre execuções
+    return {
+        chave: {
+            "min_rps": round(min(e["rps"] for e in medidas) * 0.5, 1),
+            "max_p99_ms": round(max(e["p99_ms"] for e in medidas) * 3 + 50, 1),
+            "max_error_rate": max(e["error_rate"] for e in medidas),
+            "max_rss_mb": round(max(e["rss_mb"] for e in medidas) * 1.5 + 50)
+        }
+        for chave, medidas in execucoes.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput dos clientes contra o servidor mock")
+    parser.add_argument("--requests", type=int, default=200, help="Requisições por cenário e nível")
+    parser.add_argument("--concurrency", default="1,8,32", help="Níveis de concorrência (ex.: 1,8,32)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Latência do servidor mock (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de respostas 5xx injetadas")
+    parser.add_argument("--runs", type=int, default=3, help="Execuções por cenário (vale a mediana)")
+    parser.add_argument("--only", help="Roda só os cenários cujo nome contém este texto")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--write-thresholds", action="store_true", help="Regrava os limites com esta execução")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+        return
+
+    niveis = [int(nivel) for nivel in args.concurrency.split(",")]
+    config = {"requests": args.requests, "latency": args.latency, "error_rate": args.error_rate, "runs": args.runs}
+    execucoes = {}
+    resultados = {}
+
+    with MockServer() as server:
+        nomes = [c.nome for c in montar_cenarios(server) if not args.only or args.only in c.nome]
+    print(f"Mediana de {args.runs} execuções por cenário, cada uma num processo novo")
+    print(f"{'Cenário':<30} {'C':>3} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6} {'RSS MB':>7} "
+          f"{'p99 mín–máx':>16}")
+    for nome in nomes:
+        rodadas = [rodar_cenario(nome, args) for _ in range(args.runs)]
+        for nivel in niveis:
+            chave = f"{nome}@{nivel}"
+            execucoes[chave] = [rodada[str(nivel)] for rodada in rodadas]
+            medido = resultados[chave] = mediana(execucoes[chave])
+            p99s = [e["p99_ms"] for e in execucoes[chave]]
+            print(f"{nome:<30} {nivel:>3} {medido['rps']:>8.1f} {medido['p50_ms']:>8.2f} "
+                  f"{medido['p95_ms']:>8.2f} {medido['p99_ms']:>8.2f} {medido['error_rate']:>6.1%} {medido['rss_mb']:>7.1f} "
+                  f"{min(p99s):>7.1f}–{max(p99s):<7.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": resultados, "runs": execucoes}, f, indent=2)
+
+    if args.write_thresholds:
+        with open(args.thresholds, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "thresholds": gerar_limites(execucoes)}, f, indent=2)
+            f.write("\n")
+        print(f"Limites gravados em {args.thresholds}")
+        return
+
+    if not os.path.exists(args.thresholds):
+        return
+    with open(args.thresholds, encoding="utf-8") as f:
+        salvo = json.load(f)
+    if salvo["config"] != config:
+        print(f"Limites gravados com outra configuração ({salvo['config']}); comparação ignorada")
+        return
+    regressoes = verificar(resultados, salvo["thresholds"])
+    for regressao in regressoes:
+        print(f"REGRESSÃO {regressao}")
+    if regressoes:
+        sys.exit(1)
+    print("Sem regressões em relação a thresholds.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def gemini_response(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+
+def chat_completion_response(text: str, model: str = "mock") -> dict:
+    return {
+        "id": "mock-1",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    }
+
+
+def anthropic_response(text: str) -> dict:
+    return {
+        "id": "msg_mock",
+        "type": "message",
+        "role": "assistant",
+        "content": [{"type": "text", "text": text}],
+        "usage": {"input_tokens": 10, "output_tokens": 5}
+    }
+
+
+def error_response(path: str, status: int) -> dict:
+    """Corpo de erro no formato do provedor que atende `path`."""
+    message = f"mock error {status}"
+    if path.endswith("/messages"):
+        return {"type": "error", "error": {"type": "api_error", "message": message}}
+    if ":generateContent" in path or ":streamGenerateContent" in path:
+        return {"error": {"code": status, "message": message, "status": "UNAVAILABLE"}}
+    return {"error": {"message": message, "type": "server_error", "code": status}}
+
+
+def anthropic_stream_events(words: list) -> list:
+    """Eventos (nome, dados) do streaming da API de mensagens da Anthropic."""
+    events = [
+        ("message_start", {"type": "message_start", "message": dict(anthropic_response(""), content=[])}),
+        ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+    ]
+    events += [
+        ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}})
+        for word in words
+    ]
+    events += [
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 5}}),
+        ("message_stop", {"type": "message_stop"})
+    ]
+    return [(name, json.dumps(data)) for name, data in events]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantém a conexão aberta entre requisições (keep-alive)
+    protocol_version = "HTTP/1.1"
+    # Evita o atraso de Nagle + delayed ACK nas respostas em conexões persistentes
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_sse(self, events) -> None:
+        """Envia os eventos como Server-Sent Events, um chunk HTTP por evento.
+
+        Cada evento é o texto do campo data ou uma tupla (nome do evento, data).
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if self.server.first_token_delay:
+            # Cabeçalhos já enviados; o modelo ainda "pensa" antes do primeiro token
+            self.wfile.flush()
+            time.sleep(self.server.first_token_delay)
+        if self.server.malformed_stream:
+            events = itertools.chain(["{evento cortado"], events)
+        for event in events:
+            if isinstance(event, tuple):
+                data = f"event: {event[0]}\ndata: {event[1]}\n\n".encode("utf-8")
+            else:
+                data = f"data: {event}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_raw(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            return self.rfile.read(length)
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            return self._read_chunked()
+        return b""
+
+    def _read_body(self) -> dict:
+        raw = self._read_raw()
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def do_POST(self):
+        server = self.server
+        with server.inflight_lock:
+            server.requests += 1
+        # Limite de requisições simultâneas, como o de um provedor: o excedente recebe 429
+        with server.inflight_lock:
+            throttled = server.max_inflight and server.inflight >= server.max_inflight
+            if throttled:
+                server.throttled += 1
+            else:
+                server.inflight += 1
+        self._holding_slot = not throttled
+        try:
+            if throttled:
+                self._read_body()
+                self.send_response(429)
+                self.send_header("Retry-After", str(server.retry_after))
+                self.send_header("Content-Type", "application/json")
+                body = json.dumps({"error": {"message": "rate limit exceeded"}}).encode("utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._handle_post()
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente desistiu da requisição (ex.: perdedor de um hedge cancelado)
+            self.close_connection = True
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        if self._holding_slot:
+            self._holding_slot = False
+            with self.server.inflight_lock:
+                self.server.inflight -= 1
+
+    def _handle_post(self):
+        if self.path.startswith("/upload/"):
+            self._handle_upload()
+            return
+        if self.path.endswith("/files") or self.path.endswith("/batches"):
+            self._handle_batch_post()
+            return
+        body = self._read_body()
+        if ":generateContent" in self.path or ":streamGenerateContent" in self.path:
+            self._record_media(body)
+
+        latency = self.server.latency
+        # Cauda lenta: uma fração das respostas demora slow_latency segundos
+        if self.server.slow_ratio and random.random() < self.server.slow_ratio:
+            latency = self.server.slow_latency
+        if latency:
+            time.sleep(latency)
+        # O processamento terminou: a vaga é liberada antes de a resposta ser enviada
+        self._release_slot()
+
+        # Injeção de erros: uma fração das respostas é um 5xx no formato do provedor
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            status = random.choice(self.server.error_statuses)
+            with self.server.inflight_lock:
+                self.server.errors += 1
+            self._send_json(error_response(self.path, status), status=status)
+            return
+
+        text = self.server.reply_text
+        words = [word + " " for word in text.split(" ")]
+        words[-1] = words[-1].rstrip(" ")
+
+        if ":streamGenerateContent" in self.path:
+            self._send_sse(json.dumps(gemini_response(word)) for word in words)
+        elif self.path.endswith("/chat/completions") and body.get("stream"):
+            chunks = [
+                json.dumps({
+                    "choices": [{"index": 0, "delta": {"content": word}}],
+                    "citations": self.server.citations
+                })
+                for word in words
+            ]
+            if body.get("stream_options", {}).get("include_usage"):
+                chunks.append(json.dumps({"choices": [], "usage": chat_completion_response(text)["usage"]}))
+            self._send_sse(chunks + ["[DONE]"])
+        elif ":generateContent" in self.path:
+            self._send_json(gemini_response(text))
+        elif self.path.endswith("/chat/completions"):
+            response = chat_completion_response(text)
+            response["citations"] = self.server.citations
+            self._send_json(response)
+        elif self.path.endswith("/messages") and body.get("stream"):
+            self._send_sse(anthropic_stream_events(words))
+        elif self.path.endswith("/messages"):
+            self._send_json(anthropic_response(text))
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+
+    def _record_media(self, body: dict) -> None:
+        """Guarda (mime_type, bytes decodificados ou URI) da mídia de cada requisição do Gemini."""
+        for content in body.get("contents", []):
+            for part in content.get("parts", []):
+                if "inline_data" in part:
+                    data = part["inline_data"]["data"]
+                    size = len(data) * 3 // 4 - data[-2:].count("=")
+                    self.server.media.append((part["inline_data"]["mime_type"], size))
+                elif "file_data" in part:
+                    self.server.media.append((part["file_data"]["mime_type"], part["file_data"]["file_uri"]))
+
+    # --- File API do Gemini: upload resumable ---
+
+    def _send_upload_status(self, headers: dict, payload: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _gemini_file(self, file_id: str) -> dict:
+        file = self.server.uploaded_files[file_id]
+        processing = time.time() - file["created"] < self.server.file_delay
+        return {
+            "name": f"files/{file_id}", "displayName": file["display_name"], "mimeType": file["mime_type"],
+            "sizeBytes": str(file["size"]), "uri": f"http://{self.headers['Host']}/v1beta/files/{file_id}",
+            "state": "PROCESSING" if processing else "ACTIVE"
+        }
+
+    def _handle_upload(self):
+        server = self.server
+        command = self.headers.get("X-Goog-Upload-Command", "")
+        upload_id = self.path.partition("upload_id=")[2]
+        if command == "start":
+            body = self._read_body()
+            with server.batch_lock:
+                upload_id = str(next(server.batch_ids))
+                server.uploads[upload_id] = {
+                    "display_name": body.get("file", {}).get("display_name", ""),
+                    "mime_type": self.headers.get("X-Goog-Upload-Header-Content-Type"),
+                    "size": int(self.headers.get("X-Goog-Upload-Header-Content-Length", 0)),
+                    "received": 0
+                }
+            self._send_upload_status({
+                "X-Goog-Upload-URL": f"http://{self.headers['Host']}/upload/v1beta/files?upload_id={upload_id}",
+                "X-Goog-Upload-Status": "active"
+            })
+            return
+
+        upload = server.uploads[upload_id]
+        if command == "query":
+            self._send_upload_status({"X-Goog-Upload-Size-Received": str(upload["received"]),
+                                      "X-Goog-Upload-Status": "active"})
+            return
+        if int(self.headers.get("X-Goog-Upload-Offset", -1)) != upload["received"]:
+            self._send_json({"error": {"message": "offset inválido"}}, status=400)
+            return
+        # O conteúdo é lido em blocos e descartado: só o tamanho importa aqui
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining:
+            block = self.rfile.read(min(remaining, 1 << 20))
+            if not block:
+                break
+            remaining -= len(block)
+            upload["received"] += len(block)
+        if "finalize" not in command:
+            self._send_upload_status({"X-Goog-Upload-Status": "active"})
+            return
+        with server.batch_lock:
+            file_id = f"mock-{upload_id}"
+            server.uploaded_files[file_id] = dict(upload, created=time.time())
+        self._send_upload_status({"X-Goog-Upload-Status": "final"}, {"file": self._gemini_file(file_id)})
+
+    # --- APIs de lote: Batch API da OpenAI e Message Batches da Anthropic ---
+
+    def _send_jsonl(self, lines) -> None:
+        body = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/jsonl")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_batch_post(self):
+        server = self.server
+        raw = self._read_raw()
+        with server.batch_lock:
+            if self.path.endswith("/files"):
+                # Upload multipart com os campos purpose e file
+                header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode()
+                form = BytesParser(policy=policy.default).parsebytes(header + raw)
+                content = next(
+                    part.get_payload(decode=True) for part in form.iter_parts()
+                    if part.get_param("name", header="content-disposition") == "file"
+                )
+                file_id = f"file-{next(server.batch_ids)}"
+                server.batch_files[file_id] = content
+                self._send_json({"id": file_id, "object": "file", "purpose": "batch", "bytes": len(content)})
+            elif self.path.endswith("/messages/batches"):
+                requests = json.loads(raw)["requests"]
+                batch_id = f"msgbatch_{next(server.batch_ids)}"
+                server.batches[batch_id] = {"created": time.time(), "requests": requests}
+                self._send_json(self._anthropic_batch(batch_id))
+            else:
+                body = json.loads(raw)
+                batch_id = f"batch_{next(server.batch_ids)}"
+                lines = server.batch_files[body["input_file_id"]].decode("utf-8").splitlines()
+                server.batches[batch_id] = {
+                    "created": time.time(), "requests": [json.loads(line) for line in lines if line.strip()],
+                    "input_file_id": body["input_file_id"], "endpoint": body["endpoint"]
+                }
+                self._send_json(self._openai_batch(batch_id))
+
+    def _batch_results(self, batch: dict) -> list:
+        """(custom_id, corpo da requisição, erro injetado ou None) de cada requisição, sorteados uma vez."""
+        if "results" not in batch:
+            batch["results"] = [
+                (request["custom_id"], request.get("body") or request.get("params"),
+                 self.server.error_rate and random.random() < self.server.error_rate)
+                for request in batch["requests"]
+            ]
+        return batch["results"]
+
+    def _batch_ended(self, batch: dict) -> bool:
+        return time.time() - batch["created"] >= self.server.batch_delay
+
+    def _openai_batch(self, batch_id: str) -> dict:
+        batch = self.server.batches[batch_id]
+        info = {
+            "id": batch_id, "object": "batch", "endpoint": batch["endpoint"], "completion_window": "24h",
+            "input_file_id": batch["input_file_id"], "status": "in_progress",
+            "output_file_id": None, "error_file_id": None, "errors": None,
+            "request_counts": {"total": len(batch["requests"]), "completed": 0, "failed": 0}
+        }
+        if self._batch_ended(batch):
+            results = self._batch_results(batch)
+            failed = sum(1 for _, _, error in results if error)
+            info.update(status="completed", output_file_id=f"{batch_id}-output")
+            info["request_counts"].update(completed=len(results) - failed, failed=failed)
+            if failed:
+                info["error_file_id"] = f"{batch_id}-errors"
+        return info
+
+    def _anthropic_batch(self, batch_id: str) -> dict:
+        batch = self.server.batches[batch_id]
+        ended = self._batch_ended(batch)
+        counts = {"processing": len(batch["requests"]), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if ended:
+            results = self._batch_results(batch)
+            errored = sum(1 for _, _, error in results if error)
+            counts.update(processing=0, succeeded=len(results) - errored, errored=errored)
+        return {
+            "id": batch_id, "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": counts,
+            "results_url": f"http://{self.headers['Host']}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+
+    def do_GET(self):
+        server = self.server
+        with server.inflight_lock:
+            server.requests += 1
+        parts = self.path.split("?")[0].strip("/").split("/")
+        with server.batch_lock:
+            if parts[:2] == ["v1beta", "files"] and parts[-1] in server.uploaded_files:
+                self._send_json(self._gemini_file(parts[-1]))
+            elif parts[-2:-1] == ["batches"] and parts[-3:-2] != ["messages"] and parts[-1] in server.batches:
+                self._send_json(self._openai_batch(parts[-1]))
+            elif parts[-1] == "content" and parts[-3:-2] == ["files"]:
+                batch_id, _, kind = parts[-2].rpartition("-")
+                text = server.reply_text
+                lines = []
+                for custom_id, body, error in self._batch_results(server.batches[batch_id]):
+                    if bool(error) != (kind == "errors"):
+                        continue
+                    if error:
+                        response = {"status_code": 500, "body": error_response("/chat/completions", 500)}
+                    else:
+                        response = {"status_code": 200, "body": chat_completion_response(text, body.get("model", "mock"))}
+                    lines.append({"id": f"req_{custom_id}", "custom_id": custom_id, "response": response, "error": None})
+                self._send_jsonl(lines)
+            elif parts[-1] == "results" and parts[-2] in server.batches:
+                lines = []
+                for custom_id, _, error in self._batch_results(server.batches[parts[-2]]):
+                    if error:
+                        result = {"type": "errored", "error": error_response("/messages", 500)}
+                    else:
+                        result = {"type": "succeeded", "message": anthropic_response(server.reply_text)}
+                    lines.append({"custom_id": custom_id, "result": result})
+                self._send_jsonl(lines)
+            elif parts[-2:-1] == ["batches"] and parts[-1] in server.batches:
+                self._send_json(self._anthropic_batch(parts[-1]))
+            else:
+                self._send_json({"error": "not found"}, status=404)
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    # Fila de conexões maior que o padrão (5) para suportar rajadas de clientes
+    request_queue_size = 256
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Cliente que fecha a conexão entre requisições (pool encerrado, streaming
+        # abandonado) não é erro do mock: sem traceback no stderr
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockServer:
+    """Servidor local que imita as APIs dos provedores (sem custo de créditos)."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        reply_text: str = "ok",
+        chunk_delay: float = 0.0,
+        first_token_delay: float = 0.0,
+        malformed_stream: bool = False,
+        citations: Optional[list] = None,
+        slow_ratio: float = 0.0,
+        slow_latency: float = 0.0,
+        max_inflight: int = 0,
+        retry_after: float = 0.1,
+        error_rate: float = 0.0,
+        error_statuses: tuple = (500, 503),
+        batch_delay: float = 0.0,
+        file_delay: float = 0.0
+    ):
+        self.httpd = _MockHTTPServer((host, port), MockHandler)
+        self.httpd.latency = latency  # Atraso antes do primeiro byte da resposta
+        self.httpd.reply_text = reply_text
+        self.httpd.chunk_delay = chunk_delay  # Atraso entre eventos no streaming
+        self.httpd.first_token_delay = first_token_delay  # Atraso entre os cabeçalhos e o primeiro evento
+        self.httpd.malformed_stream = malformed_stream  # Streaming com um evento de JSON inválido
+        self.httpd.citations = citations or []
+        self.httpd.slow_ratio = slow_ratio
+        self.httpd.slow_latency = slow_latency
+        self.httpd.max_inflight = max_inflight  # 0 = sem limite
+        self.httpd.retry_after = retry_after
+        self.httpd.error_rate = error_rate  # Fração das respostas que viram 5xx
+        self.httpd.error_statuses = error_statuses
+        self.httpd.requests = 0
+        self.httpd.errors = 0
+        self.httpd.inflight = 0
+        self.httpd.throttled = 0
+        self.httpd.inflight_lock = threading.Lock()
+        # APIs de lote: arquivos enviados, lotes criados e tempo até cada lote terminar
+        self.httpd.batch_delay = batch_delay
+        self.httpd.batch_files = {}
+        self.httpd.batches = {}
+        self.httpd.batch_ids = itertools.count(1)
+        self.httpd.batch_lock = threading.Lock()
+        # File API do Gemini: uploads em andamento, arquivos prontos e tempo em PROCESSING
+        self.httpd.uploads = {}
+        self.httpd.uploaded_files = {}
+        self.httpd.file_delay = file_delay
+        # Mídia recebida nas requisições do Gemini: (mime_type, tamanho em bytes ou URI)
+        self.httpd.media = []
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor mock dos provedores de IA")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockServer(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"Servidor mock em {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1 @@
+"""Módulos compartilhados pelos clientes de IA deste repositório."""
@@ -0,0 +1,225 @@
+"""Executa em lote um arquivo JSONL de prompts com os adaptadores de common/providers.py.
+
+Cada linha de entrada é um objeto JSON:
+    {"id": "q1", "provider": "openai", "model": "gpt-4o-mini", "config": {"temperature": 0}, "prompt": "..."}
+
+Provedores aceitos: openai, perplexity, gemini, groq e anthropic. Os campos de
+"config" são os mesmos dos clientes de cada provedor; "base_url" (opcional)
+aponta a requisição para outro servidor compatível. As chamadas passam pelos
+adaptadores e pelo AsyncEngine, não pelas classes de chat: estas são síncronas
+e guardam histórico, o que não serve a prompts independentes.
+
+Falhas transitórias (timeout, conexão, 429 e 5xx) são gravadas com
+"retryable": true e repetidas na próxima execução sobre a mesma saída; vale o
+último registro de cada linha.
+
+Uso:
+    python -m common.batch_runner entrada.jsonl saida.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.providers import PROVIDERS, AsyncEngine, ProviderError, create_provider
+
+
+class Checkpoint:
+    """Registra as linhas concluídas para retomar a execução após uma falha.
+
+    Guarda apenas a marca d'água (todas as linhas anteriores estão concluídas)
+    e as linhas concluídas fora de ordem acima dela, limitadas pela janela.
+    Linhas que falharam com erro transitório também avançam a marca, mas ficam
+    em `retry` e voltam a ser executadas ao retomar.
+    """
+
+    def __init__(self, output_path: str):
+        self.path = output_path + ".ckpt"
+        self.watermark = 0
+        self.done: Set[int] = set()
+        self.retry: Set[int] = set()
+
+    def load(self, output_path: str) -> None:
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.watermark = json.load(f).get("watermark", 0)
+
+        # O arquivo de saída é a fonte da verdade para as linhas acima da marca
+        # e para as falhas transitórias (o último registro de cada linha vale)
+        if os.path.exists(output_path):
+            with open(output_path, 'r', encoding='utf-8') as f:
+                for raw in f:
+                    try:
+                        record = json.loads(raw)
+                        line = record["line"]
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Linha truncada por uma falha anterior
+                    if record.get("retryable"):
+                        self.retry.add(line)
+                    else:
+                        self.retry.discard(line)
+                    if line >= self.watermark:
+                        self.done.add(line)
+        self._advance()
+
+    def is_done(self, line: int) -> bool:
+        return (line < self.watermark or line in self.done) and line not in self.retry
+
+    def mark_done(self, line: int, retryable: bool = False) -> None:
+        if retryable:
+            self.retry.add(line)
+        else:
+            self.retry.discard(line)
+        if line >= self.watermark:
+            self.done.add(line)
+            if self._advance():
+                self._save()
+
+    def _advance(self) -> bool:
+        advanced = False
+        while self.watermark in self.done:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+            advanced = True
+        return advanced
+
+    def _save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"watermark": self.watermark}, f)
+        os.replace(tmp_path, self.path)
+
+
+def iter_requests(input_path: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Lê o JSONL linha a linha, sem carregar o arquivo inteiro em memória."""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, raw in enumerate(f):
+            if not raw.strip():
+                continue
+            try:
+                yield line_number, json.loads(raw), None
+            except json.JSONDecodeError as e:
+                yield line_number, None, f"JSON inválido: {str(e)}"
+
+
+class BatchRunner:
+    def __init__(self, input_path: str, output_path: str, concurrency: int = 8, window: Optional[int] = None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = concurrency
+        # Distância máxima entre a linha mais antiga pendente e a próxima a iniciar
+        self.window = window or concurrency * 4
+        self.checkpoint = Checkpoint(output_path)
+        self.engine = AsyncEngine(max_concurrency=concurrency)
+        self.stats: Dict[str, int] = {"ok": 0, "error": 0, "retryable": 0, "skipped": 0}
+
+    async def _execute(self, item: dict) -> dict:
+        name = item.get("provider")
+        if "prompt" not in item:
+            return {"error": "Campo 'prompt' ausente"}
+        if name not in PROVIDERS:
+            return {"error": f"Provedor desconhecido: {name}"}
+
+        config = dict(item.get("config", {}))
+        if item.get("model"):
+            config["model"] = item["model"]
+        provider = create_provider(name, base_url=item.get("base_url"), **config)
+        try:
+            result = await self.engine.complete(provider, [{"role": "user", "content": item["prompt"]}])
+        except ProviderError as e:
+            if e.retryable:
+                return {"error": str(e), "retryable": True}
+            return {"error": str(e)}
+
+        record = {"content": result["content"]}
+        if result["citations"]:
+            record["citations"] = result["citations"]
+        return record
+
+    async def _process(self, line: int, item: Optional[dict], parse_error: Optional[str], out, state) -> None:
+        inicio = time.perf_counter()
+        if parse_error:
+            result = {"error": parse_error}
+        else:
+            try:
+                result = await self._execute(item)
+            except Exception as e:
+                result = {"error": str(e)}
+
+        record = {
+            "line": line,
+            "id": (item or {}).get("id"),
+            "provider": (item or {}).get("provider"),
+            "latency_s": round(time.perf_counter() - inicio, 3)
+        }
+        record.update(result)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+        self.stats["error" if "error" in result else "ok"] += 1
+        if result.get("retryable"):
+            self.stats["retryable"] += 1
+        self.checkpoint.mark_done(line, result.get("retryable", False))
+        async with state:
+            state.notify_all()
+
+    async def run(self) -> Dict[str, int]:
+        self.checkpoint.load(self.output_path)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        state = asyncio.Condition()
+        tasks: Set[asyncio.Task] = set()
+
+        with open(self.output_path, 'a', encoding='utf-8') as out:
+            # Garante que um registro truncado por uma falha não se junte ao próximo
+            if out.tell() > 0:
+                with open(self.output_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        out.write("\n")
+
+            expected = 0
+            for line, item, parse_error in iter_requests(self.input_path):
+                # Linhas em branco não geram registro: contam como concluídas para a marca d'água avançar
+                for blank in range(expected, line):
+                    if not self.checkpoint.is_done(blank):
+                        self.checkpoint.mark_done(blank)
+                expected = line + 1
+
+                if self.checkpoint.is_done(line):
+                    self.stats["skipped"] += 1
+                    continue
+
+                async with state:
+                    await state.wait_for(lambda: line - self.checkpoint.watermark < self.window)
+                await semaphore.acquire()
+
+                task = asyncio.create_task(self._process(line, item, parse_error, out, state))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: semaphore.release())
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Executa prompts em lote a partir de um arquivo JSONL")
+    parser.add_argument("input", help="Arquivo JSONL de entrada")
+    parser.add_argument("output", help="Arquivo JSONL de saída (retomado se já existir)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requisições simultâneas")
+    args = parser.parse_args()
+
+    runner = BatchRunner(args.input, args.output, concurrency=args.concurrency)
+    stats = asyncio.run(runner.run())
+    print(f"Concluído: {stats['ok']} ok, {stats['error']} com erro "
+          f"({stats['retryable']} transitórios, repetidos na próxima execução), {stats['skipped']} já processados")
+
+
+if __name__ == "__main__":
+    main()
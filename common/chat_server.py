@@ -0,0 +1,458 @@
+"""Servidor HTTP/WebSocket que hospeda muitas sessões de chat simultâneas em um processo.
+
+Cada sessão tem histórico e configuração próprios e usa os adaptadores de
+common/providers.py com um AsyncEngine compartilhado, não as classes de chat
+(OpenAIChat, PerplexityChat...): estas são síncronas e guardam o histórico no
+próprio objeto. Os adaptadores aceitam a mesma configuração e já marcam os
+pontos de cache de prompt da Anthropic; o cache de respostas é opcional
+(--cache, memória + SQLite consultado no executor, o mesmo dos chats). Ficam
+de fora o cache semântico (a busca ocuparia o loop de eventos), a fixação de
+mensagens no histórico e os menus de configuração dos chats: a configuração da
+sessão é o dicionário enviado em POST/PATCH, repassado ao adaptador.
+
+Cada mensagem é gravada no log da sessão (common/session_store.py) assim que
+entra no histórico, então uma sessão pode sair da memória a qualquer momento:
+as ociosas e as que passam do orçamento de memória (LRU) são descartadas e
+recarregadas do disco no próximo acesso. Abrir, reproduzir e gravar os logs
+roda no executor padrão, fora do loop de eventos. Os logs são os mesmos do
+comando 'save' dos chats, então uma conversa salva no terminal pode ser
+retomada pelo servidor.
+
+    python -m common.chat_server --port 8080 --memory-mb 64
+
+Rotas:
+    POST   /sessions                {"provider": "openai", "config": {...}} -> {"id": ...}
+    GET    /sessions/{id}           provedor, configuração e histórico
+    PATCH  /sessions/{id}           {"config": {...}}
+    DELETE /sessions/{id}
+    POST   /sessions/{id}/messages  {"content": "..."} -> {"content", "citations", "usage"}
+    GET    /sessions/{id}/ws        WebSocket: envia {"content": "..."}, recebe
+                                    {"type": "delta", "text"}, ..., {"type": "done", "content", "citations"}
+    GET    /stats
+"""
+import argparse
+import asyncio
+import functools
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiohttp import WSMsgType, web
+
+from common import http_pool
+from common.context_window import ContextWindow
+from common.providers import PROVIDERS, AsyncEngine, ProviderError, create_provider
+from common.response_cache import get_shared_cache
+from common.session_store import Session, SessionStore
+
+# Custo fixo de uma sessão residente (objetos da sessão, do log e do adaptador)
+SESSION_OVERHEAD_BYTES = 4096
+# Contagem de tokens por mensagem guardada pelo ContextWindow
+TOKEN_COUNT_BYTES = 36
+
+
+async def _in_executor(func, *args):
+    """Executa E/S de disco (abrir, reproduzir e gravar logs) fora do loop de eventos."""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class ServerSession:
+    """Sessão residente: log (que guarda o histórico), adaptador do provedor e janela de contexto."""
+
+    __slots__ = ("id", "log", "provider", "window", "lock", "last_used", "size")
+
+    def __init__(self, log, provider):
+        self.id = log.id
+        self.log = log
+        self.provider = provider
+        self.window = ContextWindow()
+        # Um turno por vez em cada sessão; sessões em uso não são descartadas
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.size = self.memory_size()
+
+    def memory_size(self) -> int:
+        """Estimativa da memória da sessão (o histórico é um History compacto)."""
+        messages = self.log.messages
+        return SESSION_OVERHEAD_BYTES + messages.nbytes + TOKEN_COUNT_BYTES * len(messages)
+
+
+class SessionManager:
+    """Sessões residentes em LRU, limitadas por memória estimada e por quantidade."""
+
+    def __init__(
+        self,
+        store: SessionStore,
+        memory_budget: int = 64 * 1024 * 1024,
+        max_resident: int = 10000,
+        idle_timeout: float = 300.0,
+        base_urls: Optional[Dict[str, str]] = None
+    ):
+        self.store = store
+        self.memory_budget = memory_budget
+        self.max_resident = max_resident
+        self.idle_timeout = idle_timeout
+        self.base_urls = base_urls or {}
+        self._resident: "OrderedDict[str, ServerSession]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.resident_bytes = 0
+        self.stats = {"created": 0, "loaded": 0, "evicted": 0}
+
+    def _provider(self, name: str, config: Dict):
+        return create_provider(name, base_url=self.base_urls.get(name), **config)
+
+    def _admit(self, session: ServerSession) -> None:
+        self._resident[session.id] = session
+        self.resident_bytes += session.size
+        self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        # A sessão mais recente (a que acabou de ser usada) nunca é descartada aqui
+        for session in list(self._resident.values())[:-1]:
+            if self.resident_bytes <= self.memory_budget and len(self._resident) <= self.max_resident:
+                return
+            if not session.lock.locked():
+                self.evict(session)
+
+    def evict(self, session: ServerSession) -> None:
+        """Tira a sessão da memória; o histórico já está no log em disco."""
+        if self._resident.pop(session.id, None) is not None:
+            self.resident_bytes -= session.size
+            session.log.close()
+            self.stats["evicted"] += 1
+
+    def evict_idle(self) -> None:
+        limite = time.monotonic() - self.idle_timeout
+        for session in list(self._resident.values()):
+            if session.last_used > limite:
+                break  # Ordem LRU: as seguintes foram usadas depois
+            if not session.lock.locked():
+                self.evict(session)
+
+    def is_resident(self, session: ServerSession) -> bool:
+        return self._resident.get(session.id) is session
+
+    def _new_log(self, provider_name: str, config: Dict) -> Session:
+        log = self.store.open()
+        log.set_meta(provider=provider_name, config=config)
+        return log
+
+    async def create(self, provider_name: str, config: Dict) -> ServerSession:
+        if provider_name not in PROVIDERS:
+            raise ValueError(f"Provedor desconhecido: {provider_name}")
+        provider = self._provider(provider_name, config)
+        session = ServerSession(await _in_executor(self._new_log, provider_name, config), provider)
+        self.stats["created"] += 1
+        self._admit(session)
+        return session
+
+    def _check_exists(self, session_id: str) -> None:
+        try:
+            if not self.store.exists(session_id):
+                raise KeyError(session_id)
+        except ValueError:
+            raise KeyError(session_id)
+
+    def _open_log(self, session_id: str) -> Session:
+        """Reproduz o log da sessão (no executor); KeyError se não existir."""
+        self._check_exists(session_id)
+        log = self.store.open(session_id)
+        if log.meta.get('provider') not in PROVIDERS:
+            log.close()
+            raise KeyError(session_id)
+        return log
+
+    async def _load(self, session_id: str) -> ServerSession:
+        log = await _in_executor(self._open_log, session_id)
+        session = ServerSession(log, self._provider(log.meta['provider'], log.meta.get('config', {})))
+        self.stats["loaded"] += 1
+        self._admit(session)
+        return session
+
+    async def get(self, session_id: str) -> ServerSession:
+        """Sessão residente ou recarregada do disco; KeyError se não existir."""
+        session = self._resident.get(session_id)
+        if session is not None:
+            self._resident.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+        # Requisições simultâneas à mesma sessão esperam uma única recarga
+        loading = self._loading.get(session_id)
+        if loading is None:
+            loading = self._loading[session_id] = asyncio.ensure_future(self._load(session_id))
+            loading.add_done_callback(lambda _: self._loading.pop(session_id, None))
+        return await asyncio.shield(loading)
+
+    async def add_message(self, session: ServerSession, message: Dict) -> None:
+        await _in_executor(session.log.append, message)
+        self.resize(session)
+
+    async def pop_message(self, session: ServerSession) -> None:
+        """Desfaz a última mensagem da sessão (log e janela de contexto)."""
+        await _in_executor(session.log.pop)
+        session.window.rewind(len(session.log.messages))
+        self.resize(session)
+
+    def resize(self, session: ServerSession) -> None:
+        """Atualiza a memória estimada da sessão (após novas mensagens ou compressão)."""
+        size = session.memory_size()
+        if self.is_resident(session):
+            self.resident_bytes += size - session.size
+            session.size = size
+            self._enforce_budget()
+        else:
+            session.size = size
+
+    async def update_config(self, session: ServerSession, config: Dict) -> None:
+        merged = dict(session.log.meta.get('config', {}), **config)
+        session.provider = self._provider(session.log.meta['provider'], merged)
+        await _in_executor(functools.partial(session.log.set_meta, config=merged))
+
+    def _delete_log(self, session_id: str) -> None:
+        self._check_exists(session_id)
+        self.store.delete(session_id)
+
+    async def delete(self, session_id: str) -> None:
+        """Apaga a sessão sem reproduzir o log; KeyError se não existir."""
+        session = self._resident.get(session_id)
+        if session is not None:
+            self.evict(session)
+        await _in_executor(self._delete_log, session_id)
+
+    def close(self) -> None:
+        for session in list(self._resident.values()):
+            self.evict(session)
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats, resident=len(self._resident), resident_bytes=self.resident_bytes)
+
+
+class ChatServer:
+    """Rotas HTTP/WebSocket sobre o SessionManager e um AsyncEngine compartilhado."""
+
+    def __init__(self, sessions: SessionManager, engine: Optional[AsyncEngine] = None):
+        self.sessions = sessions
+        self.engine = engine or AsyncEngine(max_concurrency=256)
+        self._idle_task: Optional[asyncio.Task] = None
+
+    async def _acquire(self, session_id: str) -> ServerSession:
+        # A sessão pode ter sido descartada enquanto esperávamos a vez: recarrega
+        while True:
+            session = await self.sessions.get(session_id)
+            await session.lock.acquire()
+            if self.sessions.is_resident(session):
+                return session
+            session.lock.release()
+
+    async def turn(
+        self,
+        session_id: str,
+        content: str,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Dict:
+        """Um turno da conversa; com `on_delta`, a resposta é recebida em streaming."""
+        session = await self._acquire(session_id)
+        try:
+            await self.sessions.add_message(session, {"role": "user", "content": content})
+            provider = session.provider
+            window = session.window.fit(
+                session.log.messages, provider.model,
+                max_output_tokens=provider.config.get('max_tokens') or provider.config.get('max_output_tokens')
+            )
+            self.sessions.resize(session)  # Turnos fora da janela foram comprimidos
+            parts, citations = [], []
+            try:
+                if on_delta is None:
+                    result = await self.engine.complete(provider, window)
+                else:
+                    events = self.engine.stream(provider, window)
+                    try:
+                        async for event in events:
+                            if event.get('citations'):
+                                citations = event['citations']
+                            if event.get('delta'):
+                                parts.append(event['delta'])
+                                await on_delta(event['delta'])
+                    finally:
+                        await events.aclose()  # Libera a conexão com o provedor
+                    result = {'content': "".join(parts), 'citations': citations, 'usage': None}
+            except ProviderError:
+                # Sem resposta, a pergunta sai do histórico, como nos chats
+                await self.sessions.pop_message(session)
+                raise
+            except ConnectionResetError:
+                # O cliente desconectou no meio do streaming: o que já chegou fica no histórico
+                if parts:
+                    await self.sessions.add_message(session, {"role": "assistant", "content": "".join(parts)})
+                else:
+                    await self.sessions.pop_message(session)
+                raise
+            await self.sessions.add_message(session, {"role": "assistant", "content": result['content']})
+            return result
+        finally:
+            session.last_used = time.monotonic()
+            session.lock.release()
+
+    @staticmethod
+    def _not_found() -> web.HTTPNotFound:
+        return web.HTTPNotFound(text=json.dumps({"error": "sessão não encontrada"}), content_type="application/json")
+
+    async def _session_or_404(self, request: web.Request) -> ServerSession:
+        try:
+            return await self.sessions.get(request.match_info['id'])
+        except KeyError:
+            raise self._not_found()
+
+    @staticmethod
+    async def _json_body(request: web.Request) -> Dict:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "corpo JSON inválido"}), content_type="application/json")
+        return body
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        body = await self._json_body(request)
+        try:
+            session = await self.sessions.create(body.get('provider', 'openai'), body.get('config') or {})
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.json_response({"id": session.id}, status=201)
+
+    async def get_session(self, request: web.Request) -> web.Response:
+        session = await self._session_or_404(request)
+        return web.json_response({
+            "id": session.id,
+            "provider": session.log.meta.get('provider'),
+            "config": session.log.meta.get('config', {}),
+            "messages": session.log.messages.to_list()
+        })
+
+    async def update_session(self, request: web.Request) -> web.Response:
+        session = await self._session_or_404(request)
+        body = await self._json_body(request)
+        await self.sessions.update_config(session, body.get('config') or {})
+        return web.json_response({"id": session.id, "config": session.log.meta['config']})
+
+    async def delete_session(self, request: web.Request) -> web.Response:
+        try:
+            await self.sessions.delete(request.match_info['id'])
+        except KeyError:
+            raise self._not_found()
+        return web.Response(status=204)
+
+    async def post_message(self, request: web.Request) -> web.Response:
+        await self._session_or_404(request)
+        body = await self._json_body(request)
+        if not isinstance(body.get('content'), str):
+            return web.json_response({"error": "campo 'content' obrigatório"}, status=400)
+        try:
+            result = await self.turn(request.match_info['id'], body['content'])
+        except ProviderError as e:
+            return web.json_response({"error": str(e)}, status=502)
+        return web.json_response(result)
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        session_id = (await self._session_or_404(request)).id
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+
+        async def send_delta(text: str) -> None:
+            await ws.send_json({"type": "delta", "text": text})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                content = json.loads(msg.data)['content']
+            except (ValueError, KeyError, TypeError):
+                content = msg.data  # Texto puro também é aceito
+            try:
+                result = await self.turn(session_id, content, send_delta)
+                await ws.send_json({"type": "done", **result})
+            except ProviderError as e:
+                await ws.send_json({"type": "error", "error": str(e)})
+            except KeyError:
+                await ws.send_json({"type": "error", "error": "sessão não encontrada"})
+                break
+            except ConnectionResetError:
+                break  # Cliente desconectado; o turno já foi salvo no histórico
+        return ws
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.sessions.snapshot())
+
+    async def _evict_idle_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.sessions.idle_timeout / 4, 1.0))
+            self.sessions.evict_idle()
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._idle_task = asyncio.ensure_future(self._evict_idle_loop())
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+        self.sessions.close()
+        await http_pool.aclose_async_client()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post('/sessions', self.create_session),
+            web.get('/sessions/{id}', self.get_session),
+            web.patch('/sessions/{id}', self.update_session),
+            web.delete('/sessions/{id}', self.delete_session),
+            web.post('/sessions/{id}/messages', self.post_message),
+            web.get('/sessions/{id}/ws', self.websocket),
+            web.get('/stats', self.stats)
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def create_app(
+    session_dir: Optional[str] = None,
+    memory_budget: int = 64 * 1024 * 1024,
+    max_resident: int = 10000,
+    idle_timeout: float = 300.0,
+    base_urls: Optional[Dict[str, str]] = None,
+    max_concurrency: int = 256,
+    response_cache: bool = False
+) -> web.Application:
+    # Sem arquivo aberto por sessão: milhares de sessões não esgotam os descritores
+    store = SessionStore(session_dir, keep_open=False)
+    sessions = SessionManager(store, memory_budget, max_resident, idle_timeout, base_urls)
+    # O AsyncEngine usa aget/aset: a camada SQLite roda no executor, fora do loop
+    cache = get_shared_cache() if response_cache else None
+    return ChatServer(sessions, AsyncEngine(max_concurrency=max_concurrency, cache=cache)).app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de chat com várias sessões (HTTP e WebSocket)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--session-dir", help="Diretório dos logs de sessão (padrão: AI_SESSION_DIR)")
+    parser.add_argument("--memory-mb", type=float, default=64, help="Orçamento de memória das sessões residentes")
+    parser.add_argument("--max-resident", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=300, help="Segundos até uma sessão ociosa sair da memória")
+    parser.add_argument("--concurrency", type=int, default=256, help="Requisições simultâneas aos provedores")
+    parser.add_argument("--cache", action="store_true", help="Cache de respostas (memória + SQLite) para requisições idênticas")
+    parser.add_argument("--base-url", action="append", default=[], metavar="PROVEDOR=URL",
+                        help="URL base de um provedor (ex.: openai=http://localhost:8765/v1)")
+    args = parser.parse_args()
+
+    base_urls = dict(item.split("=", 1) for item in args.base_url)
+    app = create_app(
+        args.session_dir, int(args.memory_mb * 1024 * 1024), args.max_resident,
+        args.idle_timeout, base_urls, args.concurrency, args.cache
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from typing import Callable, Dict, List, Optional
+
+from common.history import History
+
+# Limite de contexto (tokens) de cada modelo usado pelos clientes
+MODEL_CONTEXT_LIMITS = {
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-3.5-turbo': 16385,
+    'o1-preview': 128000,
+    'o1-mini': 128000,
+    'llama-3.1-sonar-small-128k-chat': 127072,
+    'llama-3.1-sonar-large-128k-chat': 127072,
+    'llama-3.1-sonar-small-128k-online': 127072,
+    'llama-3.1-sonar-large-128k-online': 127072,
+    'llama-3.1-sonar-huge-128k-online': 127072,
+    'llama3-8b-8192': 8192,
+    'gemini-pro': 30720,
+    'gemini-pro-vision': 12288
+}
+DEFAULT_CONTEXT_LIMIT = 8192
+DEFAULT_OUTPUT_RESERVE = 1024
+# Tokens extras que a API adiciona por mensagem (papel e separadores)
+MESSAGE_OVERHEAD = 4
+# Ao estourar o orçamento, a janela é cortada até esta fração dele. Assim o
+# início da janela (e o prefixo da requisição) fica igual por vários turnos e
+# o cache de prompt dos provedores continua valendo; 1.0 corta o mínimo.
+TRIM_RATIO = 0.75
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Conta tokens com tiktoken, ou estima ~4 caracteres por token se não estiver instalado."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def encode_tokens(text: str) -> list:
+    """Tokens do texto; sem tiktoken, blocos de 4 caracteres (a mesma estimativa de count_tokens)."""
+    if _ENCODING is not None:
+        return _ENCODING.encode(text, disallowed_special=())
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def decode_tokens(tokens: list) -> str:
+    if _ENCODING is not None:
+        return _ENCODING.decode(tokens)
+    return "".join(tokens)
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message.get('content') or '') + MESSAGE_OVERHEAD
+
+
+def _role(messages: List[Dict], index: int) -> Optional[str]:
+    # History responde sem montar o dict da mensagem
+    if isinstance(messages, History):
+        return messages.role(index)
+    return messages[index].get('role')
+
+
+def context_limit(model: str) -> int:
+    return MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT)
+
+
+class ContextWindow:
+    """Janela deslizante sobre o histórico da conversa, limitada por tokens.
+
+    Cada mensagem é tokenizada uma única vez, quando entra no histórico; a
+    cada turno apenas as mensagens novas são contadas e o início da janela
+    avança quando o total excede o orçamento do modelo, com folga de
+    `trim_ratio` para que o prefixo enviado não mude a cada turno. Com um
+    summarizer, os turnos descartados viram um resumo anexado à mensagem do
+    sistema.
+    """
+
+    def __init__(
+        self,
+        summarizer: Optional[Callable[[Optional[str], List[Dict]], str]] = None,
+        trim_ratio: float = TRIM_RATIO
+    ):
+        self.summarizer = summarizer
+        self.trim_ratio = trim_ratio
+        self.reset()
+
+    def reset(self) -> None:
+        self.token_counts: List[int] = []
+        self.start = 0
+        self.window_tokens = 0
+        self.summary: Optional[str] = None
+        self.summary_tokens = 0
+        self._system_tokens: Dict[str, int] = {}
+        self._last_budget = 0
+        # Quantas vezes o início da janela mudou (cada mudança invalida o cache de prompt)
+        self.trims = 0
+
+    def rewind(self, length: int) -> None:
+        """Esquece as mensagens a partir de `length` (retiradas do fim do histórico)."""
+        if length >= len(self.token_counts):
+            return
+        self.window_tokens -= sum(self.token_counts[max(length, self.start):])
+        del self.token_counts[length:]
+        self.start = min(self.start, length)
+
+    def _count_system(self, content: str) -> int:
+        # A mensagem do sistema só muda com o idioma, então o valor fica em cache
+        if content not in self._system_tokens:
+            self._system_tokens[content] = count_tokens(content) + MESSAGE_OVERHEAD
+        return self._system_tokens[content]
+
+    def budget(self, model: str, system_content: str = "", max_output_tokens: Optional[int] = None) -> int:
+        reserve = max_output_tokens or DEFAULT_OUTPUT_RESERVE
+        return context_limit(model) - reserve - self._count_system(system_content) - self.summary_tokens
+
+    def advance(
+        self,
+        messages: List[Dict],
+        model: str,
+        system_content: str = "",
+        max_output_tokens: Optional[int] = None
+    ) -> int:
+        """Atualiza a janela com as mensagens novas e retorna o índice do seu início."""
+        # Histórico limpo ou substituído: recomeça a contagem
+        if len(messages) < len(self.token_counts):
+            self.reset()
+
+        for message in messages[len(self.token_counts):]:
+            tokens = message_tokens(message)
+            self.token_counts.append(tokens)
+            self.window_tokens += tokens
+
+        budget = self.budget(model, system_content, max_output_tokens)
+        dropped_from = self.start
+
+        # Descarta os turnos mais antigos até a meta com folga, mas nunca a última mensagem
+        if self.window_tokens > budget:
+            target = int(budget * self.trim_ratio)
+            while self.window_tokens > target and self.start < len(messages) - 1:
+                self.window_tokens -= self.token_counts[self.start]
+                self.start += 1
+
+        # Orçamento maior (troca de modelo): recupera turnos se não houver resumo
+        if self.summary is None and budget > self._last_budget:
+            while self.start > 0 and self.window_tokens + self.token_counts[self.start - 1] <= budget:
+                self.start -= 1
+                self.window_tokens += self.token_counts[self.start]
+        self._last_budget = budget
+
+        # A janela deve começar por uma mensagem do usuário
+        while self.start < len(messages) - 1 and _role(messages, self.start) == 'assistant':
+            self.window_tokens -= self.token_counts[self.start]
+            self.start += 1
+
+        if self.start != dropped_from:
+            self.trims += 1
+
+        if self.summarizer and self.start > dropped_from:
+            self.summary = self.summarizer(self.summary, messages[dropped_from:self.start])
+            self.summary_tokens = count_tokens(self.summary)
+
+        # Turnos fora da janela só voltam a ser lidos em exportações: comprime o conteúdo
+        if isinstance(messages, History):
+            messages.compress_before(self.start)
+        return self.start
+
+    def fit(
+        self,
+        messages: List[Dict],
+        model: str,
+        system_content: str = "",
+        max_output_tokens: Optional[int] = None
+    ) -> List[Dict]:
+        """Retorna a parte mais recente do histórico que cabe no orçamento do modelo."""
+        return messages[self.advance(messages, model, system_content, max_output_tokens):]
+
+    def system_content(self, base: str) -> str:
+        """Mensagem do sistema acrescida do resumo dos turnos descartados."""
+        if self.summary:
+            return f"{base}\n\nResumo da conversa anterior: {self.summary}"
+        return base
@@ -0,0 +1,182 @@
+"""Documentos maiores que a janela de contexto do modelo: chunking + map-reduce.
+
+O texto chega em pedaços (páginas de um PDF, blocos de um arquivo) e é
+dividido em trechos de até `max_tokens` tokens, com `overlap` tokens repetidos
+entre trechos vizinhos. Cada trecho é enviado ao modelo (map) com no máximo
+`max_in_flight` requisições simultâneas, e as respostas parciais são
+combinadas (reduce) em grupos que cabem no orçamento, até sobrar uma só.
+"""
+import asyncio
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from common.context_window import count_tokens, decode_tokens, encode_tokens
+
+TEXT_BLOCK_SIZE = 64 * 1024
+
+_END = object()
+
+
+class TokenChunker:
+    """Divide um fluxo de texto em trechos de até `max_tokens` tokens com sobreposição."""
+
+    def __init__(self, max_tokens: int = 4000, overlap: int = 200):
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap deve ser menor que max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self._tokens: list = []
+        # Tokens do início do buffer que já saíram no trecho anterior (a sobreposição)
+        self._repeated = 0
+
+    def feed(self, text: str) -> Iterator[str]:
+        """Acrescenta texto e gera os trechos que ficaram completos."""
+        self._tokens.extend(encode_tokens(text))
+        while len(self._tokens) >= self.max_tokens:
+            yield decode_tokens(self._tokens[:self.max_tokens])
+            del self._tokens[:self.max_tokens - self.overlap]
+            self._repeated = self.overlap
+
+    def flush(self) -> Iterator[str]:
+        """Gera o último trecho, se houver texto além da sobreposição."""
+        if len(self._tokens) > self._repeated:
+            yield decode_tokens(self._tokens)
+        self._tokens = []
+        self._repeated = 0
+
+
+def iter_chunks(pieces: Iterable[str], max_tokens: int = 4000, overlap: int = 200) -> Iterator[str]:
+    """Trechos de até `max_tokens` tokens a partir de pedaços de texto, sem juntar o documento inteiro."""
+    chunker = TokenChunker(max_tokens, overlap)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+
+def iter_text_file(path: str, block_size: int = TEXT_BLOCK_SIZE) -> Iterator[str]:
+    """Lê um arquivo de texto em blocos de `block_size` caracteres."""
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+class Progress:
+    """Estado do processamento, repassado ao callback `on_progress`."""
+
+    __slots__ = ("stage", "done", "in_flight", "total")
+
+    def __init__(self):
+        self.stage = "map"
+        self.done = 0
+        self.in_flight = 0
+        # Número de trechos; None enquanto o documento ainda está sendo lido
+        self.total: Optional[int] = None
+
+    def __str__(self) -> str:
+        total = self.total if self.total is not None else "?"
+        return f"{self.stage}: {self.done}/{total} trechos ({self.in_flight} em andamento)"
+
+
+async def _bounded_map(
+    items: Iterable,
+    func: Callable[[int, object], Awaitable[str]],
+    max_in_flight: int,
+    progress: Progress,
+    on_progress: Optional[Callable[[Progress], None]]
+) -> List[str]:
+    """Aplica `func` aos itens com no máximo `max_in_flight` chamadas pendentes, na ordem dos itens.
+
+    Os itens são consumidos sob demanda (a leitura do documento roda no
+    executor padrão), então só os trechos em andamento ficam em memória.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(items)
+    results = {}
+    pending = set()
+    index = 0
+    exhausted = False
+
+    async def run(i: int, item) -> None:
+        results[i] = await func(i, item)
+
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                item = await loop.run_in_executor(None, next, iterator, _END)
+                if item is _END:
+                    exhausted = True
+                    progress.total = index
+                    break
+                pending.add(asyncio.ensure_future(run(index, item)))
+                index += 1
+            progress.in_flight = len(pending)
+            if on_progress is not None:
+                on_progress(progress)
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # Propaga o primeiro erro
+            progress.done += len(done)
+    finally:
+        for task in pending:
+            task.cancel()
+    return [results[i] for i in range(index)]
+
+
+def _group_by_tokens(parts: List[str], max_tokens: int) -> List[List[str]]:
+    """Agrupa partes consecutivas cuja soma de tokens cabe em `max_tokens`.
+
+    Um grupo é fechado sempre que a próxima parte estouraria o orçamento, mesmo
+    que fique com uma parte só. Uma parte que sozinha passa do orçamento é
+    dividida em trechos de até `max_tokens`, cada um reduzido separadamente.
+    """
+    groups, current, current_tokens = [], [], 0
+    for part in parts:
+        tokens = count_tokens(part)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        if tokens > max_tokens:
+            # Margem de 10%: recontado, o texto de cada trecho pode dar alguns tokens a mais
+            groups.extend([piece] for piece in iter_chunks([part], max_tokens * 9 // 10, overlap=0))
+            continue
+        current.append(part)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def map_reduce(
+    chunks: Iterable[str],
+    map_fn: Callable[[int, str], Awaitable[str]],
+    reduce_fn: Callable[[List[str]], Awaitable[str]],
+    max_in_flight: int = 4,
+    reduce_tokens: int = 4000,
+    on_progress: Optional[Callable[[Progress], None]] = None
+) -> str:
+    """Processa os trechos com `map_fn(índice, trecho)` e combina as respostas com `reduce_fn(partes)`.
+
+    O reduce é feito em árvore: as respostas parciais são agrupadas até
+    `reduce_tokens` tokens por chamada, até restar uma única resposta.
+    Nenhuma chamada de reduce recebe mais que `reduce_tokens` tokens; se uma
+    rodada não diminuir nem o número de partes nem o total de tokens (um
+    `reduce_fn` que não resume), ValueError.
+    """
+    progress = Progress()
+    parts = await _bounded_map(chunks, map_fn, max_in_flight, progress, on_progress)
+
+    while len(parts) > 1:
+        tokens = sum(count_tokens(part) for part in parts)
+        groups = _group_by_tokens(parts, reduce_tokens)
+        progress.stage, progress.done, progress.total = "reduce", 0, len(groups)
+        reduced = await _bounded_map(
+            groups, lambda _, group: reduce_fn(group), max_in_flight, progress, on_progress
+        )
+        if len(reduced) >= len(parts) and sum(count_tokens(part) for part in reduced) >= tokens:
+            raise ValueError("reduce_fn não está reduzindo as partes; aumente reduce_tokens")
+        parts = reduced
+    return parts[0] if parts else ""
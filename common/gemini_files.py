@@ -0,0 +1,110 @@
+"""Upload de arquivos grandes pela File API do Gemini.
+
+Acima do limite de dados inline da requisição, a mídia é enviada antes pela
+File API (protocolo resumable) e a requisição referencia só o URI do arquivo.
+O corpo do upload sai do disco em blocos (streaming_body.FileRange), então a
+memória não depende do tamanho do arquivo; se a conexão cair no meio, o
+servidor informa quantos bytes recebeu e o envio continua dali.
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+
+import httpx
+
+from common import http_pool
+from common.streaming_body import AsyncBody, FileRange
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+# Limite de tamanho de uma requisição com dados inline (o base64 conta)
+INLINE_LIMIT = 20 * 1024 * 1024
+
+
+def file_part(file: Dict) -> Dict:
+    """Parte da requisição que referencia um arquivo enviado pela File API."""
+    return {"file_data": {"mime_type": file["mimeType"], "file_uri": file["uri"]}}
+
+
+async def _received(client, upload_url: str) -> int:
+    """Bytes que o servidor já recebeu de um upload interrompido."""
+    response = await client.post(upload_url, headers={"X-Goog-Upload-Command": "query"})
+    response.raise_for_status()
+    return int(response.headers.get("X-Goog-Upload-Size-Received", 0))
+
+
+async def upload_file(
+    path: str,
+    api_key: str,
+    mime_type: str,
+    display_name: Optional[str] = None,
+    base_url: str = DEFAULT_BASE_URL,
+    max_attempts: int = 3,
+    wait_active: bool = True,
+    poll_interval: float = 2.0,
+    timeout: float = 600.0
+) -> Dict:
+    """Envia o arquivo e retorna o recurso `file` (com `uri`), já pronto para uso."""
+    client = http_pool.get_async_client()
+    size = os.path.getsize(path)
+
+    start = await client.post(
+        f"{base_url}/upload/v1beta/files",
+        params={"key": api_key},
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type
+        },
+        json={"file": {"display_name": display_name or os.path.basename(path)}}
+    )
+    start.raise_for_status()
+    upload_url = start.headers["X-Goog-Upload-URL"]
+
+    offset = 0
+    for attempt in range(1, max_attempts + 1):
+        body = FileRange(path, offset, size)
+        try:
+            response = await client.post(
+                upload_url,
+                headers={
+                    "Content-Length": str(len(body)),
+                    "X-Goog-Upload-Offset": str(offset),
+                    "X-Goog-Upload-Command": "upload, finalize"
+                },
+                content=AsyncBody(body)
+            )
+            response.raise_for_status()
+            break
+        except httpx.TransportError:
+            if attempt == max_attempts:
+                raise
+            offset = await _received(client, upload_url)
+    file = response.json()["file"]
+
+    if wait_active:
+        file = await wait_until_active(file, api_key, base_url, poll_interval, timeout)
+    return file
+
+
+async def wait_until_active(
+    file: Dict,
+    api_key: str,
+    base_url: str = DEFAULT_BASE_URL,
+    poll_interval: float = 2.0,
+    timeout: float = 600.0
+) -> Dict:
+    """Espera o processamento do arquivo (vídeos ficam em PROCESSING por um tempo)."""
+    client = http_pool.get_async_client()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while file.get("state", "ACTIVE") == "PROCESSING":
+        if loop.time() >= deadline:
+            raise TimeoutError(f"Arquivo {file['name']} ainda em processamento após {timeout:.0f} s")
+        await asyncio.sleep(poll_interval)
+        response = await client.get(f"{base_url}/v1beta/{file['name']}", params={"key": api_key})
+        response.raise_for_status()
+        file = response.json()
+    if file.get("state") == "FAILED":
+        raise ValueError(f"Falha no processamento do arquivo {file['name']}: {file.get('error')}")
+    return file
@@ -0,0 +1,333 @@
+"""Requisições com hedge: dispara um segundo provedor/modelo quando o primeiro demora.
+
+O atraso do hedge vem de um percentil do histograma de latências do candidato
+anterior. A primeira resposta completa vence e as demais são canceladas.
+
+Perdedores cancelados ou descartados registram o tempo decorrido até o
+cancelamento (amostra censurada, um limite inferior da latência real): sem
+elas o histograma só veria as respostas rápidas e o p95 cairia a cada hedge.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def _bucket_bounds(start: float = 0.001, factor: float = 1.25, limit: float = 600.0) -> List[float]:
+    bounds = [start]
+    while bounds[-1] < limit:
+        bounds.append(bounds[-1] * factor)
+    return bounds
+
+
+class LatencyHistogram:
+    """Histograma de latências com buckets logarítmicos (memória constante).
+
+    Os buckets crescem 25% a cada passo, de 1 ms a 10 min, então o erro de um
+    percentil estimado fica abaixo de 25%.
+    """
+
+    BOUNDS = _bucket_bounds()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.BOUNDS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Limite superior do bucket que contém o percentil p (0-100)."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = self.count * p / 100
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= target and count:
+                    return self.BOUNDS[min(index, len(self.BOUNDS) - 1)]
+            return self.BOUNDS[-1]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99)
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    """Histograma compartilhado de um provedor/modelo (ex.: "perplexity:sonar-small")."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram())
+    return histogram
+
+
+def get_latency_stats() -> Dict[str, Dict]:
+    return {name: histogram.snapshot() for name, histogram in list(_histograms.items())}
+
+
+class _Attempt:
+    """Uma execução de candidato; a latência é registrada uma única vez.
+
+    Quem chamar record() primeiro vence: a própria execução ao terminar com
+    sucesso, ou o Hedger ao cancelar/descartar o perdedor (amostra censurada).
+    """
+
+    __slots__ = ("name", "start", "_recorded", "_lock")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self._recorded = False
+        self._lock = threading.Lock()
+
+    def record(self) -> None:
+        with self._lock:
+            if self._recorded:
+                return
+            self._recorded = True
+        get_histogram(self.name).record(time.perf_counter() - self.start)
+
+
+class HedgeError(Exception):
+    """Todos os candidatos falharam."""
+
+
+class Hedger:
+    """Executa candidatos em cascata: o próximo só é disparado se o anterior demorar.
+
+    Cada candidato é um par (nome, função). O nome identifica o histograma de
+    latências usado para calcular o atraso do hedge; enquanto houver menos de
+    `min_samples` amostras, vale `default_delay`. Se um candidato falhar, o
+    próximo é disparado imediatamente.
+
+    `accept` permite tratar respostas de erro devolvidas como valor (por
+    exemplo, o dicionário {'error': ...} do PerplexityChat) como falhas.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        default_delay: float = 1.0,
+        max_workers: int = 16,
+        accept: Optional[Callable[[Any], bool]] = None
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.accept = accept
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        # Execuções síncronas ainda ocupando uma thread do executor (inclui perdedores)
+        self._in_flight = 0
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "hedges_skipped": 0, "failures": 0}
+
+    def delay_for(self, name: str) -> float:
+        histogram = get_histogram(name)
+        if histogram.count < self.min_samples:
+            return self.default_delay
+        return histogram.percentile(self.percentile)
+
+    def _accepted(self, result: Any) -> bool:
+        return self.accept is None or self.accept(result)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    # Versão síncrona, para os clientes baseados em requests/SDKs bloqueantes
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        return self._executor
+
+    def _timed(self, attempt: _Attempt, func: Callable[[], Any]) -> Any:
+        try:
+            result = func()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if self._accepted(result):
+            attempt.record()
+        return result
+
+    def _pool_full(self) -> bool:
+        with self._lock:
+            return self._in_flight >= self._max_workers
+
+    def run(self, candidates: List[Tuple[str, Callable[[], Any]]]) -> Tuple[str, Any]:
+        """Retorna (nome, resultado) do primeiro candidato que responder com sucesso.
+
+        Chamadas bloqueantes não podem ser interrompidas: o perdedor continua
+        em segundo plano, ocupando sua thread até a chamada retornar, e seu
+        resultado é descartado. Para que perdedores lentos não encham o
+        executor (e enfileirem os candidatos seguintes atrás deles), o hedge
+        por atraso só é disparado com uma thread livre; sem ela, a chamada
+        espera o candidato atual (stats["hedges_skipped"]). Falhas continuam
+        disparando o próximo candidato. Cada candidato deve usar seu próprio
+        cliente (o histórico de conversa não é compartilhado).
+        """
+        self._count("calls")
+        pending = list(candidates)
+        running: Dict[Any, Tuple[int, _Attempt]] = {}
+        errors: List[BaseException] = []
+
+        def launch() -> float:
+            index = len(candidates) - len(pending)
+            name, func = pending.pop(0)
+            attempt = _Attempt(name)
+            with self._lock:
+                self._in_flight += 1
+            running[self.executor.submit(self._timed, attempt, func)] = (index, attempt)
+            return time.monotonic() + self.delay_for(name)
+
+        next_hedge_at: Optional[float] = launch()
+        while running:
+            timeout = max(next_hedge_at - time.monotonic(), 0) if pending and next_hedge_at is not None else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if self._pool_full():
+                    self._count("hedges_skipped")
+                    next_hedge_at = None
+                    continue
+                self._count("hedged")
+                next_hedge_at = launch()
+                continue
+
+            failed = 0
+            for future in done:
+                index, attempt = running.pop(future)
+                name = attempt.name
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    failed += 1
+                    continue
+                if not self._accepted(result):
+                    errors.append(HedgeError(f"{name}: resposta rejeitada"))
+                    failed += 1
+                    continue
+                for other, (_, other_attempt) in running.items():
+                    # Amostra censurada: o perdedor durou pelo menos até aqui
+                    other_attempt.record()
+                    if other.cancel():
+                        with self._lock:
+                            self._in_flight -= 1
+                if index > 0:
+                    self._count("hedge_wins")
+                return name, result
+
+            # Cada falha dispara o próximo já, mesmo com outro candidato em andamento
+            for _ in range(min(failed, len(pending))):
+                next_hedge_at = launch()
+
+        self._count("failures")
+        raise HedgeError("Todos os candidatos falharam") from (errors[-1] if errors else None)
+
+    # Versão assíncrona, para o AsyncEngine e os clientes baseados em httpx
+
+    async def _atimed(self, attempt: _Attempt, factory: Callable[[], Awaitable]) -> Any:
+        result = await factory()
+        if self._accepted(result):
+            attempt.record()
+        return result
+
+    async def arun(self, candidates: List[Tuple[str, Callable[[], Awaitable]]]) -> Tuple[str, Any]:
+        """Como run(), mas o perdedor é cancelado de fato (a conexão é liberada)."""
+        self._count("calls")
+        pending = list(candidates)
+        running: Dict[asyncio.Task, Tuple[int, _Attempt]] = {}
+        errors: List[BaseException] = []
+        loop = asyncio.get_running_loop()
+
+        def launch() -> float:
+            index = len(candidates) - len(pending)
+            name, factory = pending.pop(0)
+            attempt = _Attempt(name)
+            running[asyncio.ensure_future(self._atimed(attempt, factory))] = (index, attempt)
+            return loop.time() + self.delay_for(name)
+
+        next_hedge_at = launch()
+        try:
+            while running:
+                timeout = max(next_hedge_at - loop.time(), 0) if pending else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._count("hedged")
+                    next_hedge_at = launch()
+                    continue
+
+                failed = 0
+                for task in done:
+                    index, attempt = running.pop(task)
+                    name = attempt.name
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        failed += 1
+                        continue
+                    result = task.result()
+                    if not self._accepted(result):
+                        errors.append(HedgeError(f"{name}: resposta rejeitada"))
+                        failed += 1
+                        continue
+                    if index > 0:
+                        self._count("hedge_wins")
+                    return name, result
+
+                for _ in range(min(failed, len(pending))):
+                    next_hedge_at = launch()
+        finally:
+            for task, (_, attempt) in running.items():
+                # Amostra censurada: o perdedor durou pelo menos até o cancelamento
+                attempt.record()
+                task.cancel()
+
+        self._count("failures")
+        raise HedgeError("Todos os candidatos falharam") from (errors[-1] if errors else None)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+_shared: Optional[Hedger] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_hedger() -> Hedger:
+    """Instância compartilhada pelos clientes com modo hedge (PerplexityChat)."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = Hedger()
+    return _shared
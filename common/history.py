@@ -0,0 +1,198 @@
+"""Histórico de conversa com representação compacta em memória.
+
+Cada mensagem vira um registro com __slots__ (papel internado, conteúdo e
+demais chaves) em vez de um dict. O conteúdo das mensagens que já saíram da
+janela de contexto (turnos frios) pode ser comprimido com zlib. O acesso por
+índice, fatia ou iteração devolve dicts novos com as mesmas chaves, na mesma
+ordem e com os mesmos valores da mensagem original, ou seja, exatamente o que
+os clientes enviam às APIs. Para só consultar o papel de uma mensagem (como
+faz o ContextWindow a cada turno), `role(índice)` lê o registro diretamente.
+"""
+import json
+import sys
+import zlib
+from collections.abc import MutableSequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Conteúdos menores que isso não compensam a compressão
+COMPRESS_MIN_CHARS = 256
+
+_STANDARD_KEYS = ("role", "content")
+
+
+def _deep_size(value) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(_deep_size(item) for item in value.values())
+    return size
+
+
+class Message:
+    """Uma mensagem do histórico; `extra` guarda as chaves além de role/content (ex.: citations)."""
+
+    __slots__ = ("role", "_content", "extra", "_order")
+
+    def __init__(
+        self,
+        role: Optional[str],
+        content,
+        extra: Optional[Dict] = None,
+        order: Optional[tuple] = None
+    ):
+        self.role = sys.intern(role) if isinstance(role, str) else role
+        self._content = content
+        self.extra = extra or None
+        # Ordem das chaves, só quando difere de role, content, extras
+        self._order = order
+
+    @classmethod
+    def from_dict(cls, message: Dict) -> "Message":
+        keys = tuple(message)
+        extra = {sys.intern(key): value for key, value in message.items() if key not in _STANDARD_KEYS}
+        order = None if keys[:2] == _STANDARD_KEYS else tuple(sys.intern(key) for key in keys)
+        return cls(message.get('role'), message.get('content'), extra, order)
+
+    @property
+    def content(self):
+        content = self._content
+        if isinstance(content, bytes):
+            return zlib.decompress(content).decode('utf-8')
+        return content
+
+    @property
+    def compressed(self) -> bool:
+        return isinstance(self._content, bytes) or isinstance(self.extra, bytes)
+
+    def compress(self, min_chars: int = COMPRESS_MIN_CHARS) -> int:
+        """Comprime o conteúdo e as chaves extras, se valer a pena; retorna os bytes economizados."""
+        saved = 0
+        content = self._content
+        if isinstance(content, str) and len(content) >= min_chars:
+            packed = zlib.compress(content.encode('utf-8'))
+            if sys.getsizeof(packed) < sys.getsizeof(content):
+                saved += sys.getsizeof(content) - sys.getsizeof(packed)
+                self._content = packed
+        if isinstance(self.extra, dict):
+            # As chaves extras vão para a API em JSON, então o ida e volta por JSON é exato
+            try:
+                packed = zlib.compress(json.dumps(self.extra, ensure_ascii=False).encode('utf-8'))
+            except (TypeError, ValueError):
+                return saved
+            if sys.getsizeof(packed) < _deep_size(self.extra):
+                saved += _deep_size(self.extra) - sys.getsizeof(packed)
+                self.extra = packed
+        return saved
+
+    def to_dict(self) -> Dict:
+        message = {"role": self.role, "content": self.content}
+        extra = self.extra
+        if isinstance(extra, bytes):
+            extra = json.loads(zlib.decompress(extra))
+        if extra:
+            message.update(extra)
+        if self._order is not None:
+            message = {key: message[key] for key in self._order}
+        return message
+
+    def nbytes(self) -> int:
+        """Memória aproximada do registro (o papel internado é compartilhado e não entra na conta)."""
+        size = sys.getsizeof(self) + sys.getsizeof(self._content)
+        if self.extra:
+            size += _deep_size(self.extra)
+        return size
+
+
+class History(MutableSequence):
+    """Lista de mensagens com o comportamento de List[Dict], guardada como registros Message.
+
+    Os dicts devolvidos são cópias: alterá-los não altera o histórico. Use
+    `compress_before(índice)` (o ContextWindow faz isso a cada turno) para
+    comprimir o conteúdo das mensagens que saíram da janela.
+    """
+
+    def __init__(self, messages: Iterable[Dict] = (), compress_min_chars: Optional[int] = COMPRESS_MIN_CHARS):
+        self.compress_min_chars = compress_min_chars
+        self._records: List[Message] = []
+        self._nbytes = 0
+        self._cold = 0  # Registros do início que já passaram por compress_before
+        self.extend(messages)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [record.to_dict() for record in self._records[index]]
+        return self._records[index].to_dict()
+
+    def __iter__(self) -> Iterator[Dict]:
+        for record in self._records:
+            yield record.to_dict()
+
+    def role(self, index: int) -> Optional[str]:
+        """Papel da mensagem `index`, sem montar o dict nem descomprimir o conteúdo."""
+        return self._records[index].role
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            self._records[index] = [Message.from_dict(message) for message in value]
+        else:
+            self._records[index] = Message.from_dict(value)
+        self._recount()
+
+    def __delitem__(self, index) -> None:
+        del self._records[index]
+        self._recount()
+
+    def insert(self, index: int, message: Dict) -> None:
+        self._records.insert(index, Message.from_dict(message))
+        self._recount()
+
+    def append(self, message: Dict) -> None:
+        record = Message.from_dict(message)
+        self._records.append(record)
+        self._nbytes += record.nbytes()
+
+    def extend(self, messages: Iterable[Dict]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def clear(self) -> None:
+        self._records.clear()
+        self._nbytes = 0
+        self._cold = 0
+
+    def _recount(self) -> None:
+        # Alterações no meio da lista (raras): recalcula tudo
+        self._nbytes = sum(record.nbytes() for record in self._records)
+        self._cold = 0
+
+    def compress_before(self, index: int) -> None:
+        """Comprime o conteúdo das mensagens anteriores a `index` (cada uma é visitada uma vez)."""
+        if self.compress_min_chars is None:
+            return
+        index = min(index, len(self._records))
+        for record in self._records[self._cold:index]:
+            self._nbytes -= record.compress(self.compress_min_chars)
+        self._cold = max(self._cold, index)
+
+    @property
+    def nbytes(self) -> int:
+        """Memória aproximada das mensagens, incluindo a lista de registros."""
+        return self._nbytes + sys.getsizeof(self._records)
+
+    def to_list(self) -> List[Dict]:
+        """As mensagens no formato enviado às APIs (para json.dump, por exemplo)."""
+        return [record.to_dict() for record in self._records]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, History):
+            other = other.to_list()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self.to_list() == other
+
+    def __repr__(self) -> str:
+        return f"History({len(self._records)} mensagens, ~{self.nbytes} bytes)"
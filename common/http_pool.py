@@ -0,0 +1,269 @@
+import asyncio
+import atexit
+import importlib.util
+import socket
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from common.metrics import current_call
+
+
+class PoolConfig:
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        host_pool_sizes: Optional[Dict[str, int]] = None,
+        keep_alive: bool = True,
+        http2: bool = True,
+        timeout: float = 60.0,
+        max_retries: int = 0
+    ):
+        self.pool_connections = pool_connections  # Número de hosts mantidos em cache
+        self.pool_maxsize = pool_maxsize  # Conexões ociosas mantidas por host
+        self.host_pool_sizes = host_pool_sizes or {}  # Ex.: {"api.perplexity.ai": 32}
+        self.keep_alive = keep_alive
+        # Só o cliente assíncrono (httpx) usa HTTP/2, e só com o pacote h2 instalado;
+        # a sessão requests fala sempre HTTP/1.1
+        self.http2 = http2
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+
+class PoolStats:
+    """Contadores de reaproveitamento de conexões por host."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def record_request(self, host: str) -> None:
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+
+    def record_miss(self, host: str) -> None:
+        with self._lock:
+            self._misses[host] = self._misses.get(host, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Retorna requisições, hits (conexão reaproveitada) e misses (nova conexão) por host."""
+        with self._lock:
+            stats = {}
+            for host, total in self._requests.items():
+                misses = self._misses.get(host, 0)
+                stats[host] = {
+                    "requests": total,
+                    "hits": max(total - misses, 0),
+                    "misses": misses
+                }
+            return stats
+
+    def reset(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._misses.clear()
+
+
+POOL_STATS = PoolStats()
+
+
+class _TimedConnectionMixin:
+    """Mede DNS e conexão TCP quando há uma chamada com métricas em andamento."""
+
+    def _new_conn(self):
+        call = current_call()
+        if call is None:
+            return super()._new_conn()
+
+        inicio = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            return super()._new_conn()  # Deixa o urllib3 reportar o erro de resolução
+        resolvido = time.perf_counter()
+        call.add_phase("dns", resolvido - inicio)
+
+        # Conecta ao endereço já resolvido; Host e SNI continuam usando self.host
+        dns_host = self._dns_host
+        self._dns_host = infos[0][4][0]
+        try:
+            conn = super()._new_conn()
+        except Exception:
+            self._dns_host = dns_host
+            conn = super()._new_conn()  # Tenta os demais endereços, como sem métricas
+        finally:
+            self._dns_host = dns_host
+        call.add_phase("connect", time.perf_counter() - resolvido)
+        return conn
+
+
+# Cada chamada a connect() abre um socket novo (TCP + TLS), ou seja, um miss do pool
+class _CountingHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    def connect(self):
+        POOL_STATS.record_miss(self.host)
+        super().connect()
+
+
+class _CountingHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        POOL_STATS.record_miss(self.host)
+        call = current_call()
+        if call is None:
+            return super().connect()
+        antes = (call.dns or 0.0) + (call.connect or 0.0)
+        inicio = time.perf_counter()
+        super().connect()
+        # O que não foi DNS nem TCP dentro de connect() é o handshake TLS
+        call.add_phase("tls", time.perf_counter() - inicio - ((call.dns or 0.0) + (call.connect or 0.0) - antes))
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        POOL_STATS.record_request(self.host)
+        return super()._get_conn(timeout)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        POOL_STATS.record_request(self.host)
+        return super()._get_conn(timeout)
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter que usa pools instrumentados com contadores de hit/miss."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool
+        }
+
+
+_lock = threading.Lock()
+_config = PoolConfig()
+_session: Optional[requests.Session] = None
+# Um cliente assíncrono por event loop (clientes httpx não podem mudar de loop)
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _build_session(config: PoolConfig) -> requests.Session:
+    session = requests.Session()
+    default_adapter = PooledAdapter(
+        pool_connections=config.pool_connections,
+        pool_maxsize=config.pool_maxsize,
+        max_retries=config.max_retries
+    )
+    session.mount("http://", default_adapter)
+    session.mount("https://", default_adapter)
+
+    # Pools dedicados para hosts com tamanho específico
+    for host, size in config.host_pool_sizes.items():
+        adapter = PooledAdapter(pool_connections=1, pool_maxsize=size, max_retries=config.max_retries)
+        session.mount(f"https://{host}", adapter)
+        session.mount(f"http://{host}", adapter)
+
+    if not config.keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def configure_pool(config: PoolConfig) -> None:
+    """Substitui a configuração do pool compartilhado, fechando as conexões atuais."""
+    global _config, _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _config = config
+        _session = None
+
+
+def get_pool_config() -> PoolConfig:
+    return _config
+
+
+def get_session() -> requests.Session:
+    """Retorna a sessão HTTP compartilhada pelo processo (criada sob demanda)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session(_config)
+    return _session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Executa uma requisição reaproveitando as conexões do pool compartilhado."""
+    kwargs.setdefault("timeout", _config.timeout)
+    return get_session().request(method, url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def get_async_client():
+    """Retorna o httpx.AsyncClient compartilhado pelo event loop atual."""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=_config.pool_connections * _config.pool_maxsize + sum(_config.host_pool_sizes.values()),
+            max_keepalive_connections=_config.pool_maxsize if _config.keep_alive else 0
+        )
+        # HTTP/2 só é habilitado quando o pacote h2 está instalado
+        http2 = _config.http2 and importlib.util.find_spec("h2") is not None
+        client = httpx.AsyncClient(limits=limits, http2=http2, timeout=_config.timeout)
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client() -> None:
+    """Fecha o cliente assíncrono do event loop atual."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def get_pool_stats(host: Optional[str] = None) -> Dict:
+    """Retorna os contadores de hit/miss (de um host, se informado)."""
+    stats = POOL_STATS.snapshot()
+    if host is not None:
+        host = urlsplit(host).hostname or host
+        return stats.get(host, {"requests": 0, "hits": 0, "misses": 0})
+    return stats
+
+
+def reset_pool_stats() -> None:
+    POOL_STATS.reset()
+
+
+def close_pool() -> None:
+    """Fecha todas as conexões mantidas pelo pool."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+atexit.register(close_pool)
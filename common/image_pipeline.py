@@ -0,0 +1,74 @@
+import base64
+import io
+import threading
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Buffer de saída reaproveitado entre chamadas (um por thread)
+_local = threading.local()
+
+
+def _output_buffer() -> io.BytesIO:
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    return buffer
+
+
+def target_size(size: Tuple[int, int], max_size: int) -> Optional[Tuple[int, int]]:
+    """Tamanho final mantendo a proporção, ou None se a imagem já cabe em max_size."""
+    if max(size) <= max_size:
+        return None
+    ratio = max_size / max(size)
+    return tuple(int(dim * ratio) for dim in size)
+
+
+def _encode_jpeg(
+    image_path: str,
+    max_size: int,
+    quality: int,
+    resample: int,
+    reducing_gap: Optional[float]
+) -> io.BytesIO:
+    buffer = _output_buffer()
+    with Image.open(image_path) as img:
+        new_size = target_size(img.size, max_size)
+        # JPEG: o decoder já reduz a escala (1/2, 1/4, 1/8) e entrega RGB
+        if new_size is not None:
+            img.draft('RGB', new_size)
+        else:
+            img.draft('RGB', img.size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if new_size is not None and img.size != new_size:
+            img = img.resize(new_size, resample, reducing_gap=reducing_gap)
+        img.save(buffer, format='JPEG', quality=quality)
+    return buffer
+
+
+def encode_image_jpeg(
+    image_path: str,
+    max_size: int = 2048,
+    quality: int = 85,
+    resample: int = Image.Resampling.LANCZOS,
+    reducing_gap: Optional[float] = 3.0
+) -> bytes:
+    """Redimensiona e codifica em JPEG; o base64 fica para o envio (streaming_body.InlineBytes)."""
+    return _encode_jpeg(image_path, max_size, quality, resample, reducing_gap).getvalue()
+
+
+def encode_image_base64(
+    image_path: str,
+    max_size: int = 2048,
+    quality: int = 85,
+    resample: int = Image.Resampling.LANCZOS,
+    reducing_gap: Optional[float] = 3.0
+) -> str:
+    """Redimensiona, codifica em JPEG e retorna o base64 sem cópias intermediárias do buffer."""
+    buffer = _encode_jpeg(image_path, max_size, quality, resample, reducing_gap)
+    with buffer.getbuffer() as view:
+        return base64.b64encode(view).decode('ascii')
+
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    base = os.getenv("AI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-introduction"))
+    return os.path.join(base, "media")
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class MediaCache:
+    """Cache em disco de mídia já processada, endereçado pelo conteúdo.
+
+    A chave combina o hash do conteúdo de entrada com a operação e seus
+    parâmetros, então o mesmo arquivo reenviado (mesmo com outro nome) não é
+    processado de novo. Quando o total passa de `max_bytes`, as entradas
+    usadas há mais tempo são removidas.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(content_hash: str, operation: str, params: Optional[Dict] = None) -> str:
+        raw = json.dumps([content_hash, operation, params or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        # Atualiza o mtime, usado como "último acesso" na evicção
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Removido por uma evicção em outra thread depois da leitura
+            pass
+        with self._lock:
+            self.stats["hits"] += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Remove até ficar em 90% do limite, para não varrer o diretório a cada escrita
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+            self.stats["evictions"] += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+
+_shared_cache: Optional[MediaCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_media_cache() -> MediaCache:
+    """Cache de mídia compartilhado pelo processo (diretório em AI_CACHE_DIR)."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = MediaCache()
+    return _shared_cache
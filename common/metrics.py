@@ -0,0 +1,388 @@
+"""Métricas de latência e tokens por chamada, para todos os clientes de chat.
+
+Cada chamada gera um CallMetrics com as fases de rede (DNS, conexão TCP, TLS),
+tempo até o primeiro token, latência total, bytes enviados/recebidos, tokens
+de entrada/saída (e quantos dos de entrada vieram do cache de prompt do
+provedor) e número de retentativas. Os registros vão para os sinks
+configurados: agregação em memória (exportada em texto Prometheus ou arquivo
+OpenMetrics) e/ou um arquivo JSON lines.
+
+Desabilitado por padrão: nesse caso start_call() retorna None e o custo por
+chamada é uma única verificação.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+_current: contextvars.ContextVar = contextvars.ContextVar("ai_call_metrics", default=None)
+_sinks: List["MetricsSink"] = []
+
+# Buckets (em segundos) dos histogramas exportados
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class CallMetrics:
+    """Medições de uma chamada a um provedor (tempos em segundos)."""
+
+    __slots__ = (
+        "provider", "model", "started_at", "_start", "dns", "connect", "tls", "ttft", "total",
+        "bytes_out", "bytes_in", "prompt_tokens", "completion_tokens", "cached_tokens", "retries", "status",
+        "error", "_phase_start", "_streaming"
+    )
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.dns = self.connect = self.tls = self.ttft = self.total = None
+        self.bytes_out = self.bytes_in = 0
+        self.prompt_tokens = self.completion_tokens = self.cached_tokens = None
+        self.retries = 0
+        self.status = None
+        self.error = None
+        self._phase_start: Dict[str, float] = {}
+        self._streaming = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def mark_first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = self.elapsed()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Soma o tempo de uma fase de rede (uma retentativa pode abrir outra conexão)."""
+        setattr(self, name, (getattr(self, name) or 0.0) + seconds)
+
+    def set_usage(self, usage: Optional[Dict]) -> None:
+        """Lê o uso de tokens nos formatos OpenAI/Perplexity/Groq, Gemini e Anthropic."""
+        if not usage:
+            return
+        usage = _usage_dict(usage)
+        for prompt_key, completion_key in (
+            ("prompt_tokens", "completion_tokens"),
+            ("promptTokenCount", "candidatesTokenCount"),
+            ("input_tokens", "output_tokens")
+        ):
+            if prompt_key in usage or completion_key in usage:
+                self.prompt_tokens = usage.get(prompt_key)
+                self.completion_tokens = usage.get(completion_key)
+                break
+        self.cached_tokens = cached_prompt_tokens(usage)
+        if "cache_read_input_tokens" in usage and self.prompt_tokens is not None:
+            # Na Anthropic, input_tokens não inclui o que foi lido ou gravado no cache
+            self.prompt_tokens += (usage.get("cache_read_input_tokens") or 0) + (usage.get("cache_creation_input_tokens") or 0)
+
+    def record_response(self, response, body_out: Optional[bytes] = None) -> None:
+        """Atalho para respostas não-streaming de requests/httpx."""
+        self.status = response.status_code
+        if body_out is not None:
+            self.bytes_out += len(body_out)
+        self.bytes_in += len(response.content)
+        self.mark_first_token()
+
+    async def httpx_trace(self, event_name: str, info: Dict) -> None:
+        """Callback de trace do httpcore: mede conexão, TLS e o primeiro byte da resposta.
+
+        Em streaming os cabeçalhos chegam antes do primeiro token; lá o TTFT fica
+        com mark_first_token(), chamado quando o primeiro delta é lido.
+        """
+        now = time.perf_counter()
+        if event_name.endswith(".started"):
+            self._phase_start[event_name[:-len(".started")]] = now
+            return
+        if not event_name.endswith(".complete"):
+            return
+        phase = event_name[:-len(".complete")]
+        started = self._phase_start.pop(phase, None)
+        if phase == "connection.connect_tcp" and started is not None:
+            # O httpcore resolve o nome dentro do connect_tcp: DNS fica incluído aqui
+            self.add_phase("connect", now - started)
+        elif phase == "connection.start_tls" and started is not None:
+            self.add_phase("tls", now - started)
+        elif phase.endswith("receive_response_headers") and self.ttft is None and not self._streaming:
+            self.ttft = now - self._start
+
+    def httpx_extensions(self, streaming: bool = False) -> Dict:
+        """Extensões do httpx; com `streaming`, o TTFT não é tirado dos cabeçalhos."""
+        self._streaming = streaming
+        return {"trace": self.httpx_trace}
+
+    def as_dict(self) -> Dict:
+        record = {name: getattr(self, name) for name in self.__slots__ if not name.startswith("_")}
+        for name in ("dns", "connect", "tls", "ttft", "total"):
+            if record[name] is not None:
+                record[name] = round(record[name], 6)
+        return record
+
+
+def _usage_dict(usage) -> Dict:
+    if isinstance(usage, dict):
+        return usage
+    # Objetos pydantic dos SDKs (openai, groq)
+    return usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+
+
+def cached_prompt_tokens(usage) -> Optional[int]:
+    """Tokens de entrada servidos pelo cache de prompt do provedor (OpenAI, Anthropic, Gemini), se informados."""
+    if not usage:
+        return None
+    usage = _usage_dict(usage)
+    details = usage.get("prompt_tokens_details")
+    if details:
+        return _usage_dict(details).get("cached_tokens")
+    if "cache_read_input_tokens" in usage:
+        return usage["cache_read_input_tokens"]
+    return usage.get("cachedContentTokenCount")
+
+
+class MetricsSink:
+    """Destino dos registros de cada chamada."""
+
+    def record(self, call: CallMetrics) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class AggregateSink(MetricsSink):
+    """Agrega contadores e histogramas por provedor/modelo para exportação."""
+
+    COUNTERS = (
+        ("requests", "Chamadas aos provedores"),
+        ("errors", "Chamadas que terminaram em erro"),
+        ("retries", "Retentativas"),
+        ("bytes_out", "Bytes enviados"),
+        ("bytes_in", "Bytes recebidos"),
+        ("prompt_tokens", "Tokens de entrada"),
+        ("completion_tokens", "Tokens de saída"),
+        ("cached_tokens", "Tokens de entrada lidos do cache de prompt do provedor")
+    )
+    HISTOGRAMS = (
+        ("total", "request_duration_seconds", "Latência total da chamada"),
+        ("ttft", "time_to_first_token_seconds", "Tempo até o primeiro token"),
+        ("dns", "dns_seconds", "Resolução de nome"),
+        ("connect", "connect_seconds", "Conexão TCP"),
+        ("tls", "tls_seconds", "Handshake TLS")
+    )
+
+    def __init__(self, prefix: str = "ai"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self.histograms: Dict[Tuple[str, str], Dict[str, _Histogram]] = {}
+
+    def record(self, call: CallMetrics) -> None:
+        key = (call.provider, call.model)
+        with self._lock:
+            counters = self.counters.get(key)
+            if counters is None:
+                counters = self.counters[key] = {name: 0 for name, _ in self.COUNTERS}
+                self.histograms[key] = {field: _Histogram() for field, _, _ in self.HISTOGRAMS}
+            counters["requests"] += 1
+            counters["errors"] += call.error is not None
+            counters["retries"] += call.retries
+            counters["bytes_out"] += call.bytes_out
+            counters["bytes_in"] += call.bytes_in
+            counters["prompt_tokens"] += call.prompt_tokens or 0
+            counters["completion_tokens"] += call.completion_tokens or 0
+            counters["cached_tokens"] += call.cached_tokens or 0
+            for field, histogram in self.histograms[key].items():
+                value = getattr(call, field)
+                if value is not None:
+                    histogram.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self, openmetrics: bool = False) -> str:
+        """Texto no formato de exposição do Prometheus (ou OpenMetrics)."""
+        lines = []
+        with self._lock:
+            for name, help_text in self.COUNTERS:
+                metric = f"{self.prefix}_{name}"
+                # OpenMetrics declara a família sem o sufixo _total; o Prometheus clássico, com
+                family = metric if openmetrics else f"{metric}_total"
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} counter")
+                for (provider, model), counters in self.counters.items():
+                    lines.append(f'{metric}_total{{provider="{provider}",model="{model}"}} {counters[name]}')
+
+            for field, name, help_text in self.HISTOGRAMS:
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                if openmetrics:
+                    lines.append(f"# UNIT {metric} seconds")
+                for (provider, model), histograms in self.histograms.items():
+                    histogram = histograms[field]
+                    labels = f'provider="{provider}",model="{model}"'
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class JsonlSink(MetricsSink):
+    """Acrescenta um registro JSON por chamada ao arquivo."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, call: CallMetrics) -> None:
+        line = json.dumps(call.as_dict(), ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def enable_metrics(*sinks: MetricsSink) -> AggregateSink:
+    """Liga as métricas; sem argumentos usa só a agregação em memória, que é retornada."""
+    aggregate = next((sink for sink in sinks if isinstance(sink, AggregateSink)), None)
+    if aggregate is None:
+        aggregate = AggregateSink()
+        sinks = (aggregate,) + sinks
+    _sinks[:] = sinks
+    return aggregate
+
+
+def disable_metrics() -> None:
+    for sink in _sinks:
+        sink.close()
+    _sinks.clear()
+
+
+def metrics_enabled() -> bool:
+    return bool(_sinks)
+
+
+def start_call(provider: str, model: str) -> Optional[CallMetrics]:
+    """Inicia a medição de uma chamada, ou retorna None se as métricas estão desligadas."""
+    if not _sinks:
+        return None
+    return CallMetrics(provider, model)
+
+
+def finish_call(call: Optional[CallMetrics], error: Optional[str] = None) -> None:
+    if call is None:
+        return
+    call.total = call.elapsed()
+    if error is not None:
+        call.error = error
+    for sink in _sinks:
+        sink.record(call)
+
+
+class _Activation:
+    """Põe uma chamada no contexto atual; ao sair, restaura o anterior."""
+
+    __slots__ = ("call", "_token")
+
+    def __init__(self, call: CallMetrics):
+        self.call = call
+        self._token = None
+
+    def __enter__(self) -> CallMetrics:
+        self._token = _current.set(self.call)
+        return self.call
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current.reset(self._token)
+        return False
+
+
+class _Tracking(_Activation):
+    """Como _Activation, e ao sair registra a chamada (com o erro, se houver)."""
+
+    __slots__ = ()
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current.reset(self._token)
+        finish_call(self.call, exc_type.__name__ if exc_type is not None else None)
+        return False
+
+
+class _Disabled:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+# Com as métricas desligadas, track()/activate() devolvem sempre este objeto
+_DISABLED = _Disabled()
+
+
+def activate(call: Optional[CallMetrics]):
+    """Torna `call` a chamada atual do contexto (para o pool HTTP e o rate limiter).
+
+    Em geradores, use só em trechos sem yield; com None não faz nada.
+    """
+    return _Activation(call) if call is not None else _DISABLED
+
+
+def track(provider: str, model: str):
+    """Mede o bloco como uma chamada; exceções são registradas como erro."""
+    if not _sinks:
+        return _DISABLED
+    return _Tracking(CallMetrics(provider, model))
+
+
+def current_call() -> Optional[CallMetrics]:
+    """Chamada em andamento no contexto atual (usada pelo pool HTTP e pelo rate limiter)."""
+    return _current.get()
+
+
+def export_prometheus() -> str:
+    aggregate = next((sink for sink in _sinks if isinstance(sink, AggregateSink)), None)
+    return aggregate.render() if aggregate is not None else ""
+
+
+def write_openmetrics(path: str) -> None:
+    """Grava o estado agregado num arquivo OpenMetrics (ex.: para o node_exporter textfile)."""
+    aggregate = next((sink for sink in _sinks if isinstance(sink, AggregateSink)), None)
+    content = aggregate.render(openmetrics=True) if aggregate is not None else "# EOF\n"
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+# Abaixo disso o custo de iniciar os processos supera o ganho
+MIN_PAGES_FOR_PARALLEL = 32
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> str:
+    """Extrai o texto das páginas [start, end) de um PDF (executado nos processos do pool)."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        return "\n".join(doc[page_number].get_text() for page_number in range(start, end))
+
+
+def page_count(pdf_path: str) -> int:
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def split_ranges(total_pages: int, parts: int) -> List[Tuple[int, int]]:
+    """Divide as páginas em até `parts` intervalos contíguos de tamanho parecido."""
+    parts = max(1, min(parts, total_pages))
+    size, extra = divmod(total_pages, parts)
+    ranges, start = [], 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def extract_text_parallel(pdf_path: str, workers: Optional[int] = None) -> str:
+    """Extrai o texto do PDF dividindo intervalos de páginas entre os núcleos da CPU."""
+    total_pages = page_count(pdf_path)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or total_pages < MIN_PAGES_FOR_PARALLEL:
+        return extract_page_range(pdf_path, 0, total_pages)
+
+    ranges = split_ranges(total_pages, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = executor.map(
+            extract_page_range,
+            [pdf_path] * len(ranges),
+            [start for start, _ in ranges],
+            [end for _, end in ranges]
+        )
+        return "\n".join(chunks)
+
+
+def iter_page_chunks(pdf_path: str, pages_per_chunk: int = 10) -> Iterator[str]:
+    """Gera o texto do PDF em blocos de páginas, sem manter o documento inteiro em memória."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        for start in range(0, doc.page_count, pages_per_chunk):
+            end = min(start + pages_per_chunk, doc.page_count)
+            yield "\n".join(doc[page_number].get_text() for page_number in range(start, end))
@@ -0,0 +1,47 @@
+"""Prefixos estáveis para o cache de prompt dos provedores.
+
+A OpenAI reaproveita sozinha o maior prefixo idêntico entre requisições (a
+partir de 1024 tokens); a Anthropic só reaproveita até os pontos marcados com
+`cache_control`. Os clientes montam as mensagens sempre na ordem sistema ->
+histórico da janela -> mensagem nova, e o ContextWindow só move o início da
+janela de tempos em tempos (TRIM_RATIO), então o prefixo se repete de um turno
+para o outro. Os tokens lidos do cache aparecem em `cached_tokens` nas métricas.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+EPHEMERAL = {"type": "ephemeral"}
+# Limite de pontos de cache por requisição na API da Anthropic
+MAX_BREAKPOINTS = 4
+
+
+def _with_cache_control(content: Union[str, List[Dict]]) -> List[Dict]:
+    """Conteúdo em blocos com o ponto de cache no último bloco (sem alterar o original)."""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": EPHEMERAL}]
+    blocks = list(content)
+    blocks[-1] = dict(blocks[-1], cache_control=EPHEMERAL)
+    return blocks
+
+
+def anthropic_cache_breakpoints(
+    system: Optional[str],
+    messages: List[Dict],
+    pinned: Iterable[int] = ()
+) -> Tuple[Optional[List[Dict]], List[Dict]]:
+    """Retorna (system, messages) para a API da Anthropic com pontos de cache.
+
+    Os pontos ficam no fim do system, nas mensagens fixadas em `pinned` (ex.: um
+    documento longo no início da conversa) e na última mensagem. Este último
+    grava a conversa inteira; no turno seguinte a API encontra esse prefixo
+    (procura até 20 blocos para trás) e só processa o que é novo.
+    """
+    system_blocks = _with_cache_control(system) if system else None
+    points = sorted({index % len(messages) for index in pinned} | {len(messages) - 1}) if messages else []
+    # O system usa um dos pontos; sobrando mais que o limite, ficam os mais recentes
+    points = points[-(MAX_BREAKPOINTS - (system_blocks is not None)):]
+
+    marked = list(messages)
+    for index in points:
+        message = marked[index]
+        marked[index] = dict(message, content=_with_cache_control(message['content']))
+    return system_blocks, marked
@@ -0,0 +1,471 @@
+"""Envio de grandes lotes pelas APIs de lote dos provedores (sem latência interativa).
+
+Lê o mesmo JSONL de entrada do batch_runner:
+    {"id": "q1", "provider": "openai", "model": "gpt-4o-mini", "config": {"temperature": 0}, "prompt": "..."}
+
+As requisições são agrupadas por provedor/modelo/base_url e empacotadas no
+formato de lote de cada provedor: a Batch API da OpenAI (também usada pela
+Groq, compatível) e a Message Batches API da Anthropic. Cada pacote é enviado,
+acompanhado com intervalos crescentes e os resultados são baixados em
+streaming para o JSONL de saída, uma linha por requisição, identificada pelo
+custom_id (o "id" da entrada ou "line-<n>"). Os lotes custam metade do preço e
+terminam em até 24 h.
+
+O estado (pacotes e ids dos lotes enviados) fica em `<saida>.batch/`: rodar o
+mesmo comando de novo retoma o acompanhamento sem reenviar nada. Os resultados
+de cada lote são gravados num arquivo temporário, renomeado quando o lote
+termina, e só então acrescentados à saída; o estado guarda o tamanho da saída
+já consolidado, então uma falha no meio não duplica registros.
+
+Uso:
+    python -m common.provider_batch entrada.jsonl saida.jsonl --poll-interval 30
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import http_pool
+from common.batch_runner import iter_requests
+from common.providers import PROVIDERS, ChatProvider, ProviderError, create_provider
+from common.rate_limit import parse_retry_after
+
+# Tentativas de cada chamada de controle (envio, consulta, download) em 429/5xx ou falha de conexão
+MAX_ATTEMPTS = 5
+
+
+class BatchFormat:
+    """Formato e endpoints de lote de um provedor."""
+
+    # Limites de cada lote impostos pelo provedor
+    max_requests = 50000
+    max_bytes = 200 * 1024 * 1024
+
+    def __init__(self, provider: ChatProvider, timeout: float = 600.0):
+        self.provider = provider
+        self.timeout = timeout
+
+    def request_line(self, custom_id: str, prompt: str) -> bytes:
+        raise NotImplementedError
+
+    def check_id(self, custom_id: str) -> Optional[str]:
+        """Erro se o custom_id não é aceito pelo provedor (um id inválido derruba o lote inteiro)."""
+        return None
+
+    def pack_prefix(self) -> bytes:
+        return b""
+
+    def pack_separator(self) -> bytes:
+        return b""
+
+    def pack_suffix(self) -> bytes:
+        return b""
+
+    def submit(self, path: str) -> str:
+        """Envia o pacote e retorna o id do lote."""
+        raise NotImplementedError
+
+    def poll(self, batch_id: str) -> Tuple[bool, Dict]:
+        """Retorna (terminou, objeto do lote)."""
+        raise NotImplementedError
+
+    def iter_results(self, batch: Dict) -> Iterator[Tuple[str, Dict]]:
+        """Gera (custom_id, {"content", "usage"} ou {"error"}) sem carregar o arquivo inteiro."""
+        raise NotImplementedError
+
+    def _headers(self) -> Dict[str, str]:
+        _, headers, _ = self.provider.build_request([{"role": "user", "content": ""}])
+        return headers
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Chamada de controle com retentativas (Retry-After ou backoff exponencial)."""
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(MAX_ATTEMPTS):
+            # Reenvio do mesmo arquivo: o requests lê até o fim tanto o corpo quanto os do multipart
+            streams = [kwargs.get("data")] + [
+                value[1] if isinstance(value, tuple) else value for value in (kwargs.get("files") or {}).values()
+            ]
+            for stream in streams:
+                if hasattr(stream, "seek"):
+                    stream.seek(0)
+            delay = None
+            try:
+                response = http_pool.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = ProviderError(self.provider.name, None, str(e))
+            else:
+                if response.status_code < 400:
+                    return response
+                error = ProviderError(
+                    self.provider.name, response.status_code, response.text,
+                    parse_retry_after(response.headers.get("retry-after"))
+                )
+                delay = error.retry_after
+            if not error.retryable or attempt == MAX_ATTEMPTS - 1:
+                raise error
+            time.sleep(delay if delay is not None else 2 ** attempt * (0.5 + random.random() / 2))
+
+    def _iter_jsonl(self, url: str, headers: Dict[str, str]) -> Iterator[Dict]:
+        response = self._request("GET", url, headers=headers, stream=True)
+        with response:
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+class OpenAIBatch(BatchFormat):
+    """Batch API da OpenAI: arquivo JSONL enviado em /files, lote criado em /batches."""
+
+    endpoint = "/v1/chat/completions"
+
+    def request_line(self, custom_id: str, prompt: str) -> bytes:
+        _, _, body = self.provider.build_request([{"role": "user", "content": prompt}])
+        line = {"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": body}
+        return json.dumps(line, ensure_ascii=False).encode("utf-8")
+
+    def pack_separator(self) -> bytes:
+        return b"\n"
+
+    def submit(self, path: str) -> str:
+        headers = self._headers()
+        headers.pop("Content-Type", None)  # O requests monta o multipart
+        with open(path, "rb") as f:
+            response = self._request(
+                "POST", f"{self.provider.base_url}/files", headers=headers,
+                data={"purpose": "batch"}, files={"file": (os.path.basename(path), f, "application/jsonl")}
+            )
+        input_file_id = response.json()["id"]
+        response = self._request(
+            "POST", f"{self.provider.base_url}/batches", headers=self._headers(),
+            json={"input_file_id": input_file_id, "endpoint": self.endpoint, "completion_window": "24h"}
+        )
+        return response.json()["id"]
+
+    def poll(self, batch_id: str) -> Tuple[bool, Dict]:
+        batch = self._request("GET", f"{self.provider.base_url}/batches/{batch_id}", headers=self._headers()).json()
+        return batch["status"] in ("completed", "failed", "expired", "cancelled"), batch
+
+    def iter_results(self, batch: Dict) -> Iterator[Tuple[str, Dict]]:
+        if batch["status"] == "failed":
+            message = "; ".join(error.get("message", "") for error in (batch.get("errors") or {}).get("data", []))
+            raise ProviderError(self.provider.name, None, f"Lote {batch['id']} rejeitado: {message}")
+
+        # Respostas com sucesso vêm em output_file_id; as com erro, em error_file_id
+        for key in ("output_file_id", "error_file_id"):
+            if not batch.get(key):
+                continue
+            url = f"{self.provider.base_url}/files/{batch[key]}/content"
+            for line in self._iter_jsonl(url, self._headers()):
+                response = line.get("response") or {}
+                if line.get("error") or response.get("status_code", 200) >= 400:
+                    error = line.get("error") or response.get("body", {}).get("error") or response.get("body")
+                    yield line["custom_id"], {"error": f"{response.get('status_code')} - {json.dumps(error, ensure_ascii=False)}"}
+                    continue
+                result = self.provider.parse_response(response["body"])
+                yield line["custom_id"], {"content": result["content"], "usage": result["usage"]}
+
+
+class AnthropicBatch(BatchFormat):
+    """Message Batches API da Anthropic: as requisições vão num único corpo JSON."""
+
+    max_requests = 100000
+    max_bytes = 256 * 1024 * 1024
+    CUSTOM_ID = re.compile(r"[a-zA-Z0-9_-]{1,64}")
+
+    def request_line(self, custom_id: str, prompt: str) -> bytes:
+        _, _, body = self.provider.build_request([{"role": "user", "content": prompt}])
+        return json.dumps({"custom_id": custom_id, "params": body}, ensure_ascii=False).encode("utf-8")
+
+    def check_id(self, custom_id: str) -> Optional[str]:
+        if not self.CUSTOM_ID.fullmatch(custom_id):
+            return f"id inválido para a Anthropic (letras, números, _ e -, até 64): {custom_id}"
+        return None
+
+    def pack_prefix(self) -> bytes:
+        return b'{"requests": ['
+
+    def pack_separator(self) -> bytes:
+        return b","
+
+    def pack_suffix(self) -> bytes:
+        return b"]}"
+
+    def submit(self, path: str) -> str:
+        # O arquivo vai em streaming no corpo, sem ser carregado em memória
+        with open(path, "rb") as f:
+            response = self._request("POST", f"{self.provider.base_url}/messages/batches", headers=self._headers(), data=f)
+        return response.json()["id"]
+
+    def poll(self, batch_id: str) -> Tuple[bool, Dict]:
+        url = f"{self.provider.base_url}/messages/batches/{batch_id}"
+        batch = self._request("GET", url, headers=self._headers()).json()
+        return batch["processing_status"] == "ended", batch
+
+    def iter_results(self, batch: Dict) -> Iterator[Tuple[str, Dict]]:
+        url = batch.get("results_url") or f"{self.provider.base_url}/messages/batches/{batch['id']}/results"
+        for line in self._iter_jsonl(url, self._headers()):
+            result = line["result"]
+            if result["type"] == "succeeded":
+                parsed = self.provider.parse_response(result["message"])
+                yield line["custom_id"], {"content": parsed["content"], "usage": parsed["usage"]}
+            elif result["type"] == "errored":
+                yield line["custom_id"], {"error": json.dumps(result.get("error"), ensure_ascii=False)}
+            else:
+                # canceled / expired
+                yield line["custom_id"], {"error": f"Requisição {result['type']}"}
+
+
+BATCH_FORMATS = {"openai": OpenAIBatch, "groq": OpenAIBatch, "anthropic": AnthropicBatch}
+
+
+class _Pack:
+    """Arquivo de um lote em montagem, com os custom_ids (e linhas da entrada) ao lado."""
+
+    __slots__ = ("group", "path", "file", "ids", "count", "size")
+
+    def __init__(self, group: Dict, path: str, prefix: bytes):
+        self.group = group
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(prefix)
+        self.ids = open(path + ".ids", "w", encoding="utf-8")
+        self.count = 0
+        self.size = len(prefix)
+
+
+class ProviderBatchRunner:
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        poll_interval: float = 30.0,
+        max_poll_interval: float = 600.0,
+        max_requests: Optional[int] = None
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        # Limite opcional menor que o do provedor (lotes menores terminam antes)
+        self.max_requests = max_requests
+        self.work_dir = output_path + ".batch"
+        self.state_path = os.path.join(self.work_dir, "state.json")
+        self.stats: Dict[str, int] = {"ok": 0, "error": 0, "batches": 0}
+
+    def _format(self, group: Dict) -> BatchFormat:
+        config = dict(group["config"])
+        if group["provider"] == "anthropic":
+            # Cada requisição do lote é única: pontos de cache só custariam a gravação
+            config.setdefault("cache_prompt", False)
+        provider = create_provider(group["provider"], base_url=group["base_url"], **config)
+        return BATCH_FORMATS[group["provider"]](provider)
+
+    def _save_state(self, state: Dict) -> None:
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _write(self, out, line: Optional[int], custom_id: Optional[str], provider: Optional[str], result: Dict, **extra) -> None:
+        record = {"line": line, "id": custom_id, "provider": provider}
+        record.update(extra)
+        record.update(result)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stats["error" if "error" in result else "ok"] += 1
+
+    def pack(self, out) -> List[Dict]:
+        """Lê a entrada e grava os pacotes no disco; requisições inválidas vão direto para a saída."""
+        packs: Dict[str, _Pack] = {}
+        done: List[Dict] = []
+        seen = set()
+
+        def close(pack: _Pack) -> None:
+            pack.file.write(formats[pack.group["key"]].pack_suffix())
+            pack.file.close()
+            pack.ids.close()
+            done.append({"group": pack.group, "path": pack.path, "count": pack.count, "batch_id": None, "finished": False})
+
+        formats: Dict[str, BatchFormat] = {}
+        pack_number = 0
+        for line, item, parse_error in iter_requests(self.input_path):
+            item = item or {}
+            name = item.get("provider")
+            custom_id = str(item["id"]) if item.get("id") is not None else f"line-{line}"
+            error = parse_error
+            if error is None and "prompt" not in item:
+                error = "Campo 'prompt' ausente"
+            elif error is None and name not in PROVIDERS:
+                error = f"Provedor desconhecido: {name}"
+            elif error is None and name not in BATCH_FORMATS:
+                error = f"Provedor sem API de lote: {name}"
+            elif error is None and custom_id in seen:
+                error = f"id duplicado: {custom_id}"
+            if error is not None:
+                self._write(out, line, custom_id, name, {"error": error})
+                continue
+
+            config = dict(item.get("config", {}))
+            if item.get("model"):
+                config["model"] = item["model"]
+            group = {"provider": name, "base_url": item.get("base_url"), "config": config}
+            key = json.dumps(group, sort_keys=True)
+            batch_format = formats.get(key)
+            if batch_format is None:
+                batch_format = formats[key] = self._format(group)
+            group["key"] = key
+            error = batch_format.check_id(custom_id)
+            if error is not None:
+                self._write(out, line, custom_id, name, {"error": error})
+                continue
+            seen.add(custom_id)
+
+            request_line = batch_format.request_line(custom_id, item["prompt"])
+            limit = min(batch_format.max_requests, self.max_requests or batch_format.max_requests)
+            pack = packs.get(key)
+            if pack is not None and (
+                pack.count >= limit
+                or pack.size + len(request_line) + 1 + len(batch_format.pack_suffix()) > batch_format.max_bytes
+            ):
+                close(pack)
+                pack = None
+            if pack is None:
+                path = os.path.join(self.work_dir, f"pack-{pack_number:05d}.json")
+                pack_number += 1
+                pack = packs[key] = _Pack(group, path, batch_format.pack_prefix())
+            if pack.count:
+                pack.file.write(batch_format.pack_separator())
+                pack.size += len(batch_format.pack_separator())
+            pack.file.write(request_line)
+            pack.ids.write(f"{line}\t{custom_id}\n")
+            pack.count += 1
+            pack.size += len(request_line)
+
+        for pack in packs.values():
+            close(pack)
+        return done
+
+    @staticmethod
+    def _pack_ids(batch: Dict) -> Dict[str, int]:
+        """custom_id -> linha da entrada das requisições de um lote."""
+        lines = {}
+        with open(batch["path"] + ".ids", "r", encoding="utf-8") as f:
+            for raw in f:
+                line, custom_id = raw.rstrip("\n").split("\t", 1)
+                lines[custom_id] = int(line)
+        return lines
+
+    def _collect(self, out, batch: Dict, batch_format: BatchFormat, info: Dict) -> None:
+        """Grava os resultados de um lote terminado; requisições sem resultado viram erro."""
+        lines = self._pack_ids(batch)
+        provider = batch["group"]["provider"]
+        try:
+            for custom_id, result in batch_format.iter_results(info):
+                self._write(out, lines.pop(custom_id, None), custom_id, provider, result, batch_id=batch["batch_id"])
+            missing = "Sem resultado no lote"
+        except ProviderError as e:
+            missing = str(e)
+        for custom_id, line in lines.items():
+            self._write(out, line, custom_id, provider, {"error": missing}, batch_id=batch["batch_id"])
+
+    def _results_path(self, name: str) -> str:
+        return os.path.join(self.work_dir, name + ".results")
+
+    def _merge(self, state: Dict, name: str) -> None:
+        """Acrescenta um arquivo de resultados completo à saída e registra o novo tamanho dela."""
+        if name in state["merged"]:
+            return
+        path = self._results_path(name)
+        with open(self.output_path, "ab") as out, open(path, "rb") as results:
+            shutil.copyfileobj(results, out)
+            state["output_size"] = out.tell()
+        state["merged"].append(name)
+        self._save_state(state)
+        os.remove(path)
+
+    def run(self) -> Dict[str, int]:
+        os.makedirs(self.work_dir, exist_ok=True)
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            # Descarta o que uma falha no meio de um _merge deixou na saída
+            if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > state["output_size"]:
+                os.truncate(self.output_path, state["output_size"])
+        else:
+            # Requisições inválidas também passam por um arquivo de resultados
+            tmp_path = self._results_path("rejected") + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                batches = self.pack(out)
+            os.replace(tmp_path, self._results_path("rejected"))
+            output_size = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else 0
+            state = {"output_size": output_size, "batches": batches, "merged": []}
+            self._save_state(state)
+        self._merge(state, "rejected")
+
+        # Envio: cada lote é registrado no estado assim que o provedor o aceita
+        for batch in state["batches"]:
+            if batch["batch_id"] is None:
+                batch["batch_id"] = self._format(batch["group"]).submit(batch["path"])
+                self._save_state(state)
+                os.remove(batch["path"])
+                self.stats["batches"] += 1
+
+        pending = []
+        for batch in state["batches"]:
+            if batch["finished"]:
+                self._merge(state, os.path.basename(batch["path"]))
+            else:
+                pending.append(batch)
+
+        interval = self.poll_interval
+        while pending:
+            for batch in list(pending):
+                batch_format = self._format(batch["group"])
+                finished, info = batch_format.poll(batch["batch_id"])
+                if not finished:
+                    continue
+                name = os.path.basename(batch["path"])
+                tmp_path = self._results_path(name) + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as out:
+                    self._collect(out, batch, batch_format, info)
+                os.replace(tmp_path, self._results_path(name))
+                batch["finished"] = True
+                self._save_state(state)
+                os.remove(batch["path"] + ".ids")
+                self._merge(state, name)
+                pending.remove(batch)
+            if pending:
+                # Intervalo crescente com jitter: lotes levam de minutos a horas
+                time.sleep(interval * (0.75 + random.random() / 2))
+                interval = min(interval * 1.5, self.max_poll_interval)
+
+        shutil.rmtree(self.work_dir)
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envia um arquivo JSONL de prompts pelas APIs de lote dos provedores")
+    parser.add_argument("input", help="Arquivo JSONL de entrada (mesmo formato do batch_runner)")
+    parser.add_argument("output", help="Arquivo JSONL de saída, uma linha por custom_id")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Intervalo inicial entre consultas (s)")
+    parser.add_argument("--max-poll-interval", type=float, default=600.0, help="Intervalo máximo entre consultas (s)")
+    parser.add_argument("--max-requests", type=int, default=None, help="Requisições por lote (padrão: limite do provedor)")
+    args = parser.parse_args()
+
+    runner = ProviderBatchRunner(
+        args.input, args.output, poll_interval=args.poll_interval,
+        max_poll_interval=args.max_poll_interval, max_requests=args.max_requests
+    )
+    stats = runner.run()
+    print(f"Concluído: {stats['ok']} ok, {stats['error']} com erro, {stats['batches']} lotes enviados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""Interface comum para os provedores de chat e motor assíncrono compartilhado.
+
+Cada adaptador sabe apenas montar a requisição HTTP e interpretar a resposta
+do seu provedor, aceitando os mesmos campos de configuração dos clientes
+originais (OpenAIChat.current_config, PerplexityChat.current_config,
+GeminiConfig, script Groq e enviar_mensagem_claude). O AsyncEngine executa
+qualquer adaptador com o pool HTTP, cache, retentativas e limite de
+concorrência compartilhados.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from common import http_pool, metrics
+from common.context_window import DEFAULT_OUTPUT_RESERVE, message_tokens
+from common.prompt_cache import anthropic_cache_breakpoints
+from common.rate_limit import RateLimiter, get_limiter, parse_retry_after
+from common.response_cache import ResponseCache, make_key
+from common.sse import aiter_sse_data
+
+SYSTEM_MESSAGES = {
+    'pt-br': "Você é um assistente prestativo. Responda sempre em português do Brasil de forma clara e natural.",
+    'en': "You are a helpful assistant. Always respond in English in a clear and natural way."
+}
+
+Request = Tuple[str, Dict[str, str], Dict]
+
+
+class ProviderError(Exception):
+    """Erro HTTP retornado por um provedor."""
+
+    def __init__(self, provider: str, status_code: Optional[int], message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {status_code} - {message}" if status_code else f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class ChatProvider:
+    """Adaptador base: monta a requisição e interpreta a resposta de um provedor."""
+
+    name = ""
+    default_base_url = ""
+    default_config: Dict = {}
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, **config):
+        self.api_key = api_key
+        self.base_url = base_url or self.default_base_url
+        self.config = dict(self.default_config)
+        self.config.update(config)
+
+    @property
+    def model(self) -> str:
+        return self.config['model']
+
+    def build_request(self, messages: List[Dict], stream: bool = False) -> Request:
+        raise NotImplementedError
+
+    def parse_response(self, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    def parse_stream_event(self, event: Dict) -> Dict:
+        """Retorna {'delta': texto} (e 'citations', se houver) de um evento de streaming."""
+        raise NotImplementedError
+
+    def estimate_tokens(self, messages: List[Dict]) -> int:
+        """Estimativa de tokens da requisição (entrada + saída máxima), para o limite de tpm."""
+        max_output = self.config.get('max_tokens') or self.config.get('max_output_tokens') or DEFAULT_OUTPUT_RESERVE
+        return sum(message_tokens(message) for message in messages) + max_output
+
+    def cache_key(self, messages: List[Dict]) -> str:
+        _, _, body = self.build_request(messages)
+        return make_key({"provider": self.name, "body": body})
+
+
+class OpenAIProvider(ChatProvider):
+    """Adaptador com os campos de OpenAIChat.current_config."""
+
+    name = "openai"
+    default_base_url = "https://api.openai.com/v1"
+    default_config = {
+        'model': 'gpt-3.5-turbo',
+        'temperature': 0.7,
+        'top_p': 1.0,
+        'max_tokens': None,
+        'presence_penalty': 0,
+        'frequency_penalty': 0,
+        'language': 'pt-br'
+    }
+    # Campos de configuração enviados como estão no corpo da requisição
+    body_fields = ('temperature', 'top_p', 'presence_penalty', 'frequency_penalty')
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, **config):
+        super().__init__(api_key or os.getenv('OPENAI_API_KEY'), base_url or os.getenv('OPENAI_BASE_URL'), **config)
+
+    @classmethod
+    def from_client(cls, chat, **overrides) -> "ChatProvider":
+        """Cria o adaptador a partir de um OpenAIChat/PerplexityChat existente."""
+        config = dict(chat.current_config)
+        config.update(overrides)
+        base_url = getattr(chat, 'url', None)
+        if base_url:
+            base_url = base_url.rsplit('/chat/completions', 1)[0]
+        return cls(api_key=chat.api_key, base_url=base_url, **config)
+
+    def system_content(self) -> Optional[str]:
+        language = self.config.get('language')
+        return SYSTEM_MESSAGES.get(language) if language else None
+
+    def build_request(self, messages: List[Dict], stream: bool = False) -> Request:
+        system = self.system_content()
+        full_messages = [{"role": "system", "content": system}] + messages if system else list(messages)
+
+        body = {"model": self.model, "messages": full_messages}
+        for field in self.body_fields:
+            if self.config.get(field) is not None:
+                body[field] = self.config[field]
+        if self.config.get('max_tokens') is not None:
+            body['max_tokens'] = self.config['max_tokens']
+        if stream:
+            body['stream'] = True
+
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        return f"{self.base_url}/chat/completions", headers, body
+
+    def parse_response(self, data: Dict) -> Dict:
+        message = data['choices'][0]['message']
+        return {
+            'content': message.get('content') or '',
+            'citations': [],
+            'usage': data.get('usage', {})
+        }
+
+    def parse_stream_event(self, event: Dict) -> Dict:
+        choices = event.get('choices') or [{}]
+        return {'delta': choices[0].get('delta', {}).get('content') or ''}
+
+
+class PerplexityProvider(OpenAIProvider):
+    """Adaptador com os campos de PerplexityChat.current_config."""
+
+    name = "perplexity"
+    default_base_url = "https://api.perplexity.ai"
+    default_config = {
+        'model': 'llama-3.1-sonar-small-128k-online',
+        'temperature': 0.2,
+        'top_p': 0.9,
+        'top_k': 0,
+        'max_tokens': None,
+        'presence_penalty': 0,
+        'frequency_penalty': 1,
+        'return_citations': True,
+        'return_related_questions': False,
+        'search_recency_filter': None,
+        'language': 'pt-br'
+    }
+    body_fields = (
+        'temperature', 'top_p', 'top_k', 'presence_penalty', 'frequency_penalty',
+        'return_citations', 'return_related_questions', 'search_recency_filter'
+    )
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, **config):
+        ChatProvider.__init__(self, api_key or os.getenv('PERPLEXITY_API_KEY'), base_url, **config)
+
+    @staticmethod
+    def _citations(raw: List) -> List[Dict]:
+        return [{"index": idx, "url": citation} for idx, citation in enumerate(raw, start=1)]
+
+    def parse_response(self, data: Dict) -> Dict:
+        message = data['choices'][0]['message']
+        raw = data.get('citations') or message.get('citations') or []
+        return {
+            'content': message.get('content') or '',
+            'citations': self._citations(raw),
+            'usage': data.get('usage', {})
+        }
+
+    def parse_stream_event(self, event: Dict) -> Dict:
+        result = super().parse_stream_event(event)
+        if event.get('citations'):
+            result['citations'] = self._citations(event['citations'])
+        return result
+
+
+class GroqProvider(OpenAIProvider):
+    """Adaptador do script Groq (API compatível com a da OpenAI)."""
+
+    name = "groq"
+    default_base_url = "https://api.groq.com/openai/v1"
+    default_config = {
+        'model': 'llama3-8b-8192',
+        'temperature': None,
+        'top_p': None,
+        'max_tokens': None,
+        'presence_penalty': None,
+        'frequency_penalty': None,
+        'language': None
+    }
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, **config):
+        ChatProvider.__init__(self, api_key or os.getenv('GROQ_API_KEY'), base_url, **config)
+
+
+class GeminiProvider(ChatProvider):
+    """Adaptador com os campos de GeminiConfig."""
+
+    name = "gemini"
+    default_base_url = "https://generativelanguage.googleapis.com/v1"
+    default_config = {
+        'model': 'gemini-pro',
+        'temperature': 0.7,
+        'top_k': None,
+        'top_p': None,
+        'max_output_tokens': None,
+        'stop_sequences': []
+    }
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, **config):
+        super().__init__(api_key or os.getenv('GEMINI_API_KEY'), base_url, **config)
+        # Aceita tanto o Enum GeminiModel quanto o nome do modelo
+        self.config['model'] = getattr(self.config['model'], 'value', self.config['model'])
+
+    @classmethod
+    def from_client(cls, api, **overrides) -> "GeminiProvider":
+        """Cria o adaptador a partir de um GeminiAPI existente."""
+        config = {field: getattr(api.config, field) for field in cls.default_config}
+        config.update(overrides)
+        return cls(api_key=api.api_key, base_url=getattr(api, 'base_url', None), **config)
+
+    def build_request(self, messages: List[Dict], stream: bool = False) -> Request:
+        contents = []
+        for message in messages:
+            if message['role'] == 'system':
+                continue
+            role = 'model' if message['role'] == 'assistant' else 'user'
+            contents.append({"role": role, "parts": [{"text": message['content']}]})
+
+        generation_config = {"temperature": self.config['temperature']}
+        if self.config['top_k'] is not None:
+            generation_config["topK"] = self.config['top_k']
+        if self.config['top_p'] is not None:
+            generation_config["topP"] = self.config['top_p']
+        if self.config['max_output_tokens'] is not None:
+            generation_config["maxOutputTokens"] = self.config['max_output_tokens']
+        if self.config['stop_sequences']:
+            generation_config["stopSequences"] = self.config['stop_sequences']
+
+        method = "streamGenerateContent?alt=sse&" if stream else "generateContent?"
+        url = f"{self.base_url}/models/{self.model}:{method}key={self.api_key}"
+        body = {"contents": contents, "generationConfig": generation_config}
+        return url, {"Content-Type": "application/json"}, body
+
+    @staticmethod
+    def _text(data: Dict) -> str:
+        candidates = data.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    def parse_response(self, data: Dict) -> Dict:
+        if "candidates" not in data:
+            raise ProviderError(self.name, None, "Resposta inesperada do Gemini")
+        return {'content': self._text(data), 'citations': [], 'usage': data.get('usageMetadata', {})}
+
+    def parse_stream_event(self, event: Dict) -> Dict:
+        return {'delta': self._text(event)}
+
+
+class AnthropicProvider(ChatProvider):
+    """Adaptador com os parâmetros de enviar_mensagem_claude."""
+
+    name = "anthropic"
+    default_base_url = "https://api.anthropic.com/v1"
+    default_config = {
+        'model': 'claude-3.5-sonnet',
+        'max_tokens': 1000,
+        'temperature': None,
+        'system': None,
+        # None: marca os pontos de cache só quando há turnos anteriores
+        'cache_prompt': None
+    }
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, **config):
+        super().__init__(api_key or os.getenv('ANTHROPIC_API_KEY'), base_url, **config)
+
+    def build_request(self, messages: List[Dict], stream: bool = False) -> Request:
+        system = self.config['system']
+        chat_messages = []
+        for message in messages:
+            if message['role'] == 'system':
+                system = message['content']
+            else:
+                chat_messages.append({"role": message['role'], "content": message['content']})
+
+        cache_prompt = self.config['cache_prompt']
+        if cache_prompt is None:
+            cache_prompt = len(chat_messages) > 1
+        if cache_prompt:
+            # Pontos de cache no system e na última mensagem: o turno seguinte reaproveita o prefixo
+            system, chat_messages = anthropic_cache_breakpoints(system, chat_messages)
+
+        body = {"model": self.model, "messages": chat_messages, "max_tokens": self.config['max_tokens']}
+        if system:
+            body["system"] = system
+        if self.config['temperature'] is not None:
+            body["temperature"] = self.config['temperature']
+        if stream:
+            body["stream"] = True
+
+        headers = {
+            "Content-Type": "application/json",
+            "X-API-Key": self.api_key or "",
+            "anthropic-version": "2023-06-01"
+        }
+        return f"{self.base_url}/messages", headers, body
+
+    def parse_response(self, data: Dict) -> Dict:
+        text = "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+        return {'content': text, 'citations': [], 'usage': data.get('usage', {})}
+
+    def parse_stream_event(self, event: Dict) -> Dict:
+        if event.get("type") == "content_block_delta":
+            return {'delta': event.get("delta", {}).get("text", "")}
+        return {'delta': ''}
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in (OpenAIProvider, PerplexityProvider, GroqProvider, GeminiProvider, AnthropicProvider)
+}
+
+
+def create_provider(name: str, **kwargs) -> ChatProvider:
+    """Cria o adaptador pelo nome: openai, perplexity, groq, gemini ou anthropic."""
+    if name not in PROVIDERS:
+        raise ValueError(f"Provedor desconhecido: {name}")
+    return PROVIDERS[name](**kwargs)
+
+
+class AsyncEngine:
+    """Motor assíncrono único para todos os provedores.
+
+    Usa o httpx.AsyncClient compartilhado de http_pool, limita o número de
+    requisições simultâneas e consulta o cache de respostas, se configurado.
+    Com `rate_limit`, cada provedor/modelo passa pelo RateLimiter compartilhado
+    de common/rate_limit.py (rpm, tpm, AIMD e retentativas em 429/5xx); erros
+    de conexão são repetidos pelo próprio motor com backoff exponencial.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        cache: Optional[ResponseCache] = None,
+        rate_limit: bool = True
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.rate_limit = rate_limit
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Criado sob demanda para ficar associado ao event loop em execução
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _delay(self, attempt: int, error: ProviderError) -> float:
+        if error.retry_after is not None:
+            return error.retry_after
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _limiter(self, provider: ChatProvider) -> Optional[RateLimiter]:
+        return get_limiter(provider.name, provider.model) if self.rate_limit else None
+
+    async def _post(
+        self,
+        provider: ChatProvider,
+        url: str,
+        headers: Dict,
+        payload: bytes,
+        tokens: int,
+        call: Optional[metrics.CallMetrics]
+    ) -> Dict:
+        import httpx
+
+        client = http_pool.get_async_client()
+        extensions = call.httpx_extensions() if call is not None else None
+
+        async def send():
+            async with self.semaphore:
+                return await client.post(url, headers=headers, content=payload, extensions=extensions)
+
+        limiter = self._limiter(provider)
+        try:
+            response = await (limiter.acall(send, tokens) if limiter is not None else send())
+        except httpx.HTTPError as e:
+            raise ProviderError(provider.name, None, str(e)) from e
+        if call is not None:
+            call.record_response(response, payload)
+        if response.status_code >= 400:
+            raise ProviderError(
+                provider.name, response.status_code, response.text,
+                parse_retry_after(response.headers.get("retry-after"))
+            )
+        try:
+            return response.json()
+        except json.JSONDecodeError as e:
+            raise ProviderError(provider.name, response.status_code, "Resposta inválida do servidor") from e
+
+    async def complete(self, provider: ChatProvider, messages: List[Dict]) -> Dict:
+        """Envia as mensagens e retorna {'content', 'citations', 'usage'}."""
+        cache_key = provider.cache_key(messages) if self.cache is not None else None
+        if cache_key is not None:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                return cached
+
+        url, headers, body = provider.build_request(messages)
+        payload = json.dumps(body).encode("utf-8")
+        limiter = self._limiter(provider)
+        tokens = provider.estimate_tokens(messages) if limiter is not None and limiter.tokens is not None else 0
+        attempt = 0
+        with metrics.track(provider.name, provider.model) as call:
+            while True:
+                try:
+                    data = await self._post(provider, url, headers, payload, tokens, call)
+                    result = provider.parse_response(data)
+                    break
+                except ProviderError as e:
+                    # Com o RateLimiter, 429/5xx e erros de transporte já foram repetidos
+                    if limiter is not None or not e.retryable or attempt >= self.max_retries:
+                        raise
+                    await asyncio.sleep(self._delay(attempt, e))
+                    attempt += 1
+                    if call is not None:
+                        call.retries += 1
+            if call is not None:
+                call.set_usage(result['usage'])
+
+        if cache_key is not None:
+            await self.cache.aset(cache_key, result)
+        return result
+
+    async def stream(self, provider: ChatProvider, messages: List[Dict]) -> AsyncIterator[Dict]:
+        """Gera {'delta': texto} (e 'citations', quando houver) conforme a resposta chega."""
+        import httpx
+
+        url, headers, body = provider.build_request(messages, stream=True)
+        payload = json.dumps(body).encode("utf-8")
+        client = http_pool.get_async_client()
+        limiter = self._limiter(provider)
+        tokens = provider.estimate_tokens(messages) if limiter is not None and limiter.tokens is not None else 0
+        # Gerador assíncrono: a chamada não é posta no contexto, vai direto no trace do httpx
+        call = metrics.start_call(provider.name, provider.model)
+        error = None
+        async with contextlib.AsyncExitStack() as stack:
+            if limiter is not None:
+                await stack.enter_async_context(limiter.aslot(tokens))
+            await stack.enter_async_context(self.semaphore)
+            try:
+                async with client.stream(
+                    "POST", url, headers=headers, content=payload,
+                    extensions=call.httpx_extensions(streaming=True) if call is not None else None
+                ) as response:
+                    if limiter is not None:
+                        limiter.record_response(response.status_code, response.headers)
+                    if call is not None:
+                        call.status = response.status_code
+                        call.bytes_out += len(payload)
+                    if response.status_code >= 400:
+                        text = (await response.aread()).decode("utf-8", "replace")
+                        raise ProviderError(
+                            provider.name, response.status_code, text,
+                            parse_retry_after(response.headers.get("retry-after"))
+                        )
+                    async for data in aiter_sse_data(response.aiter_lines()):
+                        try:
+                            parsed = json.loads(data)
+                        except json.JSONDecodeError as e:
+                            raise ProviderError(provider.name, response.status_code, "Evento inválido no streaming") from e
+                        event = provider.parse_stream_event(parsed)
+                        if call is not None:
+                            call.bytes_in += len(data)
+                            if event.get('delta'):
+                                call.mark_first_token()
+                        if event.get('delta') or event.get('citations'):
+                            yield event
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+                raise ProviderError(provider.name, None, str(e)) from e
+            except ProviderError:
+                error = "ProviderError"
+                raise
+            except Exception as e:
+                # Ex.: evento com formato inesperado em parse_stream_event
+                error = type(e).__name__
+                raise
+            finally:
+                metrics.finish_call(call, error)
+
+    async def complete_many(self, jobs: List[Tuple[ChatProvider, List[Dict]]]) -> List:
+        """Executa várias requisições em paralelo; erros são retornados no lugar do resultado."""
+        return await asyncio.gather(
+            *(self.complete(provider, messages) for provider, messages in jobs),
+            return_exceptions=True
+        )
+
+    def complete_sync(self, provider: ChatProvider, messages: List[Dict]) -> Dict:
+        """Atalho para chamadores síncronos (cria um event loop próprio)."""
+        return asyncio.run(self.complete(provider, messages))
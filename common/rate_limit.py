@@ -0,0 +1,403 @@
+"""Limite de taxa e de concorrência no cliente, por provedor e modelo.
+
+Cada par provedor/modelo tem um RateLimiter com dois token buckets
+(requisições/minuto e tokens/minuto) e um limite de concorrência adaptativo
+(AIMD): cresce 1 a cada janela de sucessos e cai pela metade a cada 429. Até
+o primeiro 429 não há limite de concorrência (salvo se configurado), então o
+paralelismo dos clientes e do AsyncEngine não é reduzido sem necessidade.
+Respostas 429/5xx e erros de transporte (conexão, timeout) são repetidos com
+backoff exponencial com jitter, respeitando o cabeçalho Retry-After; erros de
+transporte também reduzem o limite, como um 429. Outras respostas 4xx não são
+repetidas e não contam como sucesso.
+"""
+import asyncio
+import email.utils
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from common.metrics import current_call
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_transport_errors: Optional[Tuple[type, ...]] = None
+
+
+def transport_errors() -> Tuple[type, ...]:
+    """Exceções de conexão e timeout do requests e do httpx (os instalados)."""
+    global _transport_errors
+    if _transport_errors is None:
+        errors = [ConnectionError, TimeoutError]
+        try:
+            import requests
+            errors += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+        except ImportError:
+            pass
+        try:
+            import httpx
+            errors.append(httpx.TransportError)
+        except ImportError:
+            pass
+        _transport_errors = tuple(errors)
+    return _transport_errors
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(moment.timestamp() - time.time(), 0.0)
+
+
+class TokenBucket:
+    """Token bucket com reposição contínua de `rate_per_minute` unidades por minuto."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """Reserva `amount` unidades e retorna quanto tempo esperar antes de usá-las.
+
+        O saldo pode ficar negativo: as próximas reservas esperam a reposição,
+        o que mantém a ordem de chegada sem laços de espera ativa.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Uma requisição maior que a capacidade ainda precisa passar
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Bloqueia novas reservas por `seconds` (ex.: após um Retry-After)."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self, amount: float = 1) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, amount: float = 1) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AIMDLimiter:
+    """Limite de requisições simultâneas com aumento aditivo e redução multiplicativa.
+
+    Serve tanto threads quanto corrotinas: quem não consegue vaga entra numa
+    fila e recebe a vaga diretamente de quem a libera. Sem `initial`, começa
+    em `maximum` (ou sem limite) e só passa a limitar no primeiro 429, a partir
+    de `throttle_start` (ou da metade das requisições em andamento, se menor).
+    """
+
+    def __init__(
+        self,
+        initial: Optional[int] = None,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+        backoff: float = 0.5,
+        throttle_start: int = 8
+    ):
+        self.maximum = float(maximum) if maximum else math.inf
+        self.limit = min(float(initial), self.maximum) if initial else self.maximum
+        self.minimum = minimum
+        self.throttle_start = throttle_start
+        self.backoff = backoff
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._last_decrease = 0.0
+        # Latência média (EWMA) das requisições: no máximo uma redução por RTT
+        self.rtt = 1.0
+
+    def _has_room(self) -> bool:
+        # Equivale a inflight < int(limit), também com limit infinito
+        return self.inflight + 1 <= self.limit
+
+    def _grant(self) -> None:
+        # Chamado com o lock: entrega vagas livres aos primeiros da fila
+        while self._waiters and self._has_room():
+            waiter = self._waiters.popleft()
+            self.inflight += 1
+            if isinstance(waiter, threading.Event):
+                waiter.set()
+            else:
+                loop, future = waiter
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._has_room() and not self._waiters:
+                self.inflight += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._has_room() and not self._waiters:
+                self.inflight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+            self._grant()
+
+    def on_success(self, latency: Optional[float] = None) -> None:
+        with self._lock:
+            if latency is not None:
+                self.rtt = 0.8 * self.rtt + 0.2 * latency
+            if self.limit < self.maximum:
+                # +1 vaga a cada `limit` sucessos, ou seja, uma por janela completa
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self._grant()
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            # Vários 429 da mesma janela (um RTT) contam como um só sinal
+            if now - self._last_decrease < self.rtt:
+                return
+            self._last_decrease = now
+            if self.limit == math.inf:
+                # Primeiro 429 sem limite: a rajada em andamento não diz a capacidade do servidor
+                self.limit = max(self.minimum, min(self.throttle_start, (self.inflight + 1) * self.backoff))
+            else:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Governa as chamadas a um provedor/modelo: rpm, tpm, concorrência e retentativas."""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        initial_concurrency: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0
+    ):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AIMDLimiter(initial=initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "transport_errors": 0, "retries": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _count_retry(self) -> None:
+        self._count("retries")
+        call = current_call()
+        if call is not None:
+            call.retries += 1
+
+    def _buckets(self, tokens: int):
+        if self.requests is not None:
+            yield self.requests, 1
+        if self.tokens is not None and tokens:
+            yield self.tokens, tokens
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Backoff exponencial com jitter completo; Retry-After é o piso, se houver."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = retry_after + delay * 0.1
+        return delay
+
+    def record_response(
+        self, status_code: int, headers, latency: Optional[float] = None
+    ) -> Tuple[bool, Optional[float]]:
+        """Registra o resultado; retorna (repetir?, Retry-After)."""
+        if status_code == 429:
+            retry_after = parse_retry_after(headers.get("retry-after"))
+            self._count("throttled")
+            self.concurrency.on_throttle()
+            if retry_after:
+                for bucket, _ in self._buckets(1):
+                    bucket.pause(retry_after)
+            return True, retry_after
+        if status_code in RETRY_STATUS:
+            return True, parse_retry_after(headers.get("retry-after"))
+        if status_code < 400:
+            self.concurrency.on_success(latency)
+        return False, None
+
+    def record_failure(self) -> None:
+        """Registra um erro de transporte (conexão recusada, timeout): sinal de sobrecarga."""
+        self._count("transport_errors")
+        self.concurrency.on_throttle()
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """Aguarda rpm, tpm e uma vaga de concorrência para uma requisição."""
+        for bucket, amount in self._buckets(tokens):
+            bucket.acquire(amount)
+        self.concurrency.acquire()
+        try:
+            yield
+        finally:
+            self.concurrency.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0):
+        for bucket, amount in self._buckets(tokens):
+            await bucket.aacquire(amount)
+        await self.concurrency.aacquire()
+        try:
+            yield
+        finally:
+            self.concurrency.release()
+
+    def call(self, send: Callable, tokens: int = 0):
+        """Executa `send()` (que retorna uma resposta HTTP) com limites e retentativas.
+
+        Retorna a última resposta; a interpretação de erros fica com o chamador.
+        """
+        self._count("requests")
+        attempt = 0
+        while True:
+            try:
+                with self.slot(tokens):
+                    inicio = time.monotonic()
+                    response = send()
+            except transport_errors():
+                self.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                self._count_retry()
+                time.sleep(self.retry_delay(attempt))
+                attempt += 1
+                continue
+            retry, retry_after = self.record_response(
+                response.status_code, response.headers, time.monotonic() - inicio
+            )
+            if not retry or attempt >= self.max_retries:
+                return response
+            response.close()
+            self._count_retry()
+            time.sleep(self.retry_delay(attempt, retry_after))
+            attempt += 1
+
+    async def acall(self, send: Callable[[], Awaitable], tokens: int = 0):
+        """Versão assíncrona de call(), para clientes httpx."""
+        self._count("requests")
+        attempt = 0
+        while True:
+            try:
+                async with self.aslot(tokens):
+                    inicio = time.monotonic()
+                    response = await send()
+            except transport_errors():
+                self.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                self._count_retry()
+                await asyncio.sleep(self.retry_delay(attempt))
+                attempt += 1
+                continue
+            retry, retry_after = self.record_response(
+                response.status_code, response.headers, time.monotonic() - inicio
+            )
+            if not retry or attempt >= self.max_retries:
+                return response
+            self._count_retry()
+            await asyncio.sleep(self.retry_delay(attempt, retry_after))
+            attempt += 1
+
+
+# Limites conhecidos por provedor (e opcionalmente por modelo); o resto só usa AIMD
+_limits: Dict[str, Dict] = {}
+_limiters: Dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def configure_limits(provider: str, model: Optional[str] = None, **limits) -> None:
+    """Define rpm, tpm e limites de concorrência de um provedor ou de um modelo.
+
+    Ex.: configure_limits("perplexity", rpm=50) ou
+         configure_limits("gemini", "gemini-pro", rpm=60, tpm=32000)
+    """
+    key = f"{provider}:{model}" if model else provider
+    with _registry_lock:
+        _limits[key] = limits
+        for name in [name for name in _limiters if name == key or name.startswith(f"{key}:")]:
+            del _limiters[name]
+
+
+def get_limiter(provider: str, model: str) -> RateLimiter:
+    """RateLimiter compartilhado do par provedor/modelo."""
+    key = f"{provider}:{model}"
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limits = dict(_limits.get(provider, {}))
+                limits.update(_limits.get(key, {}))
+                limiter = _limiters[key] = RateLimiter(**limits)
+    return limiter
+
+
+def _limit_value(limit: float) -> Optional[float]:
+    return None if limit == math.inf else round(limit, 2)
+
+
+def get_rate_limit_stats() -> Dict[str, Dict]:
+    return {
+        # concurrency None = ainda sem limite (nenhum 429 recebido)
+        key: dict(limiter.stats, concurrency=_limit_value(limiter.concurrency.limit))
+        for key, limiter in list(_limiters.items())
+    }
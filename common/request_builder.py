@@ -0,0 +1,88 @@
+import json
+from typing import Dict, List, Optional
+
+
+class IncrementalRequestBuilder:
+    """Monta a lista [sistema] + janela do histórico de forma incremental.
+
+    A lista de mensagens e a serialização JSON da janela ficam em cache
+    entre os turnos: a cada envio só as mensagens novas são serializadas e
+    anexadas a um buffer, e as que saem da janela apenas avançam o início
+    do buffer. A lista retornada é compartilhada com o builder e não deve
+    ser modificada por quem a recebe.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._messages: List[Optional[Dict]] = [None]  # Posição 0: mensagem do sistema
+        self._system_fragment = b"null"
+        self._system_content: Optional[str] = None
+        # Mensagens da janela já serializadas, cada uma precedida de ", "
+        self._buffer = bytearray()
+        self._offset = 0
+        self._lengths: List[int] = []
+        self._start = 0  # Índice no histórico da primeira mensagem da janela
+        self._synced = 0  # Quantas mensagens do histórico já foram vistas
+
+    def sync(self, history: List[Dict], start: int, system_content: str) -> List[Dict]:
+        """Atualiza o cache com o histórico atual e retorna [sistema] + history[start:]."""
+        # Histórico limpo ou janela recuada (troca de modelo): reconstrói o cache
+        if len(history) < self._synced or start < self._start:
+            self.reset()
+            self._start = self._synced = start
+
+        if system_content != self._system_content:
+            system_message = {"role": "system", "content": system_content}
+            self._messages[0] = system_message
+            self._system_fragment = json.dumps(system_message).encode()
+            self._system_content = system_content
+
+        if start > self._start:
+            # Remove do início as mensagens que saíram da janela
+            drop = min(start, self._synced) - self._start
+            del self._messages[1:1 + drop]
+            self._offset += sum(self._lengths[:drop])
+            del self._lengths[:drop]
+            self._start = start
+            # Compacta o buffer quando a parte descartada passa da metade
+            if self._offset > len(self._buffer) // 2:
+                del self._buffer[:self._offset]
+                self._offset = 0
+
+        for message in history[max(self._synced, start):]:
+            fragment = b", " + json.dumps(message).encode()
+            self._messages.append(message)
+            self._buffer += fragment
+            self._lengths.append(len(fragment))
+        self._synced = len(history)
+
+        return self._messages
+
+    def rewind(self, length: int) -> None:
+        """Esquece as mensagens a partir de `length` (retiradas do fim do histórico)."""
+        if length >= self._synced:
+            return
+        if length <= self._start:
+            self.reset()
+            return
+        drop = self._synced - length
+        del self._messages[-drop:]
+        del self._buffer[len(self._buffer) - sum(self._lengths[-drop:]):]
+        del self._lengths[-drop:]
+        self._synced = length
+
+    def messages_json(self) -> bytes:
+        """Array JSON das mensagens, montado a partir dos fragmentos já serializados."""
+        with memoryview(self._buffer) as view:
+            return b"".join((b"[", self._system_fragment, view[self._offset:], b"]"))
+
+    def build_body(self, body: Dict) -> bytes:
+        """Serializa o corpo da requisição reaproveitando os fragmentos das mensagens."""
+        params = {key: value for key, value in body.items() if key != "messages"}
+        if not params:
+            return b'{"messages": ' + self.messages_json() + b"}"
+        head = json.dumps(params)[:-1].encode()
+        with memoryview(self._buffer) as view:
+            return b"".join((head, b', "messages": [', self._system_fragment, view[self._offset:], b"]}"))
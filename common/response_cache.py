@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def make_key(payload: Any) -> str:
+    """Hash canônico do payload (modelo + mensagens + configuração de geração)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache de respostas com camada LRU em memória e camada SQLite em disco.
+
+    As entradas expiram após `ttl` segundos. A camada em memória guarda até
+    `max_entries` respostas e a camada em disco até `max_disk_entries`.
+    Em corrotinas, use aget/aset: a camada SQLite roda no executor padrão.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 24 * 3600,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 100000
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._db = None
+        self._disk_writes = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+            self._db.commit()
+
+    def _expired(self, expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at < time.time()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        return self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Como get(), sem bloquear o loop de eventos com o SQLite."""
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        if self._db is None:
+            return self._get_disk(key)  # Só conta o miss
+        return await asyncio.get_running_loop().run_in_executor(None, self._get_disk, key)
+
+    def _get_memory(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if not self._expired(expires_at):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._memory[key]
+        return None
+
+    def _get_disk(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1]):
+                        self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                        self._db.commit()
+                        value = json.loads(row[0])
+                        self._store_memory(key, value, row[1])
+                        self.stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+        self._set_disk(key, value, expires_at)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """Como set(); a gravação no SQLite roda no executor padrão."""
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._set_disk, key, value, expires_at)
+
+    def _set_disk(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, time.time())
+                )
+                self._disk_writes += 1
+                # Contar as linhas custa O(n): a verificação do limite é feita a cada 100 escritas
+                if self._disk_writes % 100 == 0:
+                    self._evict_disk()
+                self._db.commit()
+
+    def _store_memory(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self) -> None:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            self.stats["evictions"] += excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Retorna hits, misses, evicções e a taxa de acerto."""
+        with self._lock:
+            stats = dict(self.stats)
+            total = stats["hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / total if total else 0.0
+            stats["memory_entries"] = len(self._memory)
+            return stats
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def default_cache_dir() -> str:
+    return os.getenv("AI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-introduction"))
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> ResponseCache:
+    """Cache compartilhado pelos clientes do processo (diretório em AI_CACHE_DIR)."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache(db_path=os.path.join(default_cache_dir(), "responses.sqlite3"))
+    return _shared_cache
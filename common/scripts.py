@@ -0,0 +1,24 @@
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def load_script(relative_path: str, module_name: str) -> ModuleType:
+    """Importa um script do repositório pelo caminho (as pastas têm espaços no nome)."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    path = os.path.join(REPO_ROOT, relative_path)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registra antes de executar para que pickle/multiprocessing encontrem o módulo
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[module_name]
+        raise
+    return module
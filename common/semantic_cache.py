@@ -0,0 +1,656 @@
+"""Cache semântico: respostas reaproveitadas para perguntas parecidas (reformulações).
+
+Cada pergunta vira um vetor (embedding) calculado localmente na CPU, e a busca
+procura, entre as perguntas já respondidas no mesmo contexto (namespace: modelo,
+parâmetros e turnos anteriores), a mais parecida por similaridade de cosseno.
+Acima de `threshold`, a resposta guardada (conteúdo e citações) é devolvida sem
+chamar a API. Perguntas que diferem numa negação ("com álcool" / "sem álcool",
+"can" / "can't") nunca se casam, qualquer que seja a similaridade.
+
+O embedding padrão é léxico (palavras, com peso baixo para as vazias, pares
+de palavras e trigramas de caracteres somados num vetor de tamanho fixo por
+hashing) e não tem dependências: pega reformulações com as mesmas palavras em outra ordem, com
+outra acentuação, pontuação ou pequenas trocas. Para paráfrases com outras
+palavras, passe `embed_fn` com um modelo de embeddings. Como o embedding léxico
+também aproxima perguntas com os mesmos argumentos em outra ordem ("converter
+lista em conjunto" / "conjunto em lista" ficam em ~0.90), sem `embed_fn` o
+limiar padrão é mais alto (LEXICAL_THRESHOLD).
+
+O índice é um IVF em NumPy: até `train_size` entradas a busca é exaustiva;
+depois, as entradas são agrupadas por k-means em `nlist` listas contíguas
+(int8 com uma escala por vetor) e cada consulta compara só as `nprobe` listas
+mais próximas. As
+entradas ficam em SQLite (vetor, resposta, validade) e um snapshot do índice
+(.npz, gravado em `save()`/`close()`) evita refazer o agrupamento ao abrir.
+"""
+import atexit
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from common.response_cache import default_cache_dir, make_key
+
+EMBEDDING_DIM = 256
+# Limiar com um modelo de embeddings (embed_fn) e com o embedding léxico padrão
+DEFAULT_THRESHOLD = 0.85
+LEXICAL_THRESHOLD = 0.95
+# Acima disso, a pergunta é tratada como a mesma e a entrada é substituída
+# (a quantização em int8 deixa a similaridade de um vetor consigo mesmo em ~0.995)
+DUPLICATE_SIMILARITY = 0.99
+# Amostras por lista usadas no k-means (o índice é treinado ao atingir nlist * isso)
+TRAIN_POINTS_PER_LIST = 32
+KMEANS_ITERATIONS = 10
+ASSIGN_BATCH = 16384
+
+_WORD_RE = re.compile(r"\w+")
+_CONTRACTION_RE = re.compile(r"n['’]t\b")
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+# Palavras que quase não mudam o sentido da pergunta (já sem acentos)
+STOPWORDS = frozenset(_normalize(
+    "a o as os um uma uns umas de da do das dos em no na nos nas por pelo pela para com e é ou que "
+    "qual quais como se me eu você voce isso isto esse essa faço faz fazer pode posso "
+    "the an of to in on at for with and or is are was were be do does did i you it what whats how can "
+    "could would please me my which who this that there"
+).split())
+# Negações invertem a resposta: pesam como palavras de conteúdo e precisam coincidir
+NEGATIONS = frozenset(_normalize(
+    "não nem nunca jamais sem nenhum nenhuma not no never nor none without cannot"
+).split())
+STOPWORD_WEIGHT = 0.2
+TRIGRAM_WEIGHT = 0.3
+BIGRAM_WEIGHT = 0.5
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Embedding léxico normalizado: palavras, trigramas de caracteres e pares de palavras de conteúdo."""
+    features, weights = [], []
+    content = []
+    for word in _WORD_RE.findall(_normalize(text)):
+        features.append(word)
+        if word in STOPWORDS:
+            weights.append(STOPWORD_WEIGHT)
+            continue
+        weights.append(1.0)
+        content.append(word)
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            features.append(padded[i:i + 3])
+            weights.append(TRIGRAM_WEIGHT)
+    for a, b in zip(content, content[1:]):
+        features.append(f"{a} {b}")
+        weights.append(BIGRAM_WEIGHT)
+    if not features:
+        return np.zeros(dim, dtype=np.float32)
+
+    hashes = np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.uint32, count=len(features))
+    signed = np.array(weights)
+    # O bit mais alto do hash define o sinal, para que colisões tendam a se cancelar
+    signed[hashes >= 2 ** 31] *= -1
+    vector = np.bincount(hashes % dim, weights=signed, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _negations(text: str) -> frozenset:
+    """Negações presentes na pergunta ("don't" conta como "not")."""
+    words = _WORD_RE.findall(_CONTRACTION_RE.sub(" not", _normalize(text)))
+    return NEGATIONS.intersection(words)
+
+
+def request_namespace(body: Dict) -> str:
+    """Contexto de uma pergunta: o corpo da requisição sem a última mensagem e sem opções de streaming."""
+    context = {key: value for key, value in body.items() if key not in ("messages", "stream", "stream_options")}
+    context["messages"] = list(body["messages"][:-1])
+    return make_key(context)
+
+
+def _namespace_id(namespace: str) -> int:
+    digest = hashlib.blake2b(namespace.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 com uma escala por vetor: 1/4 da memória de float32 e conversão rápida na busca."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127
+    codes = np.round(vectors / np.where(scales > 0, scales, 1)[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def _to_blob(codes: np.ndarray, scale) -> bytes:
+    """Vetor quantizado para o banco: bytes int8 seguidos da escala em float32."""
+    return codes.tobytes() + np.float32(np.ravel(scale)[0]).tobytes()
+
+
+def _from_blobs(blobs: List[bytes], dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    rows = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), dim + 4)
+    return rows[:, :dim].view(np.int8).copy(), rows[:, dim:].copy().view(np.float32).ravel()
+
+
+def _assign(codes: np.ndarray, scales: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Índice do centróide mais próximo de cada vetor, em lotes para limitar a memória."""
+    assign = np.empty(len(codes), dtype=np.int32)
+    for start in range(0, len(codes), ASSIGN_BATCH):
+        batch = _dequantize(codes[start:start + ASSIGN_BATCH], scales[start:start + ASSIGN_BATCH])
+        assign[start:start + ASSIGN_BATCH] = np.argmax(batch @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(points: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS) -> np.ndarray:
+    """K-means esférico (cosseno) com centróides normalizados."""
+    rng = np.random.default_rng(0)
+    centroids = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.concatenate([
+            np.argmax(points[start:start + ASSIGN_BATCH] @ centroids.T, axis=1)
+            for start in range(0, len(points), ASSIGN_BATCH)
+        ])
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, points)
+        empty = np.bincount(assign, minlength=k) == 0
+        # Listas vazias recomeçam num ponto aleatório
+        sums[empty] = points[rng.choice(len(points), int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class _InvertedList:
+    """Vetores quantizados (int8 + escala), IDs e namespaces de uma lista do IVF, em arrays contíguos."""
+
+    __slots__ = ("codes", "scales", "ids", "namespaces", "count")
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.codes = np.empty((capacity, dim), dtype=np.int8)
+        self.scales = np.empty(capacity, dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.namespaces = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+
+    @classmethod
+    def from_arrays(cls, codes: np.ndarray, scales: np.ndarray, ids: np.ndarray, namespaces: np.ndarray) -> "_InvertedList":
+        inverted = cls(codes.shape[1], max(16, len(ids)))
+        inverted.extend(codes, scales, ids, namespaces)
+        return inverted
+
+    def _reserve(self, size: int) -> None:
+        if size > len(self.ids):
+            capacity = max(size, len(self.ids) + len(self.ids) // 2)
+            self.codes = np.resize(self.codes, (capacity, self.codes.shape[1]))
+            self.scales = np.resize(self.scales, capacity)
+            self.ids = np.resize(self.ids, capacity)
+            self.namespaces = np.resize(self.namespaces, capacity)
+
+    def extend(self, codes: np.ndarray, scales: np.ndarray, ids: np.ndarray, namespaces: np.ndarray) -> np.ndarray:
+        """Acrescenta vários itens; retorna as posições ocupadas."""
+        start, end = self.count, self.count + len(ids)
+        self._reserve(end)
+        self.codes[start:end] = codes
+        self.scales[start:end] = scales
+        self.ids[start:end] = ids
+        self.namespaces[start:end] = namespaces
+        self.count = end
+        return np.arange(start, end)
+
+    def remove(self, pos: int) -> int:
+        """Remove a posição trazendo o último item para ela; retorna o ID movido (ou -1)."""
+        last = self.count - 1
+        moved = -1
+        if pos != last:
+            self.codes[pos] = self.codes[last]
+            self.scales[pos] = self.scales[last]
+            self.ids[pos] = self.ids[last]
+            self.namespaces[pos] = self.namespaces[last]
+            moved = int(self.ids[pos])
+        self.count = last
+        return moved
+
+    def best(self, query: np.ndarray, namespace: int) -> Tuple[int, float]:
+        """Entrada mais parecida com a consulta no namespace: (ID, similaridade)."""
+        n = self.count
+        scores = (self.codes[:n].astype(np.float32) @ query) * self.scales[:n]
+        scores[self.namespaces[:n] != namespace] = -np.inf
+        i = int(np.argmax(scores))
+        return int(self.ids[i]), float(scores[i])
+
+
+class SemanticCache:
+    """Cache de respostas por similaridade da pergunta, com índice IVF, LRU e validade.
+
+    Com `path`, as entradas ficam num banco SQLite e o índice é salvo ao lado
+    (`<path>.index.npz`) em `save()`/`close()`; sem `path`, tudo fica em memória.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: Optional[float] = None,
+        max_entries: int = 100000,
+        ttl: Optional[float] = 30 * 24 * 3600,
+        embed_fn: Optional[Callable[[str], np.ndarray]] = None,
+        dim: int = EMBEDDING_DIM,
+        nlist: Optional[int] = None,
+        nprobe: int = 8
+    ):
+        self.path = path
+        if threshold is None:
+            threshold = DEFAULT_THRESHOLD if embed_fn is not None else LEXICAL_THRESHOLD
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn or (lambda text: embed_text(text, dim))
+        self.dim = dim
+        self.nlist = nlist or max(1, int(math.sqrt(max_entries)))
+        self.nprobe = nprobe
+        self.train_size = TRAIN_POINTS_PER_LIST * self.nlist
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._payloads: Dict[int, Tuple[str, Any]] = {}
+        self._reset_index()
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY, namespace INTEGER NOT NULL, vector BLOB NOT NULL, "
+                "prompt TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', '0')")
+            self._db.commit()
+            stored_dim = int(self._meta("dim"))
+            if stored_dim != dim:
+                raise ValueError(f"O cache em {path} usa embeddings de dimensão {stored_dim}, não {dim}")
+            self._load()
+
+    # Índice em memória
+
+    def _reset_index(self) -> None:
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_InvertedList] = [_InvertedList(self.dim)]
+        # Por ID de entrada: lista e posição no IVF (-1 = livre), validade e último acesso
+        self._list_of = np.full(16, -1, dtype=np.int32)
+        self._pos_of = np.zeros(16, dtype=np.int32)
+        self._expires = np.zeros(16, dtype=np.float64)
+        self._accessed = np.zeros(16, dtype=np.float64)
+        self._free_ids: List[int] = []
+        self._next_id = 0
+        self.count = 0
+
+    def _ensure_capacity(self, size: int) -> None:
+        capacity = len(self._list_of)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self._list_of = np.concatenate([self._list_of, np.full(capacity - len(self._list_of), -1, dtype=np.int32)])
+        self._pos_of = np.resize(self._pos_of, capacity)
+        self._expires = np.resize(self._expires, capacity)
+        self._accessed = np.resize(self._accessed, capacity)
+
+    def _new_id(self) -> int:
+        if self._free_ids:
+            return self._free_ids.pop()
+        self._next_id += 1
+        self._ensure_capacity(self._next_id)
+        return self._next_id - 1
+
+    def _insert(self, entry_id: int, vector: np.ndarray, namespace: int, expires_at: float, accessed_at: float) -> None:
+        index = 0 if self._centroids is None else int(np.argmax(self._centroids @ vector))
+        codes, scales = _quantize(vector)
+        self._pos_of[entry_id] = self._lists[index].extend(codes, scales, [entry_id], [namespace])[0]
+        self._list_of[entry_id] = index
+        self._expires[entry_id] = expires_at
+        self._accessed[entry_id] = accessed_at
+        self.count += 1
+
+    def _remove(self, entry_id: int) -> None:
+        moved = self._lists[self._list_of[entry_id]].remove(int(self._pos_of[entry_id]))
+        if moved >= 0:
+            self._pos_of[moved] = self._pos_of[entry_id]
+        self._list_of[entry_id] = -1
+        self._free_ids.append(entry_id)
+        self._payloads.pop(entry_id, None)
+        self.count -= 1
+
+    def _search(self, query: np.ndarray, namespace: int) -> Tuple[int, float]:
+        if self._centroids is None:
+            candidates = self._lists
+        else:
+            probe = min(self.nprobe, len(self._lists))
+            nearest = np.argpartition(-(self._centroids @ query), probe - 1)[:probe]
+            candidates = [self._lists[i] for i in nearest]
+        best_id, best_score = -1, -np.inf
+        for inverted in candidates:
+            if inverted.count:
+                entry_id, score = inverted.best(query, namespace)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+        return best_id, best_score
+
+    def _live_arrays(self) -> Dict[str, np.ndarray]:
+        """IDs, vetores, namespaces e lista de todas as entradas, agrupados por lista."""
+        arrays = {
+            name: np.concatenate([getattr(inverted, name)[:inverted.count] for inverted in self._lists])
+            for name in ("ids", "codes", "scales", "namespaces")
+        }
+        arrays["assign"] = np.repeat(
+            np.arange(len(self._lists), dtype=np.int32), [inverted.count for inverted in self._lists]
+        )
+        return arrays
+
+    def _build_lists(
+        self,
+        ids: np.ndarray,
+        codes: np.ndarray,
+        scales: np.ndarray,
+        namespaces: np.ndarray,
+        assign: np.ndarray
+    ) -> None:
+        order = np.argsort(assign, kind="stable")
+        ids, codes, scales, namespaces, assign = ids[order], codes[order], scales[order], namespaces[order], assign[order]
+        bounds = np.searchsorted(assign, np.arange(len(self._lists) + 1))
+        for index in range(len(self._lists)):
+            part = slice(bounds[index], bounds[index + 1])
+            self._lists[index] = _InvertedList.from_arrays(codes[part], scales[part], ids[part], namespaces[part])
+            self._list_of[ids[part]] = index
+            self._pos_of[ids[part]] = np.arange(len(ids[part]))
+
+    def _train(self) -> None:
+        """Agrupa as entradas atuais em `nlist` listas (k-means sobre uma amostra)."""
+        live = self._live_arrays()
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(live["ids"]), min(len(live["ids"]), self.train_size), replace=False)
+        self._centroids = _kmeans(_dequantize(live["codes"][sample], live["scales"][sample]), self.nlist)
+        self._lists = [None] * self.nlist
+        assign = _assign(live["codes"], live["scales"], self._centroids)
+        self._build_lists(live["ids"], live["codes"], live["scales"], live["namespaces"], assign)
+
+    def retrain(self) -> None:
+        """Refaz o agrupamento com os dados atuais (após muitas inserções fora da distribuição inicial)."""
+        with self._lock:
+            if self.count >= self.nlist:
+                self._train()
+
+    def _evict(self, n: int) -> None:
+        live = np.flatnonzero(self._list_of[:self._next_id] >= 0)
+        # Entradas vencidas saem primeiro; depois, as usadas há mais tempo
+        keys = np.where(self._expires[live] < time.time(), -np.inf, self._accessed[live])
+        victims = live[np.argpartition(keys, n - 1)[:n]] if n < len(live) else live
+        for entry_id in victims:
+            self._remove(int(entry_id))
+        if self._db is not None:
+            self._db.executemany("DELETE FROM entries WHERE id = ?", [(int(i),) for i in victims])
+        self.stats["evictions"] += len(victims)
+
+    # Persistência
+
+    def _meta(self, key: str) -> str:
+        return self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _bump_generation(self) -> None:
+        self._db.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+
+    def _snapshot_path(self) -> str:
+        return f"{self.path}.index.npz"
+
+    def _load(self) -> None:
+        generation = int(self._meta("generation"))
+        snapshot = self._snapshot_path()
+        if os.path.exists(snapshot):
+            with np.load(snapshot) as data:
+                if int(data["generation"]) == generation:
+                    arrays = {key: data[key] for key in data.files}
+                    if arrays["codes"].shape[1:] == (self.dim,):
+                        self._restore(arrays)
+                        return
+
+        # Sem snapshot válido: reconstrói o índice a partir do banco
+        rows = self._db.execute("SELECT id, namespace, vector, expires_at, accessed_at FROM entries").fetchall()
+        if not rows:
+            return
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._ensure_capacity(int(ids.max()) + 1)
+        self._next_id = int(ids.max()) + 1
+        self._free_ids = np.setdiff1d(np.arange(self._next_id), ids).tolist()
+        codes, scales = _from_blobs([row[2] for row in rows], self.dim)
+        namespaces = np.array([row[1] for row in rows], dtype=np.int64)
+        self._expires[ids] = [row[3] if row[3] is not None else np.inf for row in rows]
+        self._accessed[ids] = [row[4] for row in rows]
+        self.count = len(rows)
+        self._build_lists(ids, codes, scales, namespaces, np.zeros(len(ids), dtype=np.int32))
+        if self.count >= self.train_size and self.nlist > 1:
+            self._train()
+
+    def _restore(self, data: Dict[str, np.ndarray]) -> None:
+        ids = data["ids"]
+        self._next_id = int(data["next_id"])
+        self._ensure_capacity(self._next_id)
+        self._free_ids = data["free_ids"].tolist()
+        self._expires[ids] = data["expires"]
+        self._accessed[ids] = data["accessed"]
+        self.count = len(ids)
+        if data["centroids"].size:
+            self._centroids = data["centroids"]
+            self._lists = [None] * len(self._centroids)
+        self._build_lists(ids, data["codes"], data["scales"], data["namespaces"], data["assign"])
+
+    def save(self) -> None:
+        """Grava o snapshot do índice (troca atômica); sem ele, o índice é reconstruído do banco ao abrir."""
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.commit()
+            live = self._live_arrays()
+            tmp_path = f"{self.path}.index.tmp.npz"
+            np.savez(
+                tmp_path,
+                generation=np.int64(self._meta("generation")),
+                expires=self._expires[live["ids"]], accessed=self._accessed[live["ids"]],
+                centroids=self._centroids if self._centroids is not None else np.empty((0, self.dim), np.float32),
+                next_id=np.int64(self._next_id),
+                free_ids=np.array(self._free_ids, dtype=np.int64),
+                **live
+            )
+            os.replace(tmp_path, self._snapshot_path())
+
+    # API
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn(prompt), dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"embed_fn retornou um vetor de forma {vector.shape}, esperado ({self.dim},)")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, prompt: str, namespace: str = "") -> Optional[Dict]:
+        """A entrada mais parecida acima do limiar: {'value', 'prompt', 'similarity'}, ou None."""
+        query = self._embed(prompt)
+        with self._lock:
+            entry_id, similarity = self._search(query, _namespace_id(namespace))
+            if entry_id < 0 or similarity < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            if self._expires[entry_id] < time.time():
+                self._remove(entry_id)
+                if self._db is not None:
+                    self._db.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+                    self._bump_generation()
+                    self._db.commit()
+                self.stats["misses"] += 1
+                return None
+
+            if self._db is None:
+                matched, value = self._payloads[entry_id]
+            else:
+                row = self._db.execute("SELECT prompt, value FROM entries WHERE id = ?", (entry_id,)).fetchone()
+                if row is None:
+                    self._remove(entry_id)
+                    self.stats["misses"] += 1
+                    return None
+                matched, value = row
+            if _negations(matched) != _negations(prompt):
+                self.stats["misses"] += 1
+                return None
+
+            now = time.time()
+            self._accessed[entry_id] = now
+            if self._db is not None:
+                self._db.execute("UPDATE entries SET accessed_at = ? WHERE id = ?", (now, entry_id))
+                self._db.commit()
+                value = json.loads(value)
+            self.stats["hits"] += 1
+            return {"value": value, "prompt": matched, "similarity": similarity}
+
+    def get(self, prompt: str, namespace: str = "") -> Optional[Any]:
+        match = self.lookup(prompt, namespace)
+        return match["value"] if match is not None else None
+
+    def set(self, prompt: str, value: Any, namespace: str = "") -> None:
+        vector = self._embed(prompt)
+        namespace_id = _namespace_id(namespace)
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else np.inf
+        with self._lock:
+            entry_id, similarity = self._search(vector, namespace_id)
+            if entry_id >= 0 and similarity >= DUPLICATE_SIMILARITY:
+                # Mesma pergunta: só atualiza a resposta
+                self._expires[entry_id] = expires_at
+                self._accessed[entry_id] = now
+            else:
+                entry_id = self._new_id()
+                self._insert(entry_id, vector, namespace_id, expires_at, now)
+            if self._db is None:
+                self._payloads[entry_id] = (prompt, value)
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (id, namespace, vector, prompt, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        entry_id, namespace_id, _to_blob(*_quantize(vector)), prompt,
+                        json.dumps(value, ensure_ascii=False), expires_at if self.ttl else None, now
+                    )
+                )
+
+            if self._centroids is None and self.nlist > 1 and self.count >= self.train_size:
+                self._train()
+            if self.count > self.max_entries:
+                # Despeja 1% a mais para não pagar a seleção a cada inserção
+                self._evict(self.count - self.max_entries + max(1, self.max_entries // 100))
+            if self._db is not None:
+                self._bump_generation()
+                self._db.commit()
+
+    def set_many(self, items: List[Tuple[str, Any]], namespace: str = "") -> None:
+        """Insere vários pares (pergunta, resposta) de uma vez, sem checar duplicatas (ex.: aquecer o cache)."""
+        if not items:
+            return
+        codes, scales = _quantize(np.stack([self._embed(prompt) for prompt, _ in items]))
+        namespace_id = _namespace_id(namespace)
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else np.inf
+        with self._lock:
+            ids = np.array([self._new_id() for _ in items], dtype=np.int64)
+            assign = (
+                np.zeros(len(ids), dtype=np.int32) if self._centroids is None
+                else _assign(codes, scales, self._centroids)
+            )
+            for index in np.unique(assign):
+                members = np.flatnonzero(assign == index)
+                positions = self._lists[index].extend(
+                    codes[members], scales[members], ids[members], np.full(len(members), namespace_id, dtype=np.int64)
+                )
+                self._list_of[ids[members]] = index
+                self._pos_of[ids[members]] = positions
+            self._expires[ids] = expires_at
+            self._accessed[ids] = now
+            self.count += len(ids)
+
+            if self._db is None:
+                for entry_id, (prompt, value) in zip(ids.tolist(), items):
+                    self._payloads[entry_id] = (prompt, value)
+            else:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries (id, namespace, vector, prompt, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (entry_id, namespace_id, _to_blob(code, scale), prompt, json.dumps(value, ensure_ascii=False),
+                         expires_at if self.ttl else None, now)
+                        for entry_id, code, scale, (prompt, value) in zip(ids.tolist(), codes, scales, items)
+                    )
+                )
+
+            if self._centroids is None and self.nlist > 1 and self.count >= self.train_size:
+                self._train()
+            if self.count > self.max_entries:
+                self._evict(self.count - self.max_entries)
+            if self._db is not None:
+                self._bump_generation()
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._payloads.clear()
+            self._reset_index()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+                self._bump_generation()
+                self._db.commit()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get_stats(self) -> Dict[str, float]:
+        """Retorna hits, misses, evicções, a taxa de acerto e o tamanho do índice."""
+        with self._lock:
+            stats = dict(self.stats)
+            total = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / total if total else 0.0
+            stats["entries"] = self.count
+            stats["lists"] = len(self._lists)
+            return stats
+
+    def close(self) -> None:
+        if self._db is not None:
+            self.save()
+            self._db.close()
+            self._db = None
+
+
+_shared_cache: Optional[SemanticCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_semantic_cache() -> SemanticCache:
+    """Cache semântico compartilhado pelos clientes do processo (em AI_CACHE_DIR); o índice é salvo na saída."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = SemanticCache(os.path.join(default_cache_dir(), "semantic.sqlite3"))
+                atexit.register(_shared_cache.close)
+    return _shared_cache
@@ -0,0 +1,199 @@
+"""Conversas persistidas como log append-only (JSON lines), uma sessão por arquivo.
+
+Cada mensagem vira uma linha acrescentada ao log no momento em que entra no
+histórico, então salvar custa O(1) por turno, independentemente do tamanho
+da conversa. Ao carregar, o log é reproduzido; `clear` e `pop` são registros
+no log e `compact()` regrava o arquivo só com o estado atual.
+"""
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from common.history import History
+
+# Compacta ao abrir quando o log tem mais que isso de registros descartados
+COMPACT_MIN_DEAD = 1000
+
+
+def default_session_dir() -> str:
+    base = os.path.join(os.path.expanduser("~"), ".local", "share", "ai-introduction")
+    return os.getenv("AI_SESSION_DIR", os.path.join(base, "sessions"))
+
+
+def new_session_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def _replay(path: str) -> Tuple[History, Dict, int, int]:
+    """Reproduz o log; retorna (mensagens, metadados, registros, bytes válidos)."""
+    messages = History()
+    meta: Dict = {}
+    records = 0
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError
+                record = json.loads(line)
+            except ValueError:
+                # Última linha incompleta (o processo parou no meio da escrita)
+                break
+            records += 1
+            valid_bytes += len(line)
+            op = record.get("op")
+            if op == "message":
+                messages.append(record["message"])
+            elif op == "clear":
+                messages.clear()
+            elif op == "pop":
+                del messages[-1]
+            elif op == "meta":
+                meta.update(record["data"])
+    return messages, meta, records, valid_bytes
+
+
+class Session:
+    """Log de uma conversa. Use SessionStore.open() para criar ou retomar uma sessão.
+
+    Com `keep_open=False` o arquivo é aberto só durante cada escrita: mais lento
+    por turno, mas sem descritor e buffer por sessão (servidores com milhares delas).
+    """
+
+    def __init__(self, session_id: str, path: str, fsync: bool = False, keep_open: bool = True):
+        self.id = session_id
+        self.path = path
+        self.fsync = fsync
+        self.keep_open = keep_open
+        self._lock = threading.Lock()
+        self.messages = History()
+        self.meta: Dict = {}
+        self._records = 0
+        if os.path.exists(path):
+            self.messages, self.meta, self._records, valid_bytes = _replay(path)
+            if valid_bytes < os.path.getsize(path):
+                # Descarta a linha incompleta para que os próximos registros não colem nela
+                os.truncate(path, valid_bytes)
+        self._file = open(path, 'a', encoding='utf-8') if keep_open else None
+        if self._records - len(self.messages) > COMPACT_MIN_DEAD:
+            self.compact()
+
+    def _write_lines(self, lines: str, count: int) -> None:
+        with self._lock:
+            f = self._file if self.keep_open else open(self.path, 'a', encoding='utf-8')
+            try:
+                f.write(lines)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            finally:
+                if not self.keep_open:
+                    f.close()
+            self._records += count
+
+    def _write(self, record: Dict) -> None:
+        self._write_lines(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n", 1)
+
+    def append(self, message: Dict) -> None:
+        """Acrescenta uma mensagem ao log (uma linha, sem reescrever o arquivo)."""
+        self.messages.append(message)
+        self._write({"op": "message", "message": message})
+
+    def extend(self, messages: List[Dict]) -> None:
+        """Acrescenta várias mensagens numa única escrita."""
+        if not messages:
+            return
+        self.messages.extend(messages)
+        lines = "".join(
+            json.dumps({"op": "message", "message": message}, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for message in messages
+        )
+        self._write_lines(lines, len(messages))
+
+    def pop(self) -> None:
+        """Desfaz a última mensagem (ex.: a pergunta de um turno que falhou)."""
+        del self.messages[-1]
+        self._write({"op": "pop"})
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self._write({"op": "clear"})
+
+    def set_meta(self, **data) -> None:
+        """Registra metadados da sessão (ex.: provedor e configuração)."""
+        self.meta.update(data)
+        self._write({"op": "meta", "data": data})
+
+    def compact(self) -> None:
+        """Regrava o log só com os metadados e as mensagens atuais (troca atômica)."""
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    records = [{"op": "meta", "data": self.meta}] if self.meta else []
+                    records += [{"op": "message", "message": message} for message in self.messages]
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                if self._file is not None:
+                    self._file.close()
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            finally:
+                if self._file is not None and self._file.closed:
+                    self._file = open(self.path, 'a', encoding='utf-8')
+            self._records = len(records)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SessionStore:
+    """Diretório de sessões: cria, retoma e lista conversas salvas."""
+
+    def __init__(self, directory: Optional[str] = None, fsync: bool = False, keep_open: bool = True):
+        self.directory = directory or default_session_dir()
+        self.fsync = fsync
+        self.keep_open = keep_open
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        if not session_id or os.path.basename(session_id) != session_id or session_id.startswith("."):
+            raise ValueError(f"ID de sessão inválido: {session_id!r}")
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def open(self, session_id: Optional[str] = None) -> Session:
+        """Retoma a sessão `session_id` (ou cria uma nova, se não existir ou não for informada)."""
+        session_id = session_id or new_session_id()
+        return Session(session_id, self._path(session_id), fsync=self.fsync, keep_open=self.keep_open)
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self._path(session_id))
+
+    def list_sessions(self) -> List[str]:
+        """IDs das sessões, da mais recente para a mais antiga."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".jsonl"):
+                entries.append((os.path.getmtime(os.path.join(self.directory, name)), name[:-len(".jsonl")]))
+        return [session_id for _, session_id in sorted(entries, reverse=True)]
+
+    def delete(self, session_id: str) -> None:
+        os.remove(self._path(session_id))
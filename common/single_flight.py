@@ -0,0 +1,212 @@
+"""Coalescência de requisições idênticas em andamento (single-flight).
+
+Chamadas concorrentes com a mesma chave (o hash canônico da requisição)
+esperam uma única chamada ao provedor e recebem o mesmo resultado, ou a mesma
+exceção. Em streaming, um leitor consome a resposta do provedor e cada trecho
+é repassado a todos os interessados; quem chega depois recebe primeiro os
+trechos já lidos. Nada é guardado depois que a chamada termina: para isso
+existe o response_cache.
+
+Como no RateLimiter, `do`/`stream` atendem threads e `ado`/`astream` atendem
+corrotinas (uma tabela de chamadas por event loop).
+"""
+import asyncio
+import contextvars
+import threading
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+
+class _Flight:
+    """Uma chamada em andamento: resultado (ou trechos do streaming) e quem está esperando."""
+
+    __slots__ = ("done", "result", "error", "chunks", "waiters", "task", "changed")
+
+    def __init__(self, changed):
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.chunks: List[Any] = []
+        self.waiters = 1
+        self.task = None
+        # threading.Condition nas threads, asyncio.Event nas corrotinas
+        self.changed = changed
+
+
+class SingleFlight:
+    """Agrupa chamadas concorrentes com a mesma chave em uma só."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self._async: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    @staticmethod
+    def _forget(table: Dict[str, _Flight], key: str, flight: _Flight) -> None:
+        # Só remove se a chave ainda aponta para esta chamada (e não para uma mais nova)
+        if table.get(key) is flight:
+            del table[key]
+
+    def _join(self, table: Dict[str, _Flight], key: str, changed: Callable[[], Any]):
+        """Retorna (chamada, é_a_primeira); deve ser chamado com o lock (ou no event loop)."""
+        flight = table.get(key)
+        if flight is not None:
+            flight.waiters += 1
+            self.stats["coalesced"] += 1
+            return flight, False
+        flight = table[key] = _Flight(changed())
+        self.stats["calls"] += 1
+        return flight, True
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Executa `fn()`, ou espera a chamada idêntica que já está em andamento."""
+        with self._lock:
+            flight, leader = self._join(self._calls, key, threading.Event)
+        if not leader:
+            flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._forget(self._calls, key, flight)
+            flight.changed.set()
+        return flight.result
+
+    def stream(self, key: str, fn: Callable[[], Iterator]) -> Iterator:
+        """Gera os itens de `fn()`, compartilhando o streaming idêntico em andamento.
+
+        O streaming do provedor é lido numa thread própria, então um leitor lento
+        ou que desiste no meio não atrasa nem interrompe os demais.
+        """
+        with self._lock:
+            flight, leader = self._join(self._streams, key, threading.Condition)
+        if leader:
+            # A thread herda o contexto (métricas) de quem abriu o streaming
+            context = contextvars.copy_context()
+            flight.task = threading.Thread(target=context.run, args=(self._pump, key, flight, fn), daemon=True)
+            flight.task.start()
+
+        index = 0
+        try:
+            while True:
+                with flight.changed:
+                    while index >= len(flight.chunks) and not flight.done:
+                        flight.changed.wait()
+                    chunks = flight.chunks[index:]
+                    done = flight.done
+                index += len(chunks)
+                yield from chunks
+                if done and index >= len(flight.chunks):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                if not flight.waiters:
+                    # Ninguém mais lê: quem chegar agora abre um streaming novo
+                    self._forget(self._streams, key, flight)
+
+    def _pump(self, key: str, flight: _Flight, fn: Callable[[], Iterator]) -> None:
+        try:
+            for chunk in fn():
+                with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+                if not flight.waiters:
+                    break
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                self._forget(self._streams, key, flight)
+            with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def _loop_tables(self) -> Dict[str, Dict[str, _Flight]]:
+        loop = asyncio.get_running_loop()
+        tables = self._async.get(loop)
+        if tables is None:
+            tables = self._async[loop] = {"calls": {}, "streams": {}}
+        return tables
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable]) -> Any:
+        """Versão assíncrona de do(). Se todos desistirem (cancelamento), a chamada é cancelada."""
+        table = self._loop_tables()["calls"]
+        flight, leader = self._join(table, key, lambda: None)
+        if leader:
+            flight.task = asyncio.ensure_future(fn())
+            flight.task.add_done_callback(lambda _: self._forget(table, key, flight))
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                self._forget(table, key, flight)
+                flight.task.cancel()
+
+    async def astream(self, key: str, fn: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Versão assíncrona de stream(); o streaming do provedor é lido numa task própria."""
+        table = self._loop_tables()["streams"]
+        flight, leader = self._join(table, key, asyncio.Event)
+        if leader:
+            flight.task = asyncio.ensure_future(self._apump(table, key, flight, fn))
+
+        index = 0
+        try:
+            while True:
+                if index >= len(flight.chunks) and not flight.done:
+                    await flight.changed.wait()
+                chunks = flight.chunks[index:]
+                index += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if flight.done and index >= len(flight.chunks):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.done:
+                self._forget(table, key, flight)
+                flight.task.cancel()
+
+    async def _apump(self, table: Dict[str, _Flight], key: str, flight: _Flight, fn: Callable[[], AsyncIterator]) -> None:
+        try:
+            async for chunk in fn():
+                flight.chunks.append(chunk)
+                # Acorda quem está esperando e arma o evento para o próximo trecho
+                changed, flight.changed = flight.changed, asyncio.Event()
+                changed.set()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(table, key, flight)
+            flight.done = True
+            flight.changed.set()
+
+
+_shared: Optional[SingleFlight] = None
+_shared_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Instância compartilhada pelos clientes (GeminiAPI, PerplexityChat)."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = SingleFlight()
+    return _shared
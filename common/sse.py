@@ -0,0 +1,45 @@
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional
+
+
+def _feed(line: str, data_lines: List[str]) -> Optional[str]:
+    """Processa uma linha SSE; retorna os dados do evento quando ele termina."""
+    if line.endswith("\r"):
+        line = line[:-1]
+    if not line:
+        if data_lines:
+            data = "\n".join(data_lines)
+            data_lines.clear()
+            return data
+        return None
+    if line.startswith(":"):
+        return None  # Comentário / keep-alive
+    field, _, value = line.partition(":")
+    if field == "data":
+        data_lines.append(value[1:] if value.startswith(" ") else value)
+    return None
+
+
+def iter_sse_data(lines: Iterable[str]) -> Iterator[str]:
+    """Gera o campo `data` de cada evento Server-Sent Events até o marcador [DONE]."""
+    data_lines: List[str] = []
+    for line in lines:
+        data = _feed(line, data_lines)
+        if data is not None:
+            if data == "[DONE]":
+                return
+            yield data
+    if data_lines and data_lines[0] != "[DONE]":
+        yield "\n".join(data_lines)
+
+
+async def aiter_sse_data(lines: AsyncIterable[str]) -> AsyncIterator[str]:
+    """Versão assíncrona de iter_sse_data."""
+    data_lines: List[str] = []
+    async for line in lines:
+        data = _feed(line, data_lines)
+        if data is not None:
+            if data == "[DONE]":
+                return
+            yield data
+    if data_lines and data_lines[0] != "[DONE]":
+        yield "\n".join(data_lines)
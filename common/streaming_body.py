@@ -0,0 +1,205 @@
+"""Corpo JSON enviado em streaming, com a mídia codificada em base64 direto do disco.
+
+Montar `{"inline_data": {"data": base64}}` num dict e serializar com json.dumps
+deixa na memória o arquivo, o base64 (4/3 do tamanho) e o JSON com o base64
+dentro. Aqui o envelope JSON é serializado com um marcador no lugar de cada
+InlineMedia e o corpo é gerado em pedaços: trechos do envelope e blocos de
+base64 lidos de um mmap do arquivo. O tamanho total é conhecido de antemão, então
+a requisição sai com Content-Length (sem chunked) e a memória não cresce com o
+tamanho da mídia.
+
+Mídia que já está na memória (o JPEG de MediaHandler.process_image) entra como
+InlineBytes: o base64 também é gerado em blocos durante o envio, sem a string
+completa.
+
+O corpo serve para requests (`data=body`) e httpx (`content=body`). O
+httpx.AsyncClient recusa iteráveis síncronos, então lá o corpo vai dentro de um
+AsyncBody, que lê e codifica cada bloco no executor padrão.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import mimetypes
+import mmap
+import os
+import re
+import uuid
+from typing import AsyncIterator, Iterator, List, Optional, Union
+
+from common.media_cache import hash_file
+
+# Múltiplo de 3 (base64 sem padding entre blocos) e do tamanho de página (madvise)
+CHUNK_SIZE = 3 * 256 * 1024
+
+
+def _iter_mapped(path: str, start: int, end: int, chunk_size: int, encode) -> Iterator[bytes]:
+    """Gera encode(bloco) para o trecho [start, end) do arquivo, lido de um mmap.
+
+    As páginas já enviadas são devolvidas com MADV_DONTNEED: continuam no cache
+    de páginas do sistema, mas não se acumulam no RSS do processo.
+    """
+    if end <= start:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        dontneed = getattr(mmap, "MADV_DONTNEED", None)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            for offset in range(start, end, chunk_size):
+                stop = min(offset + chunk_size, end)
+                yield encode(view[offset:stop])
+                if dontneed is not None:
+                    page = offset - offset % mmap.PAGESIZE
+                    mapped.madvise(dontneed, page, stop - page)
+
+
+async def _aiter_blocking(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Consome um gerador bloqueante (disco + base64) no executor, bloco a bloco."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        try:
+            chunks.close()
+        except ValueError:
+            # Cancelado com um bloco em andamento no executor: o gerador é fechado pelo GC
+            pass
+
+
+class _Inline:
+    """Base de InlineMedia e InlineBytes: mídia em `inline_data`, codificada no envio."""
+
+    __slots__ = ()
+
+    @property
+    def encoded_size(self) -> int:
+        """Tamanho do base64 (com padding)."""
+        return 4 * ((self.size + 2) // 3)
+
+
+class InlineMedia(_Inline):
+    """Arquivo enviado em `inline_data` sem ser carregado na memória."""
+
+    __slots__ = ("path", "mime_type", "size", "_digest")
+
+    def __init__(self, path: str, mime_type: Optional[str] = None):
+        self.path = path
+        self.mime_type = mime_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.size = os.path.getsize(path)
+        self._digest: Optional[str] = None
+
+    def iter_base64(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        chunk_size -= chunk_size % 3
+        return _iter_mapped(self.path, 0, self.size, chunk_size, base64.b64encode)
+
+    def __str__(self) -> str:
+        # Chaves de cache e de coalescência (make_key usa default=str): endereçadas pelo conteúdo
+        if self._digest is None:
+            self._digest = hash_file(self.path)
+        return f"{self.mime_type}:sha256:{self._digest}"
+
+
+class InlineBytes(_Inline):
+    """Bytes já em memória enviados em `inline_data`; o base64 é gerado bloco a bloco."""
+
+    __slots__ = ("data", "mime_type", "size", "_digest")
+
+    def __init__(self, data: bytes, mime_type: str):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = len(data)
+        self._digest: Optional[str] = None
+
+    def iter_base64(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        chunk_size -= chunk_size % 3
+        view = memoryview(self.data)
+        for offset in range(0, self.size, chunk_size):
+            yield base64.b64encode(view[offset:offset + chunk_size])
+
+    def __str__(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data).hexdigest()
+        return f"{self.mime_type}:sha256:{self._digest}"
+
+
+class FileRange:
+    """Trecho [start, end) de um arquivo como corpo de requisição (bytes crus)."""
+
+    __slots__ = ("path", "start", "end", "chunk_size")
+
+    def __init__(self, path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.start = start
+        self.end = os.path.getsize(path) if end is None else end
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        return max(self.end - self.start, 0)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return _iter_mapped(self.path, self.start, self.end, self.chunk_size, bytes)
+
+
+class StreamingJSONBody:
+    """JSON com InlineMedia, gerado em pedaços; pode ser iterado mais de uma vez (retentativas)."""
+
+    def __init__(self, data, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        token = uuid.uuid4().hex
+        media: List[_Inline] = []
+
+        def default(obj):
+            if isinstance(obj, _Inline):
+                media.append(obj)
+                return {"mime_type": obj.mime_type, "data": f"{token}-{len(media) - 1}"}
+            raise TypeError(f"Objeto do tipo {type(obj).__name__} não é serializável em JSON")
+
+        # O marcador fica entre as aspas do campo data; o base64 entra no lugar dele
+        pieces = re.split(f"{token}-(\\d+)", json.dumps(data, default=default))
+        self.parts: List[Union[bytes, _Inline]] = []
+        for index, piece in enumerate(pieces):
+            self.parts.append(media[int(piece)] if index % 2 else piece.encode("utf-8"))
+        self.media = media
+
+    def __len__(self) -> int:
+        return sum(len(part) if isinstance(part, bytes) else part.encoded_size for part in self.parts)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from part.iter_base64(self.chunk_size)
+
+
+class AsyncBody:
+    """Corpo em streaming para o httpx.AsyncClient; cada bloco é gerado no executor."""
+
+    __slots__ = ("body",)
+
+    def __init__(self, body: Union[StreamingJSONBody, FileRange]):
+        self.body = body
+
+    def __len__(self) -> int:
+        return len(self.body)
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return _aiter_blocking(iter(self.body))
+
+
+def encode_json(data, asynchronous: bool = False) -> Union[bytes, StreamingJSONBody, AsyncBody]:
+    """Serializa o payload: bytes quando não há InlineMedia/InlineBytes, senão o corpo em streaming."""
+    body = StreamingJSONBody(data)
+    if not body.media:
+        return body.parts[0]
+    return AsyncBody(body) if asynchronous else body
+
+
+def content_length_headers(headers: dict, body: Union[bytes, StreamingJSONBody, AsyncBody]) -> dict:
+    """Cabeçalhos com Content-Length, para o corpo em streaming não sair como chunked."""
+    return {**headers, "Content-Length": str(len(body))}